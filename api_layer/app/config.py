@@ -17,6 +17,100 @@ class Settings(BaseSettings):
     index_pattern: str = Field("cs1_logs-*", description="Elasticsearch index pattern to query")
     default_days: int = Field(7, description="Default number of days to search back if not specified")
 
+    # Search backend
+    search_backend: str = Field("elasticsearch", description="'elasticsearch', or 'local' for the offline on-disk index")
+    local_index_dir: str = Field("local_index", description="Directory of the local index (SEARCH_BACKEND=local)")
+    local_log_root: str = Field(None, description="Log directory the local index is kept up to date with")
+    local_log_glob: str = Field("trainid_*/tests/ws/inference/workdir-inference-*/logmessages.txt",
+                                description="Files under LOCAL_LOG_ROOT to index")
+    local_refresh_seconds: int = Field(30, description="Seconds between incremental local index updates (0 = never)")
+
+    # Index routing (see app/services/routing.py)
+    routing_enabled: bool = Field(True, description="Send queries only to backing indices that can match their time range and IDs")
+    write_alias: str = Field("cs1_logs-write", description="Rollover write alias; its index is always searched")
+    routing_refresh_seconds: int = Field(60, description="Seconds between refreshes of the index -> time range/ID map")
+    routing_max_indices: int = Field(1000, description="Maximum backing indices tracked in the routing map")
+    routing_max_ids: int = Field(10000, description="IDs tracked per index and field; above this the index is searched for any ID")
+
+    # Elasticsearch connection pool
+    es_max_connections: int = Field(50, description="Maximum pooled HTTP connections per Elasticsearch node")
+    es_request_timeout: float = Field(30.0, description="Default per-request timeout (seconds) for Elasticsearch calls")
+    es_max_retries: int = Field(3, description="Number of retries for failed Elasticsearch requests")
+    es_retry_on_timeout: bool = Field(True, description="Retry Elasticsearch requests that time out")
+
+    # Startup and health checks
+    es_warm_connections: int = Field(4, description="Connections opened to Elasticsearch at startup, per worker")
+    readiness_timeout: float = Field(2.0, description="Seconds /health/ready waits for an Elasticsearch ping")
+
+    # Substring search
+    substring_field: str = Field(None, description="Pin the field used for *pattern* queries (default: auto-detect message.wildcard)")
+    substring_field_refresh: int = Field(300, description="Seconds between re-checks of the substring field mapping")
+
+    # Point-in-time paging
+    pit_keep_alive: str = Field("1m", description="Keep-alive for point-in-time contexts between pages")
+    export_page_size: int = Field(5000, description="Documents fetched per page when streaming log exports")
+
+    # Archive downloads (see app/services/archive.py)
+    archive_compress_level: int = Field(6, description="gzip/deflate (1-9) or zstd (1-22) level for archive downloads")
+    archive_max_files: int = Field(10000, description="Maximum trains and tests listed per archive download")
+    archive_spool_bytes: int = Field(16 * 1024 * 1024, description="Bytes of a tar member buffered in memory before spilling to a temporary file")
+
+    # Query governor (see app/services/governor.py)
+    governor_enabled: bool = Field(True, description="Apply timeouts, cost limits and the circuit breaker to API searches")
+    query_timeouts: dict = Field(
+        {"default": 20, "logs": 10, "search": 15, "tail": 5, "batch": 30},
+        description="Elasticsearch `timeout` in seconds per query kind (JSON object); partial results are returned past it"
+    )
+    query_terminate_after: int = Field(500000, description="Per-shard document limit for heavy queries (0 = none)")
+    governor_heavy_cost: float = Field(5.0, description="Estimated cost from which a query counts as heavy")
+    governor_heavy_concurrency: int = Field(2, description="Heavy queries running at once, per worker")
+    governor_queue_seconds: float = Field(10.0, description="Seconds a heavy query waits for a slot before a 503")
+    breaker_latency_seconds: float = Field(5.0, description="Median Elasticsearch latency that opens the circuit breaker")
+    breaker_window: int = Field(20, description="Recent calls the circuit breaker's median is taken over")
+    breaker_cooldown_seconds: int = Field(30, description="Seconds heavy queries are refused once the breaker opens")
+
+    # Stats result cache
+    cache_enabled: bool = Field(True, description="Cache /stats aggregation results")
+    cache_max_entries: int = Field(1024, description="Maximum entries in the in-process LRU cache")
+    cache_ttls: dict = Field(
+        {"files": 60, "trains": 60, "tests": 60, "timeline": 300, "summary": 60, "rollup": 300},
+        description="Per-endpoint TTL in seconds (JSON object); time ranges are aligned to the same bucket size"
+    )
+    cache_backend_url: str = Field(None, description="Optional shared cache backend, e.g. redis://redis:6379/0")
+
+    # Hourly rollup (see ilm/api_rollup_transform.txt)
+    rollup_index: str = Field("cs1_logs_rollup", description="Index written by the hourly rollup transform")
+
+    # Batch pattern lookups
+    batch_chunk_size: int = Field(50, description="Patterns sent per _msearch request by /stats/batch")
+    batch_concurrency: int = Field(4, description="Concurrent _msearch requests per /stats/batch call")
+    batch_max_patterns: int = Field(1000, description="Maximum patterns accepted by one /stats/batch call")
+
+    # Template mining (see app/services/templates.py)
+    templates_db: str = Field("templates.db", description="SQLite file holding mined templates and their watermarks")
+    templates_similarity: float = Field(0.5, description="Share of equal tokens for a line to join an existing template")
+    templates_depth: int = Field(2, description="Leading tokens used to route lines in the template tree")
+    templates_batch_size: int = Field(5000, description="Hits fetched and mined per batch")
+    templates_settle_seconds: int = Field(60, description="Documents newer than this are left for the next mining run")
+
+    # Train/test metadata (see app/services/meta.py)
+    meta_enabled: bool = Field(True, description="Run the background job that keeps /meta/* up to date")
+    meta_db: str = Field("meta.db", description="SQLite file holding per-train and per-test metadata")
+    meta_refresh_seconds: int = Field(60, description="Seconds between metadata updates")
+    meta_lease_seconds: int = Field(300, description="Seconds the worker running the metadata job keeps it without progress before another worker takes over")
+    meta_cache_seconds: float = Field(30.0, description="Seconds a /meta/* answer is cached in process")
+
+    # Live tail (see app/services/tail.py)
+    tail_poll_interval: float = Field(2.0, description="Seconds between polls of a tailed job, shared by all its subscribers")
+    tail_batch_size: int = Field(1000, description="Documents fetched per live tail poll")
+    tail_backlog: int = Field(200, description="Recent lines replayed to new and reconnecting subscribers")
+    tail_overlap_seconds: int = Field(5, description="Window re-read on each poll to catch documents indexed late")
+    tail_queue_size: int = Field(100, description="Batches a subscriber may fall behind before it is disconnected")
+    tail_heartbeat_seconds: float = Field(15.0, description="Idle seconds before a keep-alive comment is sent")
+
+    # Metrics
+    metrics_enabled: bool = Field(True, description="Record request/Elasticsearch metrics and serve them on /metrics")
+
     class Config:
         env_file = ".env"
 
@@ -1,5 +1,8 @@
-from fastapi import FastAPI
-from app.routers import search, stats, logs
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request, Response
+from fastapi.responses import ORJSONResponse
+from app.routers import search, stats, logs, templates, compare, meta as meta_router
+from app.services import elastic, cache, metrics, queries, routing, tail, meta
 from app.config import settings
 import logging
 
@@ -13,25 +16,49 @@ logging.basicConfig(
 )
 logger = logging.getLogger("api_layer.main")
 
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Open the shared Elasticsearch connection pool on startup and close it on shutdown.
+    """
+    logger.info("Starting up Triage API...")
+    await elastic.init_es()
+    cache.init_cache()
+    if await elastic.warm_up():
+        await queries.resolve_substring_field()
+        await routing.refresh()
+    meta.start()
+    logger.info(f"Connected to Elasticsearch at {settings.elasticsearch_url}")
+    app.state.ready = True
+    try:
+        yield
+    finally:
+        app.state.ready = False
+        logger.info("Shutting down Triage API...")
+        await tail.close_all()
+        await meta.stop()
+        await cache.close_cache()
+        await elastic.close_es()
+
+
 app = FastAPI(
     title='Triage API', 
     description="API for querying and analyzing archived logs from Elasticsearch.",
-    version='1.0'
+    version='1.0',
+    default_response_class=ORJSONResponse,
+    lifespan=lifespan
 )
 
+app.add_middleware(metrics.MetricsMiddleware)
+
 
 app.include_router(search.router)
 app.include_router(stats.router)
 app.include_router(logs.router)
-
-
-@app.on_event("startup")
-async def startup_event():
-    """
-    Log application startup and configuration.
-    """
-    logger.info("Starting up Triage API...")
-    logger.info(f"Connected to Elasticsearch at {settings.elasticsearch_url}")
+app.include_router(templates.router)
+app.include_router(compare.router)
+app.include_router(meta_router.router)
 
 
 @app.get('/', summary="Root endpoint")
@@ -47,4 +74,36 @@ async def health():
     """
     Health check endpoint for monitoring tools (e.g., Docker, Kubernetes).
     """
-    return {"status": "ok"}
\ No newline at end of file
+    return {"status": "ok"}
+
+
+@app.get("/health/live", summary="Liveness check")
+async def health_live():
+    """
+    Liveness probe: the worker's event loop is responsive. Does not touch Elasticsearch,
+    so a cluster outage does not get healthy API workers restarted.
+    """
+    return {"status": "ok"}
+
+
+@app.get("/health/ready", summary="Readiness check")
+async def health_ready(request: Request):
+    """
+    Readiness probe: the worker has finished startup and Elasticsearch answers a ping
+    within `READINESS_TIMEOUT` seconds. Returns 503 otherwise, including before startup
+    has completed and once shutdown has begun.
+    """
+    if not getattr(request.app.state, "ready", False):
+        return ORJSONResponse({"status": "starting"}, status_code=503)
+    if not await elastic.ping():
+        return ORJSONResponse({"status": "unavailable", "elasticsearch": "unreachable"}, status_code=503)
+    return {"status": "ok", "elasticsearch": "ok"}
+
+
+@app.get("/metrics", summary="Prometheus metrics", include_in_schema=False)
+async def prometheus_metrics():
+    """
+    Request and Elasticsearch metrics in Prometheus text format (see app.services.metrics).
+    """
+    payload, content_type = metrics.render()
+    return Response(content=payload, media_type=content_type)
@@ -0,0 +1,67 @@
+from fastapi import APIRouter, Depends, Query, HTTPException
+from app.deps import require_api_key
+from app.services.compare import compare_runs
+from app.config import settings
+import logging
+
+# ------------------------------
+# Logging setup
+# ------------------------------
+logger = logging.getLogger("api_layer")
+
+router = APIRouter(prefix="/compare", tags=["compare"])
+
+
+async def _compare(id_field, base_id, target_id, days, min_ratio, min_count, size):
+    try:
+        return await compare_runs(id_field, base_id, target_id, days, min_ratio, min_count, size)
+    except Exception as e:
+        logger.error(f"Error comparing {id_field} {base_id} with {target_id}: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail="Internal Server Error during comparison")
+
+
+@router.get('/train/{base_id}/{target_id}', summary="Diff the logs of two training jobs")
+async def compare_trains(
+    base_id: str,
+    target_id: str,
+    days: int = settings.default_days,
+    min_ratio: float = Query(2.0, gt=1.0, description="Rate change (either direction) reported as `changed`"),
+    min_count: int = Query(5, ge=1, description="Ignore shared templates rarer than this in both runs"),
+    size: int = Query(100, ge=1, description="Maximum templates per category"),
+    api_key: str = Depends(require_api_key)
+):
+    """
+    Compare two training jobs' logs by template, server-side.
+
+    Both logs are streamed in full and normalised (numbers, hex ids, paths, timestamps, ...
+    masked), so runs are compared by line shape rather than by text. Returns templates that are
+    **new** in the target, **missing** from it, or whose share of the log **changed** by at
+    least `min_ratio`. Memory use does not depend on the length of the logs.
+
+    - **base_id**: Reference (known good) training job.
+    - **target_id**: Training job to check.
+    - **days**: Look-back window covering both runs.
+    """
+    logger.info(f"API Request: GET /compare/train/{base_id}/{target_id}")
+    return await _compare("train_id", base_id, target_id, days, min_ratio, min_count, size)
+
+
+@router.get('/test/{base_id}/{target_id}', summary="Diff the logs of two tests")
+async def compare_tests(
+    base_id: str,
+    target_id: str,
+    days: int = settings.default_days,
+    min_ratio: float = Query(2.0, gt=1.0, description="Rate change (either direction) reported as `changed`"),
+    min_count: int = Query(5, ge=1, description="Ignore shared templates rarer than this in both runs"),
+    size: int = Query(100, ge=1, description="Maximum templates per category"),
+    api_key: str = Depends(require_api_key)
+):
+    """
+    Compare two tests' logs by template, server-side. See `/compare/train/{base_id}/{target_id}`.
+
+    - **base_id**: Reference (known good) test.
+    - **target_id**: Test to check.
+    - **days**: Look-back window covering both runs.
+    """
+    logger.info(f"API Request: GET /compare/test/{base_id}/{target_id}")
+    return await _compare("test_id", base_id, target_id, days, min_ratio, min_count, size)
@@ -1,20 +1,21 @@
-from fastapi import APIRouter, Depends, HTTPException
-from app.services.elastic import search
+from fastapi import APIRouter, Depends, Header, HTTPException, Query
+from fastapi.responses import ORJSONResponse, StreamingResponse
+from app.services.elastic import scan_sorted
+from app.services.governor import QueryRejected, is_partial
+from app.services.pagination import search_page, InvalidCursor
+from app.services.routing import route
+from app.services.shaping import OutputFormat, parse_fields, project, shape_hits
+from app.services.archive import ArchiveFormat, MEDIA_TYPES, list_files, stream_archive, zstandard
+from app.services import tail
 from app.config import settings
 from app.deps import require_api_key
 import logging
+import orjson
 
 # ------------------------------
 # Logging setup
 # ------------------------------
 logger = logging.getLogger("api_layer")
-logger.setLevel(logging.INFO)
-handler = logging.StreamHandler()
-handler.setLevel(logging.INFO)
-formatter = logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s")
-handler.setFormatter(formatter)
-logger.addHandler(handler)
-logger.propagate = True
 
 # ------------------------------
 # Router
@@ -51,7 +52,8 @@ def build_message_clause(pattern):
 # ------------------------------
 # Generic function to fetch logs
 # ------------------------------
-def fetch_logs(id_field, id_value, pattern=None, days=30, size=100):
+async def fetch_logs(id_field, id_value, pattern=None, days=30, size=100, cursor=None,
+                     fields=None, fmt=OutputFormat.rows):
     """
     Executes the search against Elasticsearch.
     
@@ -61,6 +63,13 @@ def fetch_logs(id_field, id_value, pattern=None, days=30, size=100):
         pattern: Optional text pattern to search in the message.
         days: Number of days to look back.
         size: Max number of logs to return.
+        cursor: Optional token from a previous page's `X-Next-Cursor` header.
+        fields: Optional list of `_source` fields to return.
+        fmt: `rows` for a list of documents, `columns` for parallel arrays per field.
+
+    Returns:
+        ORJSONResponse: The logs, with an `X-Next-Cursor` header when more logs remain and
+        `X-Partial-Results: true` when Elasticsearch returned partial results.
     """
     logger.info(f"Fetching logs for {id_field}={id_value}, pattern='{pattern}', days={days}, size={size}")
     
@@ -70,18 +79,165 @@ def fetch_logs(id_field, id_value, pattern=None, days=30, size=100):
         must.append(build_message_clause(pattern))
 
     body = make_query(must, days)
+    fields = project(body, fields, fmt)
     logger.debug(f"Elasticsearch query body: {body}")
 
     try:
-        res = search(settings.index_pattern, body, size=size)
+        res, next_cursor = await search_page(await route(days, **{id_field: id_value}), body, size, cursor,
+                                             kind="logs")
+    except InvalidCursor as e:
+        logger.warning(f"Rejected cursor for {id_field}={id_value}: {e}")
+        raise HTTPException(status_code=400, detail=str(e))
+    except QueryRejected as e:
+        raise e.http_exception()
     except Exception as e:
         logger.error(f"Error querying Elasticsearch for {id_field}={id_value}: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail="Internal Server Error during log retrieval")
 
     hits_count = res.get('hits', {}).get('total', {}).get('value', 0)
     logger.info(f"Found {hits_count} logs for {id_field}={id_value}")
-    
-    return [hit["_source"] for hit in res.get("hits", {}).get("hits", [])]
+
+    # Returned as a response so hits skip jsonable_encoder and go straight to orjson.
+    headers = {"X-Next-Cursor": next_cursor} if next_cursor else {}
+    if is_partial(res):
+        # Elasticsearch stopped at a governor limit or lost shards; the page may be incomplete.
+        headers["X-Partial-Results"] = "true"
+    return ORJSONResponse(shape_hits(res.get("hits", {}).get("hits", []), fmt, fields), headers=headers)
+
+# ------------------------------
+# Generic function to stream a full log
+# ------------------------------
+async def export_logs(id_field, id_value, pattern=None, days=30, fields=None):
+    """
+    Streams every matching log line as NDJSON, in timestamp order.
+
+    Pages are read with PIT + search_after, so memory use does not depend on the
+    size of the log and the first lines are sent before the whole log is fetched.
+    """
+    logger.info(f"Exporting logs for {id_field}={id_value}, pattern='{pattern}', days={days}")
+
+    must = [{"term": {f"{id_field}.keyword": id_value}}]
+
+    if pattern:
+        must.append(build_message_clause(pattern))
+
+    body = make_query(must, days)
+    project(body, fields)
+    hits = scan_sorted(await route(days, **{id_field: id_value}), body)
+
+    # Fetch the first page before responding so connection errors still map to a 500.
+    try:
+        first = await hits.__anext__()
+    except StopAsyncIteration:
+        first = None
+    except Exception as e:
+        logger.error(f"Error exporting logs for {id_field}={id_value}: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail="Internal Server Error during log export")
+
+    async def ndjson():
+        if first is None:
+            return
+        count = 1
+        yield orjson.dumps(first["_source"]) + b"\n"
+        try:
+            async for hit in hits:
+                count += 1
+                yield orjson.dumps(hit["_source"]) + b"\n"
+        except Exception as e:
+            # Headers are already sent; the truncated stream is the only signal left.
+            logger.error(f"Log export for {id_field}={id_value} aborted after {count} lines: {e}", exc_info=True)
+            raise
+        finally:
+            await hits.aclose()
+        logger.info(f"Exported {count} logs for {id_field}={id_value}")
+
+    return StreamingResponse(ndjson(), media_type="application/x-ndjson")
+
+# ------------------------------
+# Generic function to download a run's original log files
+# ------------------------------
+async def archive_logs(id_field, id_value, days=30, fmt=ArchiveFormat.zip):
+    """
+    Streams every log file of a train or test, rebuilt in its original line format, as a
+    compressed archive.
+
+    Files are read with PIT + search_after and compressed in a worker thread (see
+    app.services.archive), so memory use does not depend on the size of the run.
+    """
+    logger.info(f"Archiving logs for {id_field}={id_value}, days={days}, format={fmt.value}")
+
+    if fmt == ArchiveFormat.tar_zst and zstandard is None:
+        raise HTTPException(status_code=400, detail="format=tar.zst requires the 'zstandard' package on the server")
+
+    # List the files before responding so connection errors still map to a 500.
+    try:
+        index = await route(days, **{id_field: id_value})
+        files = await list_files(index, id_field, id_value, days)
+    except Exception as e:
+        logger.error(f"Error archiving logs for {id_field}={id_value}: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail="Internal Server Error during log archive")
+    if not files:
+        raise HTTPException(status_code=404, detail=f"No logs found for {id_field}={id_value}")
+
+    async def chunks():
+        size = 0
+        try:
+            async for chunk in stream_archive(index, files, days, fmt):
+                size += len(chunk)
+                yield chunk
+        except Exception as e:
+            # Headers are already sent; the truncated archive is the only signal left.
+            logger.error(f"Log archive for {id_field}={id_value} aborted after {size} bytes: {e}", exc_info=True)
+            raise
+        logger.info(f"Archived {len(files)} files ({size} bytes) for {id_field}={id_value}")
+
+    filename = f"{id_field.split('_')[0]}_{id_value}.{fmt.value}"
+    headers = {"Content-Disposition": f'attachment; filename="{filename}"'}
+    return StreamingResponse(chunks(), media_type=MEDIA_TYPES[fmt], headers=headers)
+
+# ------------------------------
+# Generic function to tail a running job
+# ------------------------------
+async def tail_logs(id_field, id_value, pattern=None, days=30, last_event_id=None):
+    """
+    Streams new log lines of a job as Server-Sent Events while it runs.
+
+    Subscribers of the same job share one poller (see app.services.tail), so Elasticsearch
+    load does not grow with the number of viewers. Each line is sent as a `log` event whose
+    id is the document `_id`; EventSource clients resume with `Last-Event-ID` after a drop.
+    A client that reads too slowly gets an `overflow` event and is disconnected.
+    """
+    logger.info(f"Tailing logs for {id_field}={id_value}, pattern='{pattern}', days={days}")
+
+    try:
+        sub, replay = await tail.subscribe(id_field, id_value, pattern, days, last_event_id)
+    except Exception as e:
+        logger.error(f"Error starting live tail for {id_field}={id_value}: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail="Internal Server Error during live tail")
+
+    def events(hits):
+        return b"".join(
+            b"id: " + hit["_id"].encode() + b"\nevent: log\ndata: " + orjson.dumps(hit["_source"]) + b"\n\n"
+            for hit in hits
+        )
+
+    async def stream():
+        try:
+            # Tells EventSource how long to wait before reconnecting.
+            yield f"retry: {int(settings.tail_poll_interval * 1000)}\n\n".encode()
+            if replay:
+                yield events(replay)
+            while True:
+                hits = await sub.get(settings.tail_heartbeat_seconds)
+                # Comment lines keep proxies from closing an idle stream.
+                yield events(hits) if hits else b": keep-alive\n\n"
+        except tail.Overflow:
+            yield b"event: overflow\ndata: {}\n\n"
+        finally:
+            sub.close()
+
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    return StreamingResponse(stream(), media_type="text/event-stream", headers=headers)
 
 # ------------------------------
 # /logs/train/{train_id}
@@ -91,7 +247,10 @@ async def logs_for_train(
     train_id: str,
     pattern: str = None,
     days: int = settings.default_days,
-    size: int = 100,
+    size: int = Query(100, ge=1, description="Page size"),
+    cursor: str = None,
+    fields: str = Query(None, description="Comma-separated `_source` fields to return, e.g. `@timestamp,message`"),
+    format: OutputFormat = Query(OutputFormat.rows, description="`columns` returns one array per field instead of a list of documents"),
     api_key: str = Depends(require_api_key)
 ):
     """
@@ -101,9 +260,80 @@ async def logs_for_train(
     - **pattern**: Optional keyword or phrase to filter log messages (case-insensitive).
     - **days**: Number of days in the past to search (default: configured default).
     - **size**: Maximum number of log entries to return (default: 100).
+    - **cursor**: Token from the `X-Next-Cursor` response header of the previous page.
+      The header is only set while more logs remain.
+    - **fields**: Optional comma-separated list of fields to return (default: all).
+    - **format**: `rows` (default) or `columns` for `{field: [values...]}` arrays.
     """
     logger.info(f"API Request: GET /logs/train/{train_id}")
-    return fetch_logs("train_id", train_id, pattern, days, size)
+    return await fetch_logs("train_id", train_id, pattern, days, size, cursor, parse_fields(fields), format)
+
+# ------------------------------
+# /logs/train/{train_id}/export
+# ------------------------------
+@router.get("/train/{train_id}/export", summary="Stream the full log of a Train ID")
+async def export_train(
+    train_id: str,
+    pattern: str = None,
+    days: int = settings.default_days,
+    fields: str = Query(None, description="Comma-separated `_source` fields to return, e.g. `@timestamp,message`"),
+    api_key: str = Depends(require_api_key)
+):
+    """
+    Stream every log line of a training job as NDJSON (one JSON document per line),
+    in timestamp order. There is no size limit.
+
+    - **train_id**: The unique identifier for the training job.
+    - **pattern**: Optional keyword or phrase to filter log messages.
+    - **days**: Number of days in the past to search.
+    - **fields**: Optional comma-separated list of fields to return (default: all).
+    """
+    logger.info(f"API Request: GET /logs/train/{train_id}/export")
+    return await export_logs("train_id", train_id, pattern, days, parse_fields(fields))
+
+# ------------------------------
+# /logs/train/{train_id}/archive
+# ------------------------------
+@router.get("/train/{train_id}/archive", summary="Download the original log files of a Train ID")
+async def archive_train(
+    train_id: str,
+    days: int = settings.default_days,
+    format: ArchiveFormat = Query(ArchiveFormat.zip, description="`zip`, `tar.gz` or `tar.zst`"),
+    api_key: str = Depends(require_api_key)
+):
+    """
+    Download every log file of a training job as a compressed archive. Each file is rebuilt
+    in its original `timestamp LEVEL [source] message` line format, in timestamp order.
+    There is no size limit.
+
+    - **train_id**: The unique identifier for the training job.
+    - **days**: Number of days in the past to search.
+    - **format**: `zip` (default), `tar.gz` or `tar.zst`.
+    """
+    logger.info(f"API Request: GET /logs/train/{train_id}/archive")
+    return await archive_logs("train_id", train_id, days, format)
+
+# ------------------------------
+# /logs/train/{train_id}/tail
+# ------------------------------
+@router.get("/train/{train_id}/tail", summary="Live tail of a running training job (SSE)")
+async def tail_train(
+    train_id: str,
+    pattern: str = None,
+    days: int = settings.default_days,
+    last_event_id: str = Header(None),
+    api_key: str = Depends(require_api_key)
+):
+    """
+    Stream new log lines of a training job as Server-Sent Events while it runs.
+    The most recent lines are sent first, then each new line as it is indexed.
+
+    - **train_id**: The unique identifier for the training job.
+    - **pattern**: Optional keyword or phrase to filter log messages.
+    - **days**: Number of days in the past to search.
+    """
+    logger.info(f"API Request: GET /logs/train/{train_id}/tail")
+    return await tail_logs("train_id", train_id, pattern, days, last_event_id)
 
 # ------------------------------
 # /logs/test/{test_id}
@@ -113,7 +343,10 @@ async def logs_for_test(
     test_id: str,
     pattern: str = None,
     days: int = settings.default_days,
-    size: int = 100,
+    size: int = Query(100, ge=1, description="Page size"),
+    cursor: str = None,
+    fields: str = Query(None, description="Comma-separated `_source` fields to return, e.g. `@timestamp,message`"),
+    format: OutputFormat = Query(OutputFormat.rows, description="`columns` returns one array per field instead of a list of documents"),
     api_key: str = Depends(require_api_key)
 ):
     """
@@ -123,9 +356,79 @@ async def logs_for_test(
     - **pattern**: Optional keyword or phrase to filter log messages.
     - **days**: Number of days in the past to search.
     - **size**: Maximum number of log entries to return.
+    - **cursor**: Token from the `X-Next-Cursor` response header of the previous page.
+    - **fields**: Optional comma-separated list of fields to return (default: all).
+    - **format**: `rows` (default) or `columns` for `{field: [values...]}` arrays.
     """
     logger.info(f"API Request: GET /logs/test/{test_id}")
-    return fetch_logs("test_id", test_id, pattern, days, size)
+    return await fetch_logs("test_id", test_id, pattern, days, size, cursor, parse_fields(fields), format)
+
+# ------------------------------
+# /logs/test/{test_id}/export
+# ------------------------------
+@router.get("/test/{test_id}/export", summary="Stream the full log of a Test ID")
+async def export_test(
+    test_id: str,
+    pattern: str = None,
+    days: int = settings.default_days,
+    fields: str = Query(None, description="Comma-separated `_source` fields to return, e.g. `@timestamp,message`"),
+    api_key: str = Depends(require_api_key)
+):
+    """
+    Stream every log line of a test job as NDJSON (one JSON document per line),
+    in timestamp order. There is no size limit.
+
+    - **test_id**: The unique identifier for the test job.
+    - **pattern**: Optional keyword or phrase to filter log messages.
+    - **days**: Number of days in the past to search.
+    - **fields**: Optional comma-separated list of fields to return (default: all).
+    """
+    logger.info(f"API Request: GET /logs/test/{test_id}/export")
+    return await export_logs("test_id", test_id, pattern, days, parse_fields(fields))
+
+# ------------------------------
+# /logs/test/{test_id}/archive
+# ------------------------------
+@router.get("/test/{test_id}/archive", summary="Download the original log files of a Test ID")
+async def archive_test(
+    test_id: str,
+    days: int = settings.default_days,
+    format: ArchiveFormat = Query(ArchiveFormat.zip, description="`zip`, `tar.gz` or `tar.zst`"),
+    api_key: str = Depends(require_api_key)
+):
+    """
+    Download every log file of a test as a compressed archive. Each file is rebuilt
+    in its original `timestamp LEVEL [source] message` line format, in timestamp order.
+    There is no size limit.
+
+    - **test_id**: The unique identifier for the test.
+    - **days**: Number of days in the past to search.
+    - **format**: `zip` (default), `tar.gz` or `tar.zst`.
+    """
+    logger.info(f"API Request: GET /logs/test/{test_id}/archive")
+    return await archive_logs("test_id", test_id, days, format)
+
+# ------------------------------
+# /logs/test/{test_id}/tail
+# ------------------------------
+@router.get("/test/{test_id}/tail", summary="Live tail of a running test (SSE)")
+async def tail_test(
+    test_id: str,
+    pattern: str = None,
+    days: int = settings.default_days,
+    last_event_id: str = Header(None),
+    api_key: str = Depends(require_api_key)
+):
+    """
+    Stream new log lines of a test as Server-Sent Events while it runs.
+    The most recent lines are sent first, then each new line as it is indexed.
+
+    - **test_id**: The unique identifier for the test job.
+    - **pattern**: Optional keyword or phrase to filter log messages.
+    - **days**: Number of days in the past to search.
+    """
+    logger.info(f"API Request: GET /logs/test/{test_id}/tail")
+    return await tail_logs("test_id", test_id, pattern, days, last_event_id)
 
 # ------------------------------
 # /logs/file/{file_name}
@@ -135,7 +438,10 @@ async def logs_for_file(
     file_name: str,
     pattern: str = None,
     days: int = settings.default_days,
-    size: int = 100,
+    size: int = Query(100, ge=1, description="Page size"),
+    cursor: str = None,
+    fields: str = Query(None, description="Comma-separated `_source` fields to return, e.g. `@timestamp,message`"),
+    format: OutputFormat = Query(OutputFormat.rows, description="`columns` returns one array per field instead of a list of documents"),
     api_key: str = Depends(require_api_key)
 ):
     """
@@ -145,6 +451,9 @@ async def logs_for_file(
     - **pattern**: Optional keyword or phrase to filter log messages.
     - **days**: Number of days in the past to search.
     - **size**: Maximum number of log entries to return.
+    - **cursor**: Token from the `X-Next-Cursor` response header of the previous page.
+    - **fields**: Optional comma-separated list of fields to return (default: all).
+    - **format**: `rows` (default) or `columns` for `{field: [values...]}` arrays.
     """
     logger.info(f"API Request: GET /logs/file/{file_name}")
-    return fetch_logs("file_name", file_name, pattern, days, size)
+    return await fetch_logs("file_name", file_name, pattern, days, size, cursor, parse_fields(fields), format)
@@ -0,0 +1,54 @@
+from fastapi import APIRouter, Depends, HTTPException
+from app.deps import require_api_key
+from app.services import meta
+import logging
+
+# ------------------------------
+# Logging setup
+# ------------------------------
+logger = logging.getLogger("api_layer")
+
+router = APIRouter(prefix="/meta", tags=["meta"])
+
+
+async def _lookup(kind, id_value):
+    try:
+        result = await meta.lookup(kind, id_value)
+    except Exception as e:
+        logger.error(f"Error reading metadata for {kind}_id={id_value}: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail="Internal Server Error during metadata lookup")
+    if result is None:
+        raise HTTPException(status_code=404, detail=f"No metadata for {kind}_id={id_value}")
+    return result
+
+
+@router.get('/train/{train_id}', summary="Tests, time range and level counts of a training job")
+async def meta_train(train_id: str, api_key: str = Depends(require_api_key)):
+    """
+    Summary of a training job from the metadata store: its tests and files, first and last
+    `@timestamp`, line total and per-`log_level` counts. Answered with one key lookup, without
+    touching the raw logs.
+
+    `updated_at` is when the background job last finished a run; documents indexed since then
+    are not counted yet.
+    """
+    logger.info(f"API Request: GET /meta/train/{train_id}")
+    return await _lookup("train", train_id)
+
+
+@router.get('/test/{test_id}', summary="Train, time range and level counts of a test")
+async def meta_test(test_id: str, api_key: str = Depends(require_api_key)):
+    """
+    Summary of a test from the metadata store: its training job and files, first and last
+    `@timestamp`, line total and per-`log_level` counts.
+    """
+    logger.info(f"API Request: GET /meta/test/{test_id}")
+    return await _lookup("test", test_id)
+
+
+@router.get('', summary="State of the metadata store")
+async def meta_state(api_key: str = Depends(require_api_key)):
+    """
+    Which worker runs the background job, when it last finished, and how many trains and tests are known.
+    """
+    return await meta.describe()
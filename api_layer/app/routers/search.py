@@ -1,6 +1,11 @@
 from fastapi import APIRouter, Depends, Query, HTTPException
+from fastapi.responses import ORJSONResponse
 from app.deps import require_api_key
-from app.services.elastic import search
+from app.services.governor import QueryRejected, is_partial
+from app.services.pagination import search_page, InvalidCursor
+from app.services.queries import substring_clause
+from app.services.routing import route
+from app.services.shaping import OutputFormat, parse_fields, project, shape_hits
 from app.config import settings
 import logging
 
@@ -15,40 +20,54 @@ router = APIRouter(prefix="/search", tags=["search"])
 async def search_errors(
     pattern: str = Query(..., description='Substring or token to search (e.g., "Error", "Exception")'),
     days: int = settings.default_days,
-    size: int = 100,
+    size: int = Query(100, ge=1, description="Page size"),
+    cursor: str = Query(None, description="Token from `next_cursor` of the previous page"),
+    fields: str = Query(None, description="Comma-separated `_source` fields to return, e.g. `@timestamp,message`"),
+    format: OutputFormat = Query(OutputFormat.rows, description="`columns` returns one array per field instead of a list of documents"),
     api_key: str = Depends(require_api_key)
 ):
     """
     Search for logs containing a specific error pattern using a wildcard query.
     
-    This endpoint uses a wildcard query on the `message.keyword` field, which is useful for 
-    finding exact substring matches that might be part of a larger token.
+    This endpoint uses a wildcard query on the `message.wildcard` substring field (falling back to
+    `message.keyword` on indices created before it existed), which is useful for finding exact
+    substring matches that might be part of a larger token.
     
     - **pattern**: The text pattern to search for (e.g., "NullPointer").
     - **days**: Number of days in the past to search.
     - **size**: Maximum number of results to return.
+    - **cursor**: `next_cursor` from the previous page; `null` once the last page is reached.
+    - **fields**: Optional comma-separated list of fields to return (default: all).
+    - **format**: `rows` (default) or `columns`, where `results` is `{field: [values...]}`.
     """
     logger.info(f"API Request: GET /search/errors?pattern={pattern}&days={days}&size={size}")
 
     body = {
         "query": {
             "bool": {
-                "must": [{"wildcard": {"message.keyword": f"*{pattern}*"}}],
+                "must": [await substring_clause(pattern)],
                 "filter": [{"range": {"@timestamp": {"gte": f"now-{days}d"}}}]
             }
         },
         # "size": size,  <-- REMOVED: Passed as kwarg to search()
         "sort": [{"@timestamp": {"order": "desc"}}]
     }
+    columns = project(body, parse_fields(fields), format)
 
     try:
-        res = search(settings.index_pattern, body, size=size)
-        hits = [h["_source"] for h in res.get("hits", {}).get("hits", [])]
+        res, next_cursor = await search_page(await route(days), body, size, cursor, kind="search")
+        hits = shape_hits(res.get("hits", {}).get("hits", []), format, columns)
         total = res.get("hits", {}).get("total", {}).get("value", 0)
         
         logger.info(f"Found {total} error logs matching pattern '{pattern}'")
-        return {"total": total, "results": hits}
+        return ORJSONResponse({"total": total, "results": hits, "next_cursor": next_cursor,
+                               "partial": is_partial(res)})
         
+    except InvalidCursor as e:
+        logger.warning(f"Rejected cursor for search_errors: {e}")
+        raise HTTPException(status_code=400, detail=str(e))
+    except QueryRejected as e:
+        raise e.http_exception()
     except Exception as e:
         logger.error(f"Error executing search_errors with pattern='{pattern}': {e}", exc_info=True)
         raise HTTPException(status_code=500, detail="Internal Server Error during search")
@@ -58,7 +77,10 @@ async def search_errors(
 async def search_pattern(
     pattern: str = Query(..., description='Lucene query string or simple text'),
     days: int = settings.default_days,
-    size: int = 100,
+    size: int = Query(100, ge=1, description="Page size"),
+    cursor: str = Query(None, description="Token from `next_cursor` of the previous page"),
+    fields: str = Query(None, description="Comma-separated `_source` fields to return, e.g. `@timestamp,message`"),
+    format: OutputFormat = Query(OutputFormat.rows, description="`columns` returns one array per field instead of a list of documents"),
     api_key: str = Depends(require_api_key)
 ):
     """
@@ -71,6 +93,9 @@ async def search_pattern(
     - **pattern**: The search query (e.g., "error", "failed AND critical").
     - **days**: Number of days in the past to search.
     - **size**: Maximum number of results to return.
+    - **cursor**: `next_cursor` from the previous page; `null` once the last page is reached.
+    - **fields**: Optional comma-separated list of fields to return (default: all).
+    - **format**: `rows` (default) or `columns`, where `results` is `{field: [values...]}`.
     """
     logger.info(f"API Request: GET /search/pattern?pattern={pattern}&days={days}&size={size}")
 
@@ -84,15 +109,22 @@ async def search_pattern(
         # "size": size, <-- REMOVED: Passed as kwarg to search()
         "sort": [{"@timestamp": {"order": "desc"}}]
     }
+    columns = project(body, parse_fields(fields), format)
 
     try:
-        res = search(settings.index_pattern, body, size=size)
-        hits = [h["_source"] for h in res.get("hits", {}).get("hits", [])]
+        res, next_cursor = await search_page(await route(days), body, size, cursor, kind="search")
+        hits = shape_hits(res.get("hits", {}).get("hits", []), format, columns)
         total = res.get("hits", {}).get("total", {}).get("value", 0)
 
         logger.info(f"Found {total} logs matching pattern '{pattern}'")
-        return {"total": total, "results": hits}
+        return ORJSONResponse({"total": total, "results": hits, "next_cursor": next_cursor,
+                               "partial": is_partial(res)})
 
+    except InvalidCursor as e:
+        logger.warning(f"Rejected cursor for search_pattern: {e}")
+        raise HTTPException(status_code=400, detail=str(e))
+    except QueryRejected as e:
+        raise e.http_exception()
     except Exception as e:
         logger.error(f"Error executing search_pattern with pattern='{pattern}': {e}", exc_info=True)
         raise HTTPException(status_code=500, detail="Internal Server Error during search")
\ No newline at end of file
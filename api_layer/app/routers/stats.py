@@ -1,25 +1,40 @@
+from enum import Enum
+from typing import List, Optional
 from fastapi import APIRouter, Depends, Query, HTTPException
+from pydantic import BaseModel, Field
 from app.deps import require_api_key
-from app.services.elastic import agg_search
+from app.services.cache import cached_agg_search, cache_ttl, get_cache_stats
+from app.services.elastic import msearch
+from app.services.governor import QueryRejected, is_partial
+from app.services.queries import substring_clause, time_range_filter
+from app.services.rollup import rollup_timeline, rollup_counts
+from app.services.routing import route, describe
+from app.services import governor
 from app.config import settings
+import asyncio
 import logging
 
 # ------------------------------
 # Logging setup
 # ------------------------------
 logger = logging.getLogger("api_layer")
-# Ensure handlers are set up if not already configured globally
-if not logger.handlers:
-    handler = logging.StreamHandler()
-    handler.setLevel(logging.INFO)
-    formatter = logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s")
-    handler.setFormatter(formatter)
-    logger.addHandler(handler)
-    logger.propagate = True
 
 router = APIRouter(prefix="/stats", tags=["stats"])
 
 
+class GroupBy(str, Enum):
+    train_id = "train_id"
+    test_id = "test_id"
+    file_name = "file_name"
+
+
+class Interval(str, Enum):
+    hour = "hour"
+    day = "day"
+    week = "week"
+    month = "month"
+
+
 @router.get('/files', summary="Get files containing pattern")
 async def files_with_pattern(
     pattern: str = Query(..., description="Pattern to search for (wildcard)"),
@@ -40,18 +55,20 @@ async def files_with_pattern(
         "size": 0,
         "query": {
             "bool": {
-                "must": [{"wildcard": {"message.keyword": f"*{pattern}*"}}],
-                "filter": [{"range": {"@timestamp": {"gte": f"now-{days}d"}}}]
+                "must": [await substring_clause(pattern)],
+                "filter": [time_range_filter(days, cache_ttl("files"))]
             }
         },
         "aggs": {"files": {"terms": {"field": "file_name.keyword", "size": size}}}
     }
 
     try:
-        res = agg_search(settings.index_pattern, body)
+        res = await cached_agg_search("files", await route(days), body)
         buckets = res.get('aggregations', {}).get('files', {}).get('buckets', [])
         logger.info(f"Found {len(buckets)} files matching pattern '{pattern}'")
-        return {"files": buckets}
+        return {"files": buckets, "partial": is_partial(res)}
+    except QueryRejected as e:
+        raise e.http_exception()
     except Exception as e:
         logger.error(f"Error in files_with_pattern: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail="Internal Server Error")
@@ -77,18 +94,20 @@ async def trains_with_pattern(
         "size": 0,
         "query": {
             "bool": {
-                "must": [{"wildcard": {"message.keyword": f"*{pattern}*"}}],
-                "filter": [{"range": {"@timestamp": {"gte": f"now-{days}d"}}}]
+                "must": [await substring_clause(pattern)],
+                "filter": [time_range_filter(days, cache_ttl("trains"))]
             }
         },
         "aggs": {"trains": {"terms": {"field": "train_id.keyword", "size": size}}}
     }
 
     try:
-        res = agg_search(settings.index_pattern, body)
+        res = await cached_agg_search("trains", await route(days), body)
         buckets = res.get('aggregations', {}).get('trains', {}).get('buckets', [])
         logger.info(f"Found {len(buckets)} trains matching pattern '{pattern}'")
-        return {"trains": buckets}
+        return {"trains": buckets, "partial": is_partial(res)}
+    except QueryRejected as e:
+        raise e.http_exception()
     except Exception as e:
         logger.error(f"Error in trains_with_pattern: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail="Internal Server Error")
@@ -114,18 +133,20 @@ async def tests_with_pattern(
         "size": 0,
         "query": {
             "bool": {
-                "must": [{"wildcard": {"message.keyword": f"*{pattern}*"}}],
-                "filter": [{"range": {"@timestamp": {"gte": f"now-{days}d"}}}]
+                "must": [await substring_clause(pattern)],
+                "filter": [time_range_filter(days, cache_ttl("tests"))]
             }
         },
         "aggs": {"tests": {"terms": {"field": "test_id.keyword", "size": size}}}
     }
 
     try:
-        res = agg_search(settings.index_pattern, body)
+        res = await cached_agg_search("tests", await route(days), body)
         buckets = res.get('aggregations', {}).get('tests', {}).get('buckets', [])
         logger.info(f"Found {len(buckets)} tests matching pattern '{pattern}'")
-        return {"tests": buckets}
+        return {"tests": buckets, "partial": is_partial(res)}
+    except QueryRejected as e:
+        raise e.http_exception()
     except Exception as e:
         logger.error(f"Error in tests_with_pattern: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail="Internal Server Error")
@@ -133,34 +154,253 @@ async def tests_with_pattern(
 
 @router.get('/errors/timeline', summary="Get error frequency over time")
 async def errors_timeline(
-    pattern: str = Query(..., description="Pattern to search for (wildcard)"),
+    pattern: str = Query(None, description="Pattern to search for (wildcard). Omit to count by log level from the rollup index"),
     days: int = 30,
+    log_level: str = Query("ERROR", description="Log level to count when no pattern is given"),
+    interval: Interval = Interval.day,
     api_key: str = Depends(require_api_key)
 ):
     """
     Get a histogram of how often a pattern appears over time.
+
+    With a **pattern**, raw log documents are scanned (limited to the raw retention window).
+    Without one, counts for **log_level** come from the precomputed hourly rollup index, which
+    answers in milliseconds and covers history older than the raw logs.
     
     - **pattern**: The text pattern to search for.
     - **days**: Number of days in the past to search.
+    - **log_level**: Level to count when no pattern is given (default: ERROR).
+    - **interval**: Bucket size: hour, day (default), week or month.
     """
-    logger.info(f"API Request: GET /stats/errors/timeline?pattern={pattern}&days={days}")
+    logger.info(f"API Request: GET /stats/errors/timeline?pattern={pattern}&days={days}&log_level={log_level}&interval={interval.value}")
+
+    if not pattern:
+        try:
+            aggs = await rollup_timeline(days, interval.value, log_level=log_level)
+            logger.info(f"Retrieved rollup timeline for log_level '{log_level}'")
+            return aggs
+        except QueryRejected as e:
+            raise e.http_exception()
+        except Exception as e:
+            logger.error(f"Error in errors_timeline (rollup): {e}", exc_info=True)
+            raise HTTPException(status_code=500, detail="Internal Server Error")
 
     body = {
         "size": 0,
         "query": {
             "bool": {
-                "must": [{"wildcard": {"message.keyword": f"*{pattern}*"}}],
-                "filter": [{"range": {"@timestamp": {"gte": f"now-{days}d"}}}]
+                "must": [await substring_clause(pattern)],
+                "filter": [time_range_filter(days, cache_ttl("timeline"))]
             }
         },
-        "aggs": {"errors_over_time": {"date_histogram": {"field": "@timestamp", "calendar_interval": "day"}}}
+        "aggs": {"errors_over_time": {"date_histogram": {"field": "@timestamp", "calendar_interval": interval.value}}}
     }
 
     try:
-        res = agg_search(settings.index_pattern, body)
+        res = await cached_agg_search("timeline", await route(days), body)
         aggs = res.get('aggregations', {})
         logger.info(f"Retrieved timeline stats for pattern '{pattern}'")
-        return aggs
+        return dict(aggs, partial=is_partial(res))
+    except QueryRejected as e:
+        raise e.http_exception()
     except Exception as e:
         logger.error(f"Error in errors_timeline: {e}", exc_info=True)
-        raise HTTPException(status_code=500, detail="Internal Server Error")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail="Internal Server Error")
+
+
+@router.get('/counts', summary="Log line counts per train, test or file")
+async def line_counts(
+    group_by: GroupBy = GroupBy.train_id,
+    days: int = 30,
+    log_level: str = Query(None, description="Only count lines of this level (e.g. ERROR)"),
+    train_id: str = None,
+    test_id: str = None,
+    size: int = 100,
+    api_key: str = Depends(require_api_key)
+):
+    """
+    Count log lines per training job, test job or file, answered from the hourly rollup index.
+
+    - **group_by**: `train_id` (default), `test_id` or `file_name`.
+    - **days**: Number of days in the past to count (may exceed the raw log retention).
+    - **log_level**: Optional level filter.
+    - **train_id** / **test_id**: Optional filters, e.g. per-test counts within one train.
+    - **size**: Maximum number of buckets to return.
+    """
+    logger.info(f"API Request: GET /stats/counts?group_by={group_by.value}&days={days}&log_level={log_level}")
+
+    try:
+        buckets, partial = await rollup_counts(group_by.value, days, size, log_level=log_level,
+                                               train_id=train_id, test_id=test_id)
+        logger.info(f"Found {len(buckets)} {group_by.value} buckets in rollup")
+        return {"group_by": group_by.value, "counts": buckets, "partial": partial}
+    except QueryRejected as e:
+        raise e.http_exception()
+    except Exception as e:
+        logger.error(f"Error in line_counts: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail="Internal Server Error")
+
+
+@router.get('/summary', summary="Files, trains, tests and timeline for a pattern in one query")
+async def pattern_summary(
+    pattern: str = Query(..., description="Pattern to search for (wildcard)"),
+    days: int = settings.default_days,
+    files_size: int = 100,
+    trains_size: int = 1000,
+    tests_size: int = 500,
+    api_key: str = Depends(require_api_key)
+):
+    """
+    Triage a pattern in a single request: the files, training jobs and test jobs that contain it,
+    plus its daily frequency. The wildcard query is evaluated once and all four aggregations are
+    computed from the same matching documents.
+
+    - **pattern**: The text pattern to search for.
+    - **days**: Number of days in the past to search (applies to all four results).
+    - **files_size** / **trains_size** / **tests_size**: Maximum buckets returned per breakdown.
+    """
+    logger.info(f"API Request: GET /stats/summary?pattern={pattern}&days={days}")
+
+    body = {
+        "size": 0,
+        "query": {
+            "bool": {
+                "must": [await substring_clause(pattern)],
+                "filter": [time_range_filter(days, cache_ttl("summary"))]
+            }
+        },
+        "aggs": {
+            "files": {"terms": {"field": "file_name.keyword", "size": files_size}},
+            "trains": {"terms": {"field": "train_id.keyword", "size": trains_size}},
+            "tests": {"terms": {"field": "test_id.keyword", "size": tests_size}},
+            "errors_over_time": {"date_histogram": {"field": "@timestamp", "calendar_interval": "day"}}
+        }
+    }
+
+    try:
+        res = await cached_agg_search("summary", await route(days), body)
+        aggs = res.get('aggregations', {})
+        total = res.get('hits', {}).get('total', {}).get('value', 0)
+        logger.info(f"Retrieved summary for pattern '{pattern}' ({total} matching logs)")
+        return {
+            "total": total,
+            "files": aggs.get('files', {}).get('buckets', []),
+            "trains": aggs.get('trains', {}).get('buckets', []),
+            "tests": aggs.get('tests', {}).get('buckets', []),
+            "errors_over_time": aggs.get('errors_over_time', {}),
+            "partial": is_partial(res)
+        }
+    except QueryRejected as e:
+        raise e.http_exception()
+    except Exception as e:
+        logger.error(f"Error in pattern_summary: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail="Internal Server Error")
+
+
+class BatchRequest(BaseModel):
+    """
+    Body of POST /stats/batch.
+    """
+    patterns: List[str] = Field(..., min_items=1, description="Patterns to look up (wildcard substring match)")
+    group_by: GroupBy = Field(GroupBy.train_id, description="Field to bucket matches by")
+    days: int = Field(settings.default_days, description="Number of days in the past to search")
+    size: int = Field(1000, description="Maximum buckets returned per pattern")
+    chunk_size: Optional[int] = Field(None, ge=1, description="Patterns per _msearch request (default: configured)")
+    concurrency: Optional[int] = Field(None, ge=1, description="Concurrent _msearch requests (default: configured)")
+
+
+@router.post('/batch', summary="Look up many patterns at once")
+async def batch_patterns(
+    request: BatchRequest,
+    api_key: str = Depends(require_api_key)
+):
+    """
+    For each pattern, find the training jobs (or tests / files) whose logs contain it.
+
+    Patterns are sent to Elasticsearch in chunks through `_msearch`, one round-trip per chunk,
+    with a bounded number of chunks in flight. A pattern that fails does not fail the batch;
+    its entry carries an `error` instead of `buckets`.
+
+    - **patterns**: List of patterns (e.g. known failure signatures).
+    - **group_by**: `train_id` (default), `test_id` or `file_name`.
+    - **days**: Number of days in the past to search.
+    - **size**: Maximum buckets per pattern.
+    - **chunk_size** / **concurrency**: Override the configured _msearch chunking.
+    """
+    patterns = request.patterns
+    logger.info(f"API Request: POST /stats/batch patterns={len(patterns)} group_by={request.group_by.value} days={request.days}")
+
+    if len(patterns) > settings.batch_max_patterns:
+        raise HTTPException(status_code=422, detail=f"At most {settings.batch_max_patterns} patterns per batch")
+
+    chunk_size = request.chunk_size or settings.batch_chunk_size
+    semaphore = asyncio.Semaphore(request.concurrency or settings.batch_concurrency)
+    time_filter = time_range_filter(request.days)
+    index = await route(request.days)
+    agg = {"terms": {"field": f"{request.group_by.value}.keyword", "size": request.size}}
+
+    async def run_chunk(chunk):
+        bodies = [
+            {
+                "size": 0,
+                "query": {"bool": {"must": [await substring_clause(p)], "filter": [time_filter]}},
+                "aggs": {"matches": agg}
+            }
+            for p in chunk
+        ]
+        async with semaphore:
+            try:
+                responses = await msearch(index, bodies, kind="batch")
+            except QueryRejected as e:
+                logger.warning(f"Batch chunk of {len(chunk)} patterns refused: {e}")
+                return [{"pattern": p, "error": str(e)} for p in chunk]
+            except Exception as e:
+                logger.error(f"Error in batch_patterns chunk of {len(chunk)}: {e}", exc_info=True)
+                return [{"pattern": p, "error": "Internal Server Error"} for p in chunk]
+
+        results = []
+        for p, res in zip(chunk, responses):
+            if "error" in res:
+                reason = res["error"].get("reason", "search failed") if isinstance(res["error"], dict) else str(res["error"])
+                results.append({"pattern": p, "error": reason})
+            else:
+                results.append({
+                    "pattern": p,
+                    "total": res.get('hits', {}).get('total', {}).get('value', 0),
+                    "buckets": res.get('aggregations', {}).get('matches', {}).get('buckets', []),
+                    "partial": is_partial(res)
+                })
+        return results
+
+    chunks = [patterns[i:i + chunk_size] for i in range(0, len(patterns), chunk_size)]
+    chunk_results = await asyncio.gather(*(run_chunk(c) for c in chunks))
+    results = [r for chunk in chunk_results for r in chunk]
+
+    failed = sum(1 for r in results if "error" in r)
+    logger.info(f"Batch of {len(patterns)} patterns done in {len(chunks)} msearch requests ({failed} failed)")
+    return {"group_by": request.group_by.value, "results": results}
+
+
+@router.get('/cache', summary="Result cache counters")
+async def cache_stats(api_key: str = Depends(require_api_key)):
+    """
+    Hit, miss, coalesced (single-flight) and eviction counters of the stats result cache.
+    """
+    return get_cache_stats()
+
+
+@router.get('/routing', summary="Index routing map")
+async def routing_map(api_key: str = Depends(require_api_key)):
+    """
+    Backing indices with their `@timestamp` range and number of tracked train/test IDs,
+    as used to narrow each query to the indices that can match (see app.services.routing).
+    """
+    return describe()
+
+
+@router.get('/governor', summary="Query governor state")
+async def governor_state(api_key: str = Depends(require_api_key)):
+    """
+    Circuit breaker state, heavy queries running and the configured limits of the query governor.
+    """
+    return governor.describe()
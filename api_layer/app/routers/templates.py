@@ -0,0 +1,69 @@
+from fastapi import APIRouter, Depends, Query, HTTPException
+from app.deps import require_api_key
+from app.services.templates import mine, reset
+from app.config import settings
+import logging
+
+# ------------------------------
+# Logging setup
+# ------------------------------
+logger = logging.getLogger("api_layer")
+
+router = APIRouter(prefix="/templates", tags=["templates"])
+
+
+@router.get('', summary="Group log lines into templates")
+async def get_templates(
+    train_id: str = Query(None, description="Only mine this training job"),
+    test_id: str = Query(None, description="Only mine this test"),
+    days: int = Query(settings.default_days, description="Window read on the first run for this scope"),
+    size: int = Query(200, ge=1, description="Maximum templates returned (most frequent first)"),
+    refresh: bool = Query(True, description="Mine documents newer than the last run before answering"),
+    api_key: str = Depends(require_api_key)
+):
+    """
+    Mine log messages into templates (signatures) with counts and first/last seen times.
+
+    Volatile tokens (numbers, hex ids, UUIDs, IPs, paths, timestamps) are masked and lines are
+    clustered Drain-style, so `Retrying request 4f2a9c (3/5)` and `Retrying request 9e01bb (1/5)`
+    count towards one `Retrying request <HEX> (<NUM>/<NUM>)` template. Results are stored per
+    scope (train, test or everything) and later calls only read newer documents.
+
+    Each template's `pattern` is its longest constant substring and can be passed as
+    `pattern=` to `/stats/*` or `/search/errors`.
+
+    - **train_id** / **test_id**: Scope; omit both for the whole index.
+    - **days**: Window read the first time a scope is mined.
+    - **size**: Maximum templates returned.
+    - **refresh**: `false` returns the stored templates without reading Elasticsearch.
+    """
+    logger.info(f"API Request: GET /templates?train_id={train_id}&test_id={test_id}&days={days}&refresh={refresh}")
+    try:
+        result = await mine(train_id, test_id, days, refresh)
+    except Exception as e:
+        logger.error(f"Error mining templates for train_id={train_id}, test_id={test_id}: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail="Internal Server Error during template mining")
+
+    miner = result["miner"]
+    return {
+        "scope": result["scope"],
+        "lines": result["lines"],
+        "new_lines": result["new_lines"],
+        "rebuilt": result["rebuilt"],
+        "total_templates": len(miner.clusters),
+        "templates": [c.to_dict() for c in miner.templates(size)],
+    }
+
+
+@router.delete('', summary="Forget the templates of a scope")
+async def delete_templates(
+    train_id: str = Query(None, description="Training job scope"),
+    test_id: str = Query(None, description="Test scope"),
+    api_key: str = Depends(require_api_key)
+):
+    """
+    Drop the stored templates and watermark of a scope; the next GET mines it from scratch.
+    """
+    logger.info(f"API Request: DELETE /templates?train_id={train_id}&test_id={test_id}")
+    await reset(train_id, test_id)
+    return {"status": "ok"}
@@ -0,0 +1,238 @@
+"""
+Compressed downloads of a run's logs, rebuilt as the original log files.
+
+Every file of a train or test becomes one archive member holding its lines in the
+original `timestamp LEVEL [source] message` format, in timestamp order. Members are read
+with PIT + search_after (scan_sorted), and each batch of hits is formatted and compressed
+in a worker thread while the next page is fetched, so the event loop stays free and memory
+use does not depend on the size of the run.
+
+Formats:
+
+- `zip`: members are streamed as they are read (sizes go in data descriptors).
+- `tar.gz` / `tar.zst`: a tar header needs the member size up front, so each member is
+  spooled to a temporary file (in memory up to settings.archive_spool_bytes) and
+  compressed once complete. `tar.zst` needs the optional `zstandard` package.
+"""
+from enum import Enum
+from app.services.elastic import agg_search
+from app.services.templates import batched_hits
+from app.config import settings
+import asyncio
+import gzip
+import logging
+import tarfile
+import tempfile
+import time
+import zipfile
+
+try:
+    import zstandard
+except ImportError:  # optional: only needed for format=tar.zst
+    zstandard = None
+
+# ------------------------------
+# Logging setup
+# ------------------------------
+logger = logging.getLogger("api_layer")
+
+# Fields needed to rebuild a line and name its file.
+SOURCE_FIELDS = ["log_timestamp", "log_level", "source", "message", "log.file.path"]
+# Files listed per test; a test normally writes a single logmessages.txt.
+FILES_PER_TEST = 100
+
+
+class ArchiveFormat(str, Enum):
+    zip = "zip"
+    tar_gz = "tar.gz"
+    tar_zst = "tar.zst"
+
+
+MEDIA_TYPES = {
+    ArchiveFormat.zip: "application/zip",
+    ArchiveFormat.tar_gz: "application/gzip",
+    ArchiveFormat.tar_zst: "application/zstd",
+}
+
+
+def original_line(src):
+    """
+    Rebuilds the log line a document was parsed from.
+
+    Documents the grok pattern could not parse (`_grokparsefailure`) keep the raw line in
+    `message`, so it is returned as is.
+    """
+    message = src.get("message", "")
+    if not isinstance(message, str):
+        message = "\n".join(message)
+    if src.get("log_timestamp") and src.get("log_level"):
+        return f"{src['log_timestamp']} {src['log_level']} [{src.get('source', '')}] {message}"
+    return message
+
+
+def member_name(src, train_id, test_id, file_name):
+    """
+    Archive path of a file: its original path from `trainid_...` on, or
+    `<train_id>/<test_id>/<file_name>` when the path was not indexed.
+    """
+    path = (src.get("log") or {}).get("file", {}).get("path") or src.get("log.file.path")
+    if path and "trainid_" in path:
+        return path[path.index("trainid_"):]
+    return f"{train_id}/{test_id}/{file_name}"
+
+
+class _Sink:
+    """
+    Write-only file object collecting compressed output until it is drained.
+    """
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b"".join(self.chunks)
+        self.chunks.clear()
+        return data
+
+
+class ArchiveWriter:
+    """
+    Incremental archive encoder, meant to run in a worker thread (asyncio.to_thread).
+    write(), close_member() and close() return the compressed bytes produced so far.
+    """
+
+    def __init__(self, fmt):
+        self.fmt = fmt
+        self.sink = _Sink()
+        self.member = None
+        self.name = None
+        self.mtime = None
+        level = settings.archive_compress_level
+        if fmt == ArchiveFormat.zip:
+            self.zip = zipfile.ZipFile(self.sink, "w", compression=zipfile.ZIP_DEFLATED, compresslevel=level)
+            return
+        if fmt == ArchiveFormat.tar_zst:
+            self.stream = zstandard.ZstdCompressor(level=level).stream_writer(self.sink, closefd=False)
+        else:
+            # tarfile's own "w|gz" always compresses at level 9, several times slower than 6.
+            self.stream = gzip.GzipFile(fileobj=self.sink, mode="wb", compresslevel=level)
+        self.tar = tarfile.open(fileobj=self.stream, mode="w|", format=tarfile.PAX_FORMAT)
+
+    def open_member(self, name, mtime):
+        """
+        Starts the next member; `mtime` is in epoch seconds.
+        """
+        self.name = name
+        self.mtime = mtime
+        if self.fmt == ArchiveFormat.zip:
+            info = zipfile.ZipInfo(name, date_time=time.localtime(mtime)[:6])
+            info.compress_type = zipfile.ZIP_DEFLATED
+            info.external_attr = 0o644 << 16
+            self.member = self.zip.open(info, "w", force_zip64=True)
+        else:
+            self.member = tempfile.SpooledTemporaryFile(max_size=settings.archive_spool_bytes)
+
+    def write(self, hits):
+        self.member.write("".join(original_line(hit["_source"]) + "\n" for hit in hits).encode())
+        return self.sink.drain()
+
+    def close_member(self):
+        if self.fmt == ArchiveFormat.zip:
+            self.member.close()
+        else:
+            info = tarfile.TarInfo(self.name)
+            info.size = self.member.tell()
+            info.mtime = self.mtime
+            info.mode = 0o644
+            self.member.seek(0)
+            self.tar.addfile(info, self.member)
+            self.member.close()
+        self.member = None
+        return self.sink.drain()
+
+    def close(self):
+        if self.member is not None:
+            self.member.close()
+        if self.fmt == ArchiveFormat.zip:
+            self.zip.close()
+        else:
+            self.tar.close()
+            self.stream.close()
+        return self.sink.drain()
+
+
+async def list_files(index_pattern, id_field, id_value, days):
+    """
+    Lists the files of a train or test.
+
+    Returns:
+        list: (train_id, test_id, file_name) tuples, ordered by train and test.
+    """
+    body = {
+        "size": 0,
+        "query": {"bool": {"filter": [
+            {"term": {f"{id_field}.keyword": id_value}},
+            {"range": {"@timestamp": {"gte": f"now-{days}d"}}},
+        ]}},
+        "aggs": {"trains": {
+            "terms": {"field": "train_id.keyword", "size": settings.archive_max_files, "order": {"_key": "asc"}},
+            "aggs": {"tests": {
+                "terms": {"field": "test_id.keyword", "size": settings.archive_max_files, "order": {"_key": "asc"}},
+                "aggs": {"files": {"terms": {"field": "file_name.keyword", "size": FILES_PER_TEST}}},
+            }},
+        }},
+    }
+    res = await agg_search(index_pattern, body)
+    files = []
+    for train in res.get("aggregations", {}).get("trains", {}).get("buckets", []):
+        for test in train["tests"]["buckets"]:
+            for file in test["files"]["buckets"]:
+                files.append((train["key"], test["key"], file["key"]))
+    return files
+
+
+async def stream_archive(index_pattern, files, days, fmt):
+    """
+    Streams the archive of `files` (from list_files()) as compressed chunks.
+
+    Yields:
+        bytes: Archive data, in order.
+    """
+    writer = ArchiveWriter(fmt)
+    try:
+        for train_id, test_id, file_name in files:
+            body = {
+                "query": {"bool": {"filter": [
+                    {"term": {"train_id.keyword": train_id}},
+                    {"term": {"test_id.keyword": test_id}},
+                    {"term": {"file_name.keyword": file_name}},
+                    {"range": {"@timestamp": {"gte": f"now-{days}d"}}},
+                ]}},
+                "sort": [{"@timestamp": {"order": "asc"}}],
+                "_source": {"includes": SOURCE_FIELDS},
+            }
+            opened = False
+            async for hits in batched_hits(index_pattern, body, settings.export_page_size):
+                if not opened:
+                    name = member_name(hits[0]["_source"], train_id, test_id, file_name)
+                    mtime = hits[0]["sort"][0] / 1000 if hits[0].get("sort") else time.time()
+                    await asyncio.to_thread(writer.open_member, name, mtime)
+                    opened = True
+                data = await asyncio.to_thread(writer.write, hits)
+                if data:
+                    yield data
+            if opened:
+                data = await asyncio.to_thread(writer.close_member)
+                if data:
+                    yield data
+        yield await asyncio.to_thread(writer.close)
+    finally:
+        if writer.member is not None:
+            writer.member.close()
@@ -0,0 +1,222 @@
+from collections import OrderedDict
+from app.services.elastic import agg_search
+from app.services.governor import is_partial
+from app.config import settings
+import asyncio
+import hashlib
+import json
+import logging
+import time
+
+try:
+    import redis.asyncio as redis
+    from redis.exceptions import RedisError
+except ImportError:  # optional: only needed for CACHE_BACKEND_URL=redis://...
+    redis = None
+    RedisError = None
+
+# ------------------------------
+# Logging setup
+# ------------------------------
+logger = logging.getLogger("api_layer")
+
+
+class MemoryBackend:
+    """
+    Bounded in-process LRU with per-entry expiry.
+    """
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.evictions = 0
+        self.errors = 0
+        self._entries = OrderedDict()
+
+    async def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    async def set(self, key, value, ttl):
+        self._entries[key] = (time.monotonic() + ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def __len__(self):
+        return len(self._entries)
+
+    async def close(self):
+        self._entries.clear()
+
+
+class RedisBackend:
+    """
+    Shares cached results across workers and hosts through Redis.
+
+    Expiry and eviction are left to Redis (EX on every key, plus the server's maxmemory policy).
+    """
+
+    def __init__(self, url, prefix="triage-api:"):
+        if redis is None:
+            raise RuntimeError("CACHE_BACKEND_URL requires the 'redis' package")
+        self.prefix = prefix
+        self.evictions = 0
+        self.errors = 0
+        self._client = redis.from_url(url)
+
+    async def get(self, key):
+        # The cache fails open: an unreachable Redis is a miss, not a failed request.
+        try:
+            raw = await self._client.get(self.prefix + key)
+        except RedisError as e:
+            self.errors += 1
+            logger.warning(f"Redis cache read failed, treating as a miss: {e}")
+            return None
+        return json.loads(raw) if raw is not None else None
+
+    async def set(self, key, value, ttl):
+        try:
+            await self._client.set(self.prefix + key, json.dumps(value), ex=max(1, int(ttl)))
+        except RedisError as e:
+            self.errors += 1
+            logger.warning(f"Redis cache write failed, result not cached: {e}")
+
+    def __len__(self):
+        return 0
+
+    async def close(self):
+        await self._client.close()
+
+
+class ResultCache:
+    """
+    TTL cache for Elasticsearch responses with single-flight deduplication.
+
+    Concurrent callers asking for the same key while it is being computed all await the
+    same in-flight request instead of sending duplicates to Elasticsearch. Failures are
+    not cached, and neither are partial results (see app.services.governor).
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self._inflight = {}
+
+    async def get_or_compute(self, key, ttl, compute):
+        value = await self.backend.get(key)
+        if value is not None:
+            self.hits += 1
+            return value
+
+        pending = self._inflight.get(key)
+        if pending is not None:
+            self.coalesced += 1
+        else:
+            self.misses += 1
+            # Run as its own task so a disconnecting first caller does not cancel the others.
+            pending = asyncio.ensure_future(self._compute(key, ttl, compute))
+            self._inflight[key] = pending
+            pending.add_done_callback(lambda task: self._finish(key, task))
+        return await asyncio.shield(pending)
+
+    async def _compute(self, key, ttl, compute):
+        value = await compute()
+        if not is_partial(value):
+            await self.backend.set(key, value, ttl)
+        return value
+
+    def _finish(self, key, task):
+        self._inflight.pop(key, None)
+        if not task.cancelled():
+            # Mark failures as retrieved even if every caller has gone away.
+            task.exception()
+
+    def stats(self):
+        return {
+            "backend": type(self.backend).__name__,
+            "entries": len(self.backend),
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "evictions": self.backend.evictions,
+            "errors": self.backend.errors,
+            "in_flight": len(self._inflight),
+        }
+
+
+# Created by the application lifespan (see app.main).
+result_cache: ResultCache = None
+
+
+def init_cache():
+    """
+    Creates the process-wide result cache using the configured backend.
+    """
+    global result_cache
+    if settings.cache_backend_url:
+        backend = RedisBackend(settings.cache_backend_url)
+    else:
+        backend = MemoryBackend(settings.cache_max_entries)
+    result_cache = ResultCache(backend)
+    logger.info(f"Result cache initialised ({type(backend).__name__}, enabled={settings.cache_enabled})")
+    return result_cache
+
+
+async def close_cache():
+    global result_cache
+    if result_cache is not None:
+        await result_cache.backend.close()
+        result_cache = None
+
+
+def get_cache_stats():
+    """
+    Counters of the process-wide cache, plus its configuration.
+    """
+    if result_cache is None:
+        return {"enabled": False}
+    return dict(result_cache.stats(), enabled=settings.cache_enabled, ttls=settings.cache_ttls)
+
+
+def cache_ttl(endpoint):
+    """
+    TTL in seconds for an endpoint, or 0 when caching is disabled for it.
+    """
+    if not settings.cache_enabled or result_cache is None:
+        return 0
+    return settings.cache_ttls.get(endpoint, 0)
+
+
+async def cached_agg_search(endpoint, index_pattern, body):
+    """
+    agg_search() through the result cache.
+
+    The key is the endpoint plus a hash of the index and body, so callers should build
+    time filters with queries.time_range_filter(days, cache_ttl(endpoint)) to make
+    near-identical requests share an entry.
+
+    Returns:
+        dict: The Elasticsearch response body.
+    """
+    ttl = cache_ttl(endpoint)
+    if not ttl:
+        return await agg_search(index_pattern, body, kind=endpoint)
+
+    canonical = json.dumps([index_pattern, body], sort_keys=True, separators=(",", ":"))
+    key = f"{endpoint}:{hashlib.sha1(canonical.encode()).hexdigest()}"
+
+    async def compute():
+        res = await agg_search(index_pattern, body, kind=endpoint)
+        return dict(res.body) if hasattr(res, "body") else dict(res)
+
+    return await result_cache.get_or_compute(key, ttl, compute)
@@ -0,0 +1,129 @@
+from app.services.routing import route
+from app.services.templates import TemplateMiner, batched_hits, hit_messages, literal_pattern
+from app.config import settings
+import asyncio
+import logging
+import math
+import time
+
+# ------------------------------
+# Logging setup
+# ------------------------------
+logger = logging.getLogger("api_layer")
+
+BASE, TARGET = 0, 1
+
+
+async def _produce(side, index_pattern, body, queue):
+    """
+    Streams one run into the queue as (side, messages) batches; ends with (side, None).
+    """
+    try:
+        async for hits in batched_hits(index_pattern, body, settings.templates_batch_size):
+            await queue.put((side, hit_messages(hits)))
+    finally:
+        await queue.put((side, None))
+
+
+def _classify(miner, counts, totals, min_ratio, min_count):
+    """
+    Splits templates into new / missing / changed, comparing per-run rates (lines per template
+    over lines in the run) so runs of different length are comparable.
+    """
+    new, missing, changed = [], [], []
+    for cluster_id, (base, target) in counts.items():
+        cluster = miner.clusters[cluster_id]
+        entry = {"template": cluster.template, "pattern": literal_pattern(cluster.template),
+                 "base_count": base, "target_count": target, "sample": cluster.sample}
+        if base == 0:
+            new.append(entry)
+        elif target == 0:
+            missing.append(entry)
+        elif max(base, target) >= min_count:
+            base_rate, target_rate = base / totals[BASE], target / totals[TARGET]
+            ratio = target_rate / base_rate
+            if ratio >= min_ratio or ratio <= 1 / min_ratio:
+                entry["rate_ratio"] = round(ratio, 3)
+                changed.append(entry)
+    new.sort(key=lambda e: e["target_count"], reverse=True)
+    missing.sort(key=lambda e: e["base_count"], reverse=True)
+    changed.sort(key=lambda e: abs(math.log(e["rate_ratio"])) * math.log1p(e["base_count"] + e["target_count"]),
+                 reverse=True)
+    return new, missing, changed
+
+
+async def compare_runs(id_field, base_id, target_id, days=None, min_ratio=2.0, min_count=5, size=100):
+    """
+    Diffs the logs of two runs at template level.
+
+    Both runs are streamed from Elasticsearch concurrently (PIT + search_after) into a single
+    template miner, so a line shape gets the same template in either run. Only per-template
+    counts are kept and at most a couple of pages per run are buffered, so memory does not
+    grow with the length of the logs.
+
+    Args:
+        id_field (str): `train_id` or `test_id`.
+        base_id (str): The reference run.
+        target_id (str): The run being checked.
+        days (int): Look-back window covering both runs.
+        min_ratio (float): Rate change (either direction) for a shared template to count as changed.
+        min_count (int): Ignore shared templates seen fewer times than this in both runs.
+        size (int): Maximum entries returned per category.
+
+    Returns:
+        dict: Line totals per run and the `new`, `missing` and `changed` templates.
+    """
+    days = days or settings.default_days
+    started = time.perf_counter()
+
+    def body(run_id):
+        return {
+            "query": {"bool": {"filter": [
+                {"term": {f"{id_field}.keyword": run_id}},
+                {"range": {"@timestamp": {"gte": f"now-{days}d"}}},
+            ]}},
+            "sort": [{"@timestamp": {"order": "asc"}}],
+            "_source": {"includes": ["@timestamp", "message"]},
+        }
+
+    miner = TemplateMiner(settings.templates_similarity, settings.templates_depth)
+    counts = {}
+    totals = [0, 0]
+    queue = asyncio.Queue(maxsize=2)
+    base_index = await route(days, **{id_field: base_id})
+    target_index = await route(days, **{id_field: target_id})
+    producers = [
+        asyncio.create_task(_produce(BASE, base_index, body(base_id), queue)),
+        asyncio.create_task(_produce(TARGET, target_index, body(target_id), queue)),
+    ]
+    try:
+        running = len(producers)
+        while running:
+            side, messages = await queue.get()
+            if messages is None:
+                running -= 1
+                continue
+            totals[side] += len(messages)
+            assigned = await asyncio.to_thread(miner.add_batch, messages)
+            for cluster_id, n in assigned.items():
+                counts.setdefault(cluster_id, [0, 0])[side] += n
+        # Surface a failed scan instead of reporting a silently truncated diff.
+        for task in producers:
+            task.result()
+    finally:
+        for task in producers:
+            task.cancel()
+        await asyncio.gather(*producers, return_exceptions=True)
+
+    new, missing, changed = _classify(miner, counts, [max(t, 1) for t in totals], min_ratio, min_count)
+    logger.info(f"Compared {id_field} {base_id} ({totals[BASE]} lines) with {target_id} ({totals[TARGET]} lines): "
+                f"{len(new)} new, {len(missing)} missing, {len(changed)} changed templates "
+                f"in {time.perf_counter() - started:.2f}s")
+    return {
+        "base": {id_field: base_id, "lines": totals[BASE]},
+        "target": {id_field: target_id, "lines": totals[TARGET]},
+        "templates": len(miner.clusters),
+        "new": new[:size],
+        "missing": missing[:size],
+        "changed": changed[:size],
+    }
@@ -1,17 +1,141 @@
-from elasticsearch import Elasticsearch
+import asyncio
+from elasticsearch import AsyncElasticsearch
 from app.config import settings
+from app.services.metrics import observe_es
+from app.services import governor
 import logging
+import time
+
+try:
+    from elastic_transport import OrjsonSerializer
+except ImportError:  # elastic-transport < 8.4 only ships the stdlib json serializer
+    OrjsonSerializer = None
 
 # ------------------------------
 # Logging setup
 # ------------------------------
 logger = logging.getLogger("api_layer")
 
-es = Elasticsearch(settings.elasticsearch_url)
+# Created and closed by the application lifespan (see app.main), so the
+# connection pool is bound to the running event loop.
+es: AsyncElasticsearch = None
+_refresh_task = None
+
+
+async def init_es():
+    """
+    Creates the shared AsyncElasticsearch client and its connection pool.
+
+    Pool size, retries and the default request timeout come from settings. Idle
+    connections are kept alive by the underlying aiohttp connector and reused
+    across requests.
+
+    With SEARCH_BACKEND=local, the client is a LocalSearchClient over the on-disk index
+    (see app.services.local_index) instead, refreshed in the background.
+    """
+    global es, _refresh_task
+    if es is not None:
+        return es
+    if settings.search_backend == "local":
+        from app.services.local_index import LocalSearchClient
+        es = LocalSearchClient(settings.local_index_dir, settings.local_log_root, settings.local_log_glob)
+        if settings.local_refresh_seconds:
+            _refresh_task = asyncio.create_task(es.refresh_forever(settings.local_refresh_seconds))
+        logger.info(f"Local search backend initialised (index_dir={settings.local_index_dir}, "
+                    f"log_root={settings.local_log_root})")
+        return es
+    es = AsyncElasticsearch(
+        settings.elasticsearch_url,
+        connections_per_node=settings.es_max_connections,
+        request_timeout=settings.es_request_timeout,
+        max_retries=settings.es_max_retries,
+        retry_on_timeout=settings.es_retry_on_timeout,
+        # Hit lists dominate response sizes; orjson decodes them several times faster.
+        serializer=OrjsonSerializer() if OrjsonSerializer else None,
+    )
+    logger.info(f"Elasticsearch client initialised (max_connections={settings.es_max_connections}, "
+                f"request_timeout={settings.es_request_timeout}s)")
+    return es
+
+
+async def close_es():
+    """
+    Closes the shared client and releases all pooled connections.
+    """
+    global es, _refresh_task
+    if es is None:
+        return
+    if _refresh_task is not None:
+        _refresh_task.cancel()
+        _refresh_task = None
+    await es.close()
+    es = None
+    logger.info("Elasticsearch client closed")
+
+
+async def warm_up(connections=None):
+    """
+    Opens pooled connections before the first request arrives.
+
+    Issues `connections` concurrent lightweight requests so that many sockets are
+    established and kept alive, sparing the first users the TCP/TLS handshakes.
+    Failures are logged, not raised: the API still starts, and /health/ready reports
+    the cluster as unavailable.
+
+    Returns:
+        bool: True if every warm-up request succeeded.
+    """
+    connections = connections or settings.es_warm_connections
+    started = time.perf_counter()
+    results = await asyncio.gather(*(get_client().info() for _ in range(connections)), return_exceptions=True)
+    failed = [r for r in results if isinstance(r, Exception)]
+    if failed:
+        logger.warning(f"Connection pool warm-up: {len(failed)}/{connections} requests failed: {failed[0]}")
+    else:
+        logger.info(f"Connection pool warmed with {connections} connections in "
+                    f"{(time.perf_counter() - started) * 1000:.0f}ms")
+    return not failed
+
+
+async def ping(request_timeout=None):
+    """
+    Checks that the cluster answers within `request_timeout` seconds.
+
+    Returns:
+        bool: False on any failure or timeout; never raises.
+    """
+    try:
+        return bool(await get_client(request_timeout or settings.readiness_timeout).ping())
+    except Exception as e:
+        logger.warning(f"Elasticsearch ping failed: {e}")
+        return False
+
+
+def get_client(request_timeout=None):
+    """
+    Returns the shared client, optionally bound to a per-request timeout.
+
+    Raises:
+        RuntimeError: If called before init_es().
+    """
+    if es is None:
+        raise RuntimeError("Elasticsearch client is not initialised")
+    if request_timeout is not None:
+        return es.options(request_timeout=request_timeout)
+    return es
+
+def _index_options(index_pattern):
+    """
+    Extra search parameters for an index expression.
+
+    A routed index list (see app.services.routing) may name an index that ILM deleted
+    since the routing map was refreshed; it is skipped instead of failing the search.
+    """
+    return {"ignore_unavailable": True} if "," in index_pattern else {}
 
 # helper wrapper functions
 
-def search(index_pattern, body, size=10000):
+async def search(index_pattern, body, size=10000, request_timeout=None, kind=None):
     """
     Executes a standard search query against Elasticsearch.
 
@@ -19,22 +143,34 @@ def search(index_pattern, body, size=10000):
         index_pattern (str): The index or pattern to search (e.g., "logs-*").
         body (dict): The Elasticsearch query DSL body.
         size (int): The maximum number of documents to return. Defaults to 10000.
+        request_timeout (float): Optional timeout in seconds overriding the client default.
+        kind (str): Query governor kind (see app.services.governor); None leaves the search ungoverned.
 
     Returns:
         dict: The raw Elasticsearch response.
+
+    Raises:
+        QueryRejected: If the governor refuses the query.
     """
     logger.debug(f"Executing search on index='{index_pattern}' with size={size}. Body: {body}")
-    try:
-        response = es.search(index=index_pattern, body=body, size=size)
-        hits = response.get('hits', {}).get('total', {}).get('value', 0)
-        logger.debug(f"Search successful. Found {hits} hits.")
-        return response
-    except Exception as e:
-        logger.error(f"Elasticsearch search failed: {e}")
-        raise
+    async with governor.admit(kind, body, size) as ticket:
+        started = time.perf_counter()
+        try:
+            response = await get_client(request_timeout or ticket.request_timeout).search(
+                index=index_pattern, body=ticket.limit(body), size=size, **_index_options(index_pattern)
+            )
+            observe_es("search", started, response)
+            ticket.observe(response)
+            hits = response.get('hits', {}).get('total', {}).get('value', 0)
+            logger.debug(f"Search successful. Found {hits} hits.")
+            return response
+        except Exception as e:
+            observe_es("search", started)
+            logger.error(f"Elasticsearch search failed: {e}")
+            raise
 
 
-def agg_search(index_pattern, body):
+async def agg_search(index_pattern, body, request_timeout=None, kind=None):
     """
     Executes an aggregation search query against Elasticsearch.
     
@@ -43,15 +179,166 @@ def agg_search(index_pattern, body):
     Args:
         index_pattern (str): The index or pattern to search.
         body (dict): The Elasticsearch query DSL body containing aggregations.
+        request_timeout (float): Optional timeout in seconds overriding the client default.
+        kind (str): Query governor kind (see app.services.governor); None leaves the search ungoverned.
 
     Returns:
         dict: The raw Elasticsearch response.
+
+    Raises:
+        QueryRejected: If the governor refuses the query.
     """
     logger.debug(f"Executing aggregation on index='{index_pattern}'. Body: {body}")
+    # The client rejects `size` given both in the body and as a parameter.
+    body = {k: v for k, v in body.items() if k != "size"}
+    async with governor.admit(kind, body) as ticket:
+        started = time.perf_counter()
+        try:
+            response = await get_client(request_timeout or ticket.request_timeout).search(
+                index=index_pattern, body=ticket.limit(body), size=0, **_index_options(index_pattern)
+            )
+            observe_es("agg", started, response)
+            ticket.observe(response)
+            logger.debug("Aggregation search successful.")
+            return response
+        except Exception as e:
+            observe_es("agg", started)
+            logger.error(f"Elasticsearch aggregation failed: {e}")
+            raise
+
+
+async def open_pit(index_pattern, keep_alive=None):
+    """
+    Opens a point-in-time (PIT) context over the given index pattern.
+
+    Returns:
+        str: The PIT id to pass in subsequent search bodies.
+    """
+    keep_alive = keep_alive or settings.pit_keep_alive
+    response = await get_client().open_point_in_time(
+        index=index_pattern, keep_alive=keep_alive, **_index_options(index_pattern)
+    )
+    logger.debug(f"Opened PIT on index='{index_pattern}' (keep_alive={keep_alive})")
+    return response["id"]
+
+
+async def close_pit(pit_id):
+    """
+    Releases a point-in-time context. Failures are logged, never raised, since
+    an unreleased PIT simply expires after its keep-alive.
+    """
     try:
-        response = es.search(index=index_pattern, body=body, size=0)
-        logger.debug("Aggregation search successful.")
-        return response
+        await get_client().close_point_in_time(id=pit_id)
+        logger.debug("Closed PIT")
     except Exception as e:
-        logger.error(f"Elasticsearch aggregation failed: {e}")
-        raise
\ No newline at end of file
+        logger.warning(f"Failed to close PIT: {e}")
+
+
+async def pit_search(pit_id, body, size, search_after=None, keep_alive=None, request_timeout=None, kind=None):
+    """
+    Executes one page of a point-in-time search.
+
+    The body must not name an index; the PIT determines which indices are read.
+    A `_shard_doc` tiebreaker is appended to the sort so `search_after` is unique.
+
+    With `kind`, the page is governed like search() (see app.services.governor).
+
+    Returns:
+        dict: The raw Elasticsearch response. Its `pit_id` must be used for the next page.
+    """
+    page = dict(body)
+    page["pit"] = {"id": pit_id, "keep_alive": keep_alive or settings.pit_keep_alive}
+    page["sort"] = list(body.get("sort", [])) + [{"_shard_doc": "asc"}]
+    if search_after is not None:
+        page["search_after"] = search_after
+    logger.debug(f"Executing PIT search with size={size}, search_after={search_after}")
+    async with governor.admit(kind, body, size) as ticket:
+        started = time.perf_counter()
+        try:
+            response = await get_client(request_timeout or ticket.request_timeout).search(
+                body=ticket.limit(page), size=size
+            )
+            observe_es("pit", started, response)
+            ticket.observe(response)
+            return response
+        except Exception as e:
+            observe_es("pit", started)
+            logger.error(f"Elasticsearch PIT search failed: {e}")
+            raise
+
+
+async def scan_sorted(index_pattern, body, page_size=None, keep_alive=None):
+    """
+    Streams every hit matching the query, in sort order, using PIT + search_after.
+
+    The next page is requested while the caller consumes the current one, so at most
+    two pages are held in memory regardless of the size of the result set.
+
+    Args:
+        index_pattern (str): The index or pattern to read.
+        body (dict): Query DSL body with `query` and `sort`.
+        page_size (int): Hits per page. Defaults to settings.export_page_size.
+        keep_alive (str): PIT keep-alive between pages.
+
+    Yields:
+        dict: Raw hits (with `_source` and `sort`).
+    """
+    page_size = page_size or settings.export_page_size
+    pit_id = await open_pit(index_pattern, keep_alive)
+    pending = None
+    try:
+        pending = asyncio.ensure_future(pit_search(pit_id, body, page_size, keep_alive=keep_alive))
+        while pending is not None:
+            res = await pending
+            pending = None
+            pit_id = res.get("pit_id", pit_id)
+            hits = res.get("hits", {}).get("hits", [])
+            if len(hits) == page_size:
+                pending = asyncio.ensure_future(
+                    pit_search(pit_id, body, page_size, search_after=hits[-1]["sort"], keep_alive=keep_alive)
+                )
+            for hit in hits:
+                yield hit
+    finally:
+        if pending is not None:
+            pending.cancel()
+        await close_pit(pit_id)
+
+
+async def msearch(index_pattern, bodies, request_timeout=None, kind=None):
+    """
+    Executes several searches against the same index pattern in one `_msearch` round-trip.
+
+    Args:
+        index_pattern (str): The index or pattern every search targets.
+        bodies (list): Query DSL bodies, one per search.
+        request_timeout (float): Optional timeout in seconds overriding the client default.
+        kind (str): Query governor kind; the request is admitted as one query priced by its
+            costliest body, and every body gets the kind's limits.
+
+    Returns:
+        list: One raw response per body, in order. Failed searches are returned as
+        `{"error": ...}` entries rather than raised.
+
+    Raises:
+        QueryRejected: If the governor refuses the request.
+    """
+    logger.debug(f"Executing msearch on index='{index_pattern}' with {len(bodies)} searches")
+    async with governor.admit(kind, bodies) as ticket:
+        searches = []
+        for body in bodies:
+            searches.append({"index": index_pattern, **_index_options(index_pattern)})
+            searches.append(ticket.limit(body))
+        started = time.perf_counter()
+        try:
+            response = await get_client(request_timeout or ticket.request_timeout).msearch(searches=searches)
+            observe_es("msearch", started, response)
+            responses = response.get("responses", [])
+            for res in responses:
+                ticket.observe(res)
+            logger.debug("Multi-search successful.")
+            return responses
+        except Exception as e:
+            observe_es("msearch", started)
+            logger.error(f"Elasticsearch msearch failed: {e}")
+            raise
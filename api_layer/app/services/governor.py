@@ -0,0 +1,305 @@
+"""
+Query governor: cost limits for Elasticsearch searches issued on behalf of API requests.
+
+Every governed search (see the `kind` argument of the app.services.elastic wrappers) gets:
+
+- an Elasticsearch `timeout` per kind (settings.query_timeouts), so a slow query returns
+  what it has found so far, flagged `timed_out`, instead of failing;
+- a cost estimate from its shape (substring wildcards, match-all, query_string leading
+  wildcards), time range and size. Heavy queries also get `terminate_after`, and at most
+  settings.governor_heavy_concurrency of them run at once per worker. Others wait up to
+  settings.governor_queue_seconds for a slot. Queries of LIGHT_KINDS are never heavy;
+- a circuit breaker on Elasticsearch latency: while the median of recent calls exceeds
+  settings.breaker_latency_seconds, heavy queries are refused (503 with Retry-After) so
+  light ones still get through.
+
+Callers report a result as partial with is_partial() instead of failing the request.
+"""
+from collections import deque
+from contextlib import asynccontextmanager
+from fastapi import HTTPException
+from app.services.metrics import QUERY_PARTIAL, QUERY_REJECTED
+from app.config import settings
+import asyncio
+import logging
+import re
+import statistics
+import time
+
+# ------------------------------
+# Logging setup
+# ------------------------------
+logger = logging.getLogger("api_layer")
+
+# Extra client-side wait beyond the Elasticsearch `timeout`, so partial results can come back.
+TIMEOUT_GRACE = 5.0
+# Assumed look-back for queries without a time filter.
+UNBOUNDED_DAYS = 365
+# ID fields whose term filters make a query selective.
+SELECTIVE_FIELDS = ("train_id.keyword", "test_id.keyword", "file_name.keyword")
+# Kinds that read pre-aggregated indices (the hourly rollup): cheap whatever their time range,
+# so never heavy. They would otherwise be refused by the breaker and, worse, have their summed
+# counts cut short by `terminate_after`.
+LIGHT_KINDS = ("rollup",)
+
+_LEADING_WILDCARD_RE = re.compile(r"(^|[\s(:])[*?]")
+_RELATIVE_RE = re.compile(r"^now-(\d+)([dhm])")
+
+
+class QueryRejected(Exception):
+    """
+    Raised when a query is refused by the admission queue or the circuit breaker.
+    """
+
+    def __init__(self, reason, retry_after):
+        super().__init__(reason)
+        self.retry_after = max(1, int(retry_after))
+
+    def http_exception(self):
+        return HTTPException(status_code=503, detail=f"Search capacity exceeded: {self}",
+                             headers={"Retry-After": str(self.retry_after)})
+
+
+def _walk(node):
+    if isinstance(node, dict):
+        for key, value in node.items():
+            yield key, value
+            yield from _walk(value)
+    elif isinstance(node, list):
+        for item in node:
+            yield from _walk(item)
+
+
+def _days(query):
+    for key, value in _walk(query):
+        if key != "range" or "@timestamp" not in value:
+            continue
+        bound = value["@timestamp"].get("gte", value["@timestamp"].get("gt"))
+        if isinstance(bound, str):
+            match = _RELATIVE_RE.match(bound)
+            if match:
+                n, unit = int(match.group(1)), match.group(2)
+                return n if unit == "d" else n / 24 if unit == "h" else n / 1440
+        elif isinstance(bound, (int, float)):
+            return max(0.0, (time.time() * 1000 - bound) / 86400000)
+    return UNBOUNDED_DAYS
+
+
+def _shape(query):
+    """
+    Relative cost of the query's most expensive clause: 1 for analysed text, up to 10 for
+    substring scans over keyword values.
+    """
+    factor, selective = 1.0, False
+    for key, value in _walk(query):
+        if key == "wildcard":
+            (field, spec), = value.items()
+            pattern = spec.get("value", "") if isinstance(spec, dict) else spec
+            if pattern.startswith(("*", "?")):
+                cost = 3.0 if field.endswith(".wildcard") else 10.0
+                if len(pattern.strip("*?")) < 3:
+                    cost *= 2
+            else:
+                cost = 1.5
+            factor = max(factor, cost)
+        elif key == "query_string":
+            text = value.get("query", "").strip()
+            if text in ("", "*", "*:*"):
+                factor = max(factor, 5.0)
+            elif _LEADING_WILDCARD_RE.search(text):
+                factor = max(factor, 10.0)
+            elif "*" in text or "?" in text:
+                factor = max(factor, 2.0)
+        elif key == "match_all":
+            factor = max(factor, 5.0)
+        elif key == "term" and any(field in value for field in SELECTIVE_FIELDS):
+            selective = True
+    return factor * 0.1 if selective else factor
+
+
+def estimate_cost(body, size=0):
+    """
+    Estimates the relative cost of a search: clause shape x (days / 30) + size / 1000.
+
+    A 30-day full-text search costs about 1. The default settings.governor_heavy_cost of 5
+    is reached by, for example, 60 days of `message.wildcard` substring queries or a year of
+    full-text search.
+    """
+    query = body.get("query", {})
+    return _shape(query) * max(_days(query), 1) / 30 + body.get("size", size) / 1000
+
+
+def is_partial(response):
+    """
+    True if Elasticsearch stopped early (timeout or terminate_after) or some shards failed.
+    """
+    if not response:
+        return False
+    return bool(response.get("timed_out") or response.get("terminated_early")
+                or response.get("_shards", {}).get("failed"))
+
+
+def query_timeout(kind):
+    return settings.query_timeouts.get(kind, settings.query_timeouts.get("default", 30))
+
+
+class CircuitBreaker:
+    """
+    Opens when the median latency of the last `window` governed calls exceeds `threshold`
+    seconds. After `cooldown` seconds one heavy query is let through as a probe: it closes
+    the breaker if fast enough, and reopens it otherwise.
+    """
+
+    def __init__(self, threshold, window, cooldown):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.samples = deque(maxlen=window)
+        self.opened_at = None
+        self.probing = False
+        self.trips = 0
+
+    def check(self):
+        """
+        Raises:
+            QueryRejected: If the breaker is open and this query may not probe it.
+        """
+        if self.opened_at is None:
+            return False
+        remaining = self.cooldown - (time.monotonic() - self.opened_at)
+        if remaining > 0 or self.probing:
+            raise QueryRejected("Elasticsearch is slow; heavy queries are paused", max(remaining, 1))
+        self.probing = True
+        return True
+
+    def record(self, seconds, probe=False):
+        self.samples.append(seconds)
+        if probe:
+            self.probing = False
+            if seconds < self.threshold:
+                logger.info(f"Circuit breaker closed: probe query took {seconds:.2f}s")
+                self.opened_at = None
+                self.samples.clear()
+            else:
+                self.opened_at = time.monotonic()
+            return
+        if self.opened_at is None and len(self.samples) >= self.samples.maxlen // 2:
+            median = statistics.median(self.samples)
+            if median > self.threshold:
+                self.opened_at = time.monotonic()
+                self.trips += 1
+                logger.warning(f"Circuit breaker opened: median Elasticsearch latency {median:.2f}s "
+                               f"over the last {len(self.samples)} calls")
+
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        return "half-open" if time.monotonic() - self.opened_at >= self.cooldown else "open"
+
+
+class Ticket:
+    """
+    The limits granted to one admitted query.
+    """
+
+    def __init__(self, kind, cost=0.0, heavy=False):
+        self.kind = kind
+        self.cost = cost
+        self.heavy = heavy
+        self.timeout = query_timeout(kind) if kind else None
+
+    @property
+    def request_timeout(self):
+        return self.timeout + TIMEOUT_GRACE if self.timeout else None
+
+    def limit(self, body):
+        """
+        Returns a copy of the body with the Elasticsearch `timeout` (and, for heavy queries,
+        `terminate_after`) set. Ungoverned queries are returned unchanged.
+        """
+        if not self.kind:
+            return body
+        body = dict(body, timeout=f"{self.timeout}s")
+        if self.heavy and settings.query_terminate_after:
+            body["terminate_after"] = settings.query_terminate_after
+        return body
+
+    def observe(self, response):
+        if self.kind and is_partial(response):
+            QUERY_PARTIAL.labels(self.kind).inc()
+            logger.info(f"Partial {self.kind} result (cost {self.cost:.1f}): timed_out={response.get('timed_out')}, "
+                        f"terminated_early={response.get('terminated_early')}")
+
+
+breaker = CircuitBreaker(settings.breaker_latency_seconds, settings.breaker_window, settings.breaker_cooldown_seconds)
+_heavy_slots = None
+_heavy_running = 0
+
+
+@asynccontextmanager
+async def admit(kind, body, size=0):
+    """
+    Admits a query (or, for msearch, a list of bodies) under the governor's limits.
+
+    Args:
+        kind (str): Per-route name used for timeouts and metrics (e.g. "logs", "search",
+            "trains", "batch"). None admits the query ungoverned.
+        body (dict | list): The query body, or a list of bodies priced by the costliest one.
+        size (int): Hits requested, when not given in the body.
+
+    Yields:
+        Ticket: Apply `ticket.limit(body)` and `ticket.request_timeout` to the call.
+
+    Raises:
+        QueryRejected: If a heavy query finds the breaker open or waits too long for a slot.
+    """
+    global _heavy_slots, _heavy_running
+    if not kind or not settings.governor_enabled:
+        yield Ticket(None)
+        return
+
+    bodies = body if isinstance(body, list) else [body]
+    cost = max(estimate_cost(b, size) for b in bodies)
+    ticket = Ticket(kind, cost, kind not in LIGHT_KINDS and cost >= settings.governor_heavy_cost)
+    probe = False
+    if ticket.heavy:
+        try:
+            probe = breaker.check()
+        except QueryRejected:
+            QUERY_REJECTED.labels(kind, "breaker").inc()
+            raise
+        if _heavy_slots is None:
+            _heavy_slots = asyncio.Semaphore(settings.governor_heavy_concurrency)
+        try:
+            await asyncio.wait_for(_heavy_slots.acquire(), settings.governor_queue_seconds)
+        except asyncio.TimeoutError:
+            if probe:
+                breaker.probing = False
+            QUERY_REJECTED.labels(kind, "queue").inc()
+            raise QueryRejected("too many expensive queries running", settings.governor_queue_seconds)
+        _heavy_running += 1
+
+    started = time.perf_counter()
+    try:
+        yield ticket
+    finally:
+        breaker.record(time.perf_counter() - started, probe)
+        if ticket.heavy:
+            _heavy_running -= 1
+            _heavy_slots.release()
+
+
+def describe():
+    """
+    Current governor state and limits, for diagnostics.
+    """
+    return {
+        "enabled": settings.governor_enabled,
+        "breaker": breaker.state(),
+        "breaker_trips": breaker.trips,
+        "recent_median_seconds": round(statistics.median(breaker.samples), 3) if breaker.samples else None,
+        "heavy_running": _heavy_running,
+        "heavy_concurrency": settings.governor_heavy_concurrency,
+        "heavy_cost": settings.governor_heavy_cost,
+        "timeouts": settings.query_timeouts,
+        "terminate_after": settings.query_terminate_after,
+    }
@@ -0,0 +1,1070 @@
+"""
+Offline search backend over raw cs1 log files.
+
+Builds a compact on-disk index over a log directory and answers the subset of the
+Elasticsearch query DSL that the routers generate, so `/logs/*`, `/search/*` and `/stats/*`
+work on triage boxes that cannot reach the cluster (SEARCH_BACKEND=local).
+
+Index layout (one directory):
+
+    manifest.json        files (path, inode, size, train/test IDs, timestamp range, doc ranges),
+                         segments, log levels and tombstone count
+    seg-NNNNNN.ts        int64   event timestamp (epoch ms), one per document
+    seg-NNNNNN.file      uint32  file number
+    seg-NNNNNN.off       uint64  byte offset of the event in its file
+    seg-NNNNNN.len       uint32  byte length of the event
+    seg-NNNNNN.lvl       uint16  log level number
+    seg-NNNNNN.lex       sorted, newline-separated message tokens
+    seg-NNNNNN.lexidx    uint64  start of each token in .lex (n + 1 entries)
+    seg-NNNNNN.postidx   uint64  start of each token's postings in .post (n + 1 entries)
+    seg-NNNNNN.post      uint32  document ids
+    deleted.bin          uint32  superseded document ids
+
+Every column is memory-mapped, so opening an index costs a few syscalls. Documents keep no
+copy of the text: `_source` is re-parsed from the original file on demand. Appended data is
+picked up by `update()`, which writes a new segment; the last event of a file is re-indexed
+(and its previous version tombstoned) because it may still have been growing.
+
+Usage (from api_layer/):
+    python -m app.services.local_index build /cb/cs1-job-logs/siemens_logs --index-dir /var/tmp/cs1-index
+    python -m app.services.local_index update /cb/cs1-job-logs/siemens_logs --index-dir /var/tmp/cs1-index
+"""
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict, defaultdict
+from datetime import datetime, timedelta, timezone
+from ingest.parser import iter_events, parse_event, path_fields
+import argparse
+import asyncio
+import copy
+import fcntl
+import fnmatch
+import glob
+import json
+import logging
+import mmap
+import os
+import re
+import threading
+import time
+
+# ------------------------------
+# Logging setup
+# ------------------------------
+logger = logging.getLogger("api_layer")
+
+TOKEN_RE = re.compile(rb"[A-Za-z0-9_]+")
+COLUMNS = {"ts": "q", "file": "I", "off": "Q", "len": "I", "lvl": "H"}
+SEGMENT_DOCS = 1_000_000
+ID_FIELDS = ("train_id", "test_id", "file_name")
+LOCAL_INDEX_NAME = "local"
+# Log files kept open for `_source` reads; the least recently read is closed beyond this.
+MAX_OPEN_FILES = 256
+
+
+class LocalQueryError(ValueError):
+    """
+    Raised for query DSL the local backend does not support.
+    """
+
+
+def tokenize(data):
+    """
+    Lower-cased runs of word characters; the same rule is used for documents and queries.
+    """
+    return [t.lower() for t in TOKEN_RE.findall(data)]
+
+
+def iso(ms):
+    return datetime.fromtimestamp(ms / 1000, timezone.utc).isoformat(timespec="milliseconds").replace("+00:00", "Z")
+
+
+def to_millis(iso_ts):
+    return int(datetime.fromisoformat(iso_ts.replace("Z", "+00:00")).timestamp() * 1000)
+
+
+# ------------------------------
+# On-disk segments
+# ------------------------------
+class _Terms:
+    """
+    Sequence view over a segment lexicon, for bisect.
+    """
+
+    def __init__(self, lex, lexidx):
+        self.lex, self.lexidx = lex, lexidx
+
+    def __len__(self):
+        return len(self.lexidx) - 1
+
+    def __getitem__(self, i):
+        return self.lex[self.lexidx[i]:self.lexidx[i + 1] - 1]
+
+
+class Segment:
+    """
+    A read-only, memory-mapped slice of documents [base, base + count).
+    """
+
+    def __init__(self, directory, name, base, count):
+        self.name, self.base, self.count = name, base, count
+        self._maps = []
+        for column, code in COLUMNS.items():
+            setattr(self, column, self._map(directory, f"{name}.{column}", code))
+        self.lex = self._map(directory, f"{name}.lex", None)
+        self.lexidx = self._map(directory, f"{name}.lexidx", "Q")
+        self.postidx = self._map(directory, f"{name}.postidx", "Q")
+        self.post = self._map(directory, f"{name}.post", "I")
+        self.terms = _Terms(self.lex, self.lexidx)
+
+    def _map(self, directory, filename, code):
+        path = os.path.join(directory, filename)
+        if os.path.getsize(path) == 0:
+            return memoryview(b"").cast(code) if code else b""
+        with open(path, "rb") as f:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._maps.append(mm)
+        return memoryview(mm).cast(code) if code else mm
+
+    def postings(self, i):
+        return self.post[self.postidx[i]:self.postidx[i + 1]]
+
+    def exact(self, term):
+        i = bisect_left(self.terms, term)
+        if i < len(self.terms) and self.terms[i] == term:
+            return [i]
+        return []
+
+    def prefixed(self, prefix):
+        i = bisect_left(self.terms, prefix)
+        found = []
+        while i < len(self.terms) and self.terms[i].startswith(prefix):
+            found.append(i)
+            i += 1
+        return found
+
+    def containing(self, piece):
+        """
+        Indexes of all terms containing `piece`, found by scanning the lexicon blob.
+        """
+        found, pos = [], self.lex.find(piece)
+        while pos != -1:
+            start = self.lex.rfind(b"\n", 0, pos) + 1
+            i = bisect_left(self.lexidx, start)
+            found.append(i)
+            pos = self.lex.find(piece, self.lexidx[i + 1])
+        return found
+
+    def close(self):
+        for column in list(COLUMNS) + ["lexidx", "postidx", "post"]:
+            view = getattr(self, column, None)
+            if isinstance(view, memoryview):
+                try:
+                    view.release()
+                except BufferError:
+                    pass
+        for mm in self._maps:
+            try:
+                mm.close()
+            except BufferError:
+                # A query still holds a slice; the map is released with it.
+                pass
+
+
+def _write_segment(directory, name, columns, postings):
+    for column, values in columns.items():
+        with open(os.path.join(directory, f"{name}.{column}"), "wb") as f:
+            values.tofile(f)
+    terms = sorted(postings)
+    lexidx, postidx, post = array("Q", [0]), array("Q", [0]), array("I")
+    with open(os.path.join(directory, f"{name}.lex"), "wb") as lex:
+        for term in terms:
+            lex.write(term + b"\n")
+            lexidx.append(lexidx[-1] + len(term) + 1)
+            post.extend(postings[term])
+            postidx.append(len(post))
+    for suffix, values in (("lexidx", lexidx), ("postidx", postidx), ("post", post)):
+        with open(os.path.join(directory, f"{name}.{suffix}"), "wb") as f:
+            values.tofile(f)
+
+
+# ------------------------------
+# Index
+# ------------------------------
+class LocalIndex:
+    """
+    A local log index: builder, incremental updater and query engine.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.segments = []
+        self.files = []
+        self.levels = []
+        self.deleted = set()
+        self._bases = []
+        self._file_index = {}
+        self._version = None
+        self._fds = OrderedDict()
+        self._fds_lock = threading.Lock()
+        self.reload()
+
+    # ---- loading -------------------------------------------------
+    @property
+    def manifest_path(self):
+        return os.path.join(self.directory, "manifest.json")
+
+    def reload(self):
+        """
+        (Re)opens the index if another process has published a newer manifest.
+        """
+        try:
+            with open(self.manifest_path) as f:
+                manifest = json.load(f)
+        except FileNotFoundError:
+            manifest = {"version": 0, "segments": [], "files": [], "levels": [], "deleted": 0}
+        if manifest["version"] == self._version:
+            return False
+        # Build the new state first and swap it in, so queries running in other threads keep a
+        # consistent view; superseded segments are unmapped when no longer referenced.
+        segments = [Segment(self.directory, s["name"], s["base"], s["count"]) for s in manifest["segments"]]
+        deleted = set()
+        if manifest["deleted"]:
+            tombstones = array("I")
+            with open(os.path.join(self.directory, "deleted.bin"), "rb") as f:
+                tombstones.fromfile(f, manifest["deleted"])
+            deleted = set(tombstones)
+        self.segments, self.files, self.levels, self.deleted = segments, manifest["files"], manifest["levels"], deleted
+        self._bases = [s.base for s in segments]
+        self._file_index = {f["path"]: i for i, f in enumerate(self.files)}
+        self._version = manifest["version"]
+        return True
+
+    @property
+    def doc_count(self):
+        return sum(s.count for s in self.segments)
+
+    def _publish(self, segments, files, levels, deleted_total):
+        manifest = {
+            "version": (self._version or 0) + 1,
+            "segments": segments,
+            "files": files,
+            "levels": levels,
+            "deleted": deleted_total,
+        }
+        tmp = self.manifest_path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(manifest, f)
+        os.replace(tmp, self.manifest_path)
+
+    # ---- building ------------------------------------------------
+    def update(self, root, pattern, exclude=("*.tmp", "*.bak", "*.swp")):
+        """
+        Indexes new files and data appended to known files under `root`.
+
+        Returns:
+            dict: Counts of files read and documents added.
+        """
+        lock = open(os.path.join(self.directory, ".lock"), "w")
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            self.reload()
+            builder = _SegmentBuilder(self)
+            files_read = 0
+            for path in sorted(glob.glob(os.path.join(root, pattern), recursive=True)):
+                if any(fnmatch.fnmatch(os.path.basename(path), ex) for ex in exclude):
+                    continue
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                if builder.add_file(path, st):
+                    files_read += 1
+            added = builder.finish()
+            return {"files_read": files_read, "docs_added": added, "docs_total": self.doc_count - len(self.deleted)}
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+            lock.close()
+
+    # ---- document access -----------------------------------------
+    def _segment_of(self, doc):
+        segments = self.segments
+        i = bisect_left(self._bases, doc + 1) - 1
+        if i < 0 or doc >= segments[i].base + segments[i].count:
+            raise KeyError(doc)
+        return segments[i]
+
+    def column(self, name, doc):
+        segment = self._segment_of(doc)
+        return getattr(segment, name)[doc - segment.base]
+
+    @staticmethod
+    def _same_file(fd, info):
+        st = os.fstat(fd)
+        return st.st_ino == info["inode"] and info.get("dev", st.st_dev) == st.st_dev
+
+    def _read(self, info, length, offset):
+        """
+        Reads `length` bytes at `offset` of an indexed file, or returns None if the path no
+        longer holds the file that was indexed (rotated or replaced since the last update).
+        """
+        path = info["path"]
+        # Reads share one LRU of descriptors; holding the lock keeps an evicted fd from being
+        # closed (and its number reused) while another thread reads from it.
+        with self._fds_lock:
+            fd = self._fds.get(path)
+            if fd is not None and not self._same_file(fd, info):
+                os.close(self._fds.pop(path))
+                fd = None
+            if fd is None:
+                try:
+                    fd = os.open(path, os.O_RDONLY)
+                except FileNotFoundError:
+                    return None
+                if not self._same_file(fd, info):
+                    os.close(fd)
+                    return None
+                self._fds[path] = fd
+                while len(self._fds) > MAX_OPEN_FILES:
+                    os.close(self._fds.popitem(last=False)[1])
+            self._fds.move_to_end(path)
+            return os.pread(fd, length, offset)
+
+    def source(self, doc):
+        """
+        Re-parses the document from its original file.
+
+        If the file was replaced since it was indexed, only the indexed fields are returned,
+        tagged `_stale_source`; the next update() re-indexes the new file.
+        """
+        segment = self._segment_of(doc)
+        i = doc - segment.base
+        info = self.files[segment.file[i]]
+        raw = self._read(info, segment.len[i], segment.off[i])
+        if raw is None:
+            source = dict(path_fields(info["path"]), message="", tags=["_stale_source"])
+            if self.levels[segment.lvl[i]]:
+                source["log_level"] = self.levels[segment.lvl[i]]
+        else:
+            source = parse_event(raw, path_fields(info["path"]))
+        source["@timestamp"] = iso(segment.ts[i])
+        return source
+
+    def message(self, doc):
+        return self.source(doc).get("message", "")
+
+    def close(self):
+        for segment in self.segments:
+            segment.close()
+        with self._fds_lock:
+            for fd in self._fds.values():
+                os.close(fd)
+            self._fds.clear()
+
+
+class _SegmentBuilder:
+    """
+    Accumulates newly read events and writes them as segments. Works on copies of the file
+    table and level list, which only become visible when the new manifest is published.
+    """
+
+    def __init__(self, index):
+        self.index = index
+        self.files = copy.deepcopy(index.files)
+        self.file_index = dict(index._file_index)
+        self.levels = list(index.levels)
+        self.segments = [{"name": s.name, "base": s.base, "count": s.count} for s in index.segments]
+        self.next_doc = index.doc_count
+        self.deleted_total = len(index.deleted)
+        self.new_tombstones = array("I")
+        self.added = 0
+        self.changed = False
+        self._reset()
+
+    def _reset(self):
+        self.base = self.next_doc
+        self.columns = {name: array(code) for name, code in COLUMNS.items()}
+        self.postings = defaultdict(lambda: array("I"))
+
+    def _level(self, name):
+        if name not in self.levels:
+            self.levels.append(name)
+        return self.levels.index(name)
+
+    def add_file(self, path, st):
+        file_no = self.file_index.get(path)
+        info = self.files[file_no] if file_no is not None else None
+        start = 0
+        if info is not None:
+            unchanged = (info["inode"] == st.st_ino and info["size"] == st.st_size and info["mtime"] == st.st_mtime)
+            if unchanged:
+                return False
+            if info["inode"] == st.st_ino and st.st_size >= info["size"] and info["last_doc"] is not None:
+                # Appended: re-read the last event, which may have been incomplete.
+                start = info["last_offset"]
+                self.new_tombstones.append(info["last_doc"])
+            else:
+                # Replaced or truncated: tombstone everything and start over.
+                for first, last in info["docs"]:
+                    self.new_tombstones.extend(range(first, last))
+                info["docs"], info["min_ts"], info["max_ts"] = [], None, None
+        else:
+            fields = path_fields(path)
+            info = {"path": path, "docs": [], "min_ts": None, "max_ts": None,
+                    **{f: fields.get(f) for f in ID_FIELDS}}
+            file_no = len(self.files)
+            self.files.append(info)
+            self.file_index[path] = file_no
+
+        self.changed = True
+        info.update(inode=st.st_ino, dev=st.st_dev, size=st.st_size, mtime=st.st_mtime, last_doc=None, last_offset=start)
+        fields = path_fields(path)
+        first_doc = self.next_doc
+        with open(path, "rb") as f:
+            for offset, raw in iter_events(f, start, st.st_size):
+                doc = self.next_doc
+                parsed = parse_event(raw, fields)
+                if "tags" in parsed:
+                    # Unparseable events are stamped with the file's mtime rather than the build time.
+                    ts = int(st.st_mtime * 1000)
+                else:
+                    ts = to_millis(parsed["@timestamp"])
+                level, message = parsed.get("log_level", ""), parsed["message"]
+                cols = self.columns
+                cols["ts"].append(ts)
+                cols["file"].append(file_no)
+                cols["off"].append(offset)
+                cols["len"].append(len(raw))
+                cols["lvl"].append(self._level(level))
+                for term in set(tokenize(message.encode())):
+                    self.postings[term].append(doc)
+                info["min_ts"] = ts if info["min_ts"] is None else min(info["min_ts"], ts)
+                info["max_ts"] = ts if info["max_ts"] is None else max(info["max_ts"], ts)
+                info["last_doc"], info["last_offset"] = doc, offset
+                self.next_doc += 1
+                self.added += 1
+                if self.next_doc - self.base >= SEGMENT_DOCS:
+                    self._extend_docs(info, first_doc)
+                    first_doc = self.next_doc
+                    self._flush()
+        self._extend_docs(info, first_doc)
+        return True
+
+    def _extend_docs(self, info, first_doc):
+        if self.next_doc > first_doc:
+            info["docs"].append([first_doc, self.next_doc])
+
+    def _flush(self):
+        count = self.next_doc - self.base
+        if not count:
+            return
+        name = f"seg-{self.base:09d}"
+        _write_segment(self.index.directory, name, self.columns, self.postings)
+        self.segments.append({"name": name, "base": self.base, "count": count})
+        self._reset()
+
+    def finish(self):
+        if not self.changed:
+            return 0
+        self._flush()
+        if self.new_tombstones:
+            with open(os.path.join(self.index.directory, "deleted.bin"), "ab") as f:
+                self.new_tombstones.tofile(f)
+            self.deleted_total += len(self.new_tombstones)
+        self.index._publish(self.segments, self.files, self.levels, self.deleted_total)
+        self.index.reload()
+        return self.added
+
+
+# ------------------------------
+# Query evaluation
+# ------------------------------
+_DATE_MATH = re.compile(r"^now(?:-(\d+)([smhdwM]))?(?:/([smhdwM]))?$")
+_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400, "w": 7 * 86400, "M": 30 * 86400}
+
+
+def parse_date(value, fmt=None):
+    """
+    Epoch millis for the date forms the API sends: `now-7d`, `now-1h/h`, epoch_millis, ISO-8601.
+    """
+    if isinstance(value, (int, float)) or fmt == "epoch_millis":
+        return int(value)
+    match = _DATE_MATH.match(value)
+    if match:
+        ms = int(time.time() * 1000)
+        if match.group(1):
+            ms -= int(match.group(1)) * _UNITS[match.group(2)] * 1000
+        if match.group(3):
+            unit = _UNITS[match.group(3)] * 1000
+            ms -= ms % unit
+        return ms
+    return to_millis(value)
+
+
+def _glob_regex(pattern, case_insensitive=False):
+    parts = []
+    for ch in pattern:
+        parts.append(".*" if ch == "*" else "." if ch == "?" else re.escape(ch))
+    return re.compile("".join(parts), re.DOTALL | (re.IGNORECASE if case_insensitive else 0))
+
+
+def _field(name):
+    """
+    `train_id.keyword` / `message.wildcard` -> `train_id` / `message`.
+    """
+    return name.split(".", 1)[0] if name.endswith((".keyword", ".wildcard")) else name
+
+
+class _Searcher:
+    """
+    Evaluates one request against a snapshot of the index (documents below `limit`).
+    """
+
+    def __init__(self, index, limit=None):
+        self.index = index
+        self.limit = index.doc_count if limit is None else min(limit, index.doc_count)
+
+    def all_docs(self):
+        return {d for d in range(self.limit) if d not in self.index.deleted}
+
+    def _restrict(self, docs, within):
+        docs = {d for d in docs if d < self.limit and d not in self.index.deleted}
+        return docs if within is None else docs & within
+
+    # ---- field access --------------------------------------------
+    def value(self, field, doc):
+        field = _field(field)
+        index = self.index
+        if field == "@timestamp":
+            return index.column("ts", doc)
+        if field in ID_FIELDS:
+            return index.files[index.column("file", doc)][field]
+        if field == "log_level":
+            return index.levels[index.column("lvl", doc)] or None
+        if field == "_index":
+            return LOCAL_INDEX_NAME
+        if field == "count":
+            # Raw lines stand in for rollup rows: each one counts once.
+            return 1
+        return index.source(doc).get(field)
+
+    def _file_docs(self, predicate):
+        docs = set()
+        for info in self.index.files:
+            if predicate(info):
+                for first, last in info["docs"]:
+                    docs.update(range(first, last))
+        return docs
+
+    def _term_docs(self, terms, mode):
+        docs = set()
+        for segment in self.index.segments:
+            for term in terms:
+                if mode == "exact":
+                    ids = segment.exact(term)
+                elif mode == "prefix":
+                    ids = segment.prefixed(term)
+                else:
+                    ids = segment.containing(term)
+                for i in ids:
+                    docs.update(segment.postings(i))
+        return docs
+
+    # ---- clauses -------------------------------------------------
+    def evaluate(self, clause, within):
+        if not clause:
+            return within if within is not None else self.all_docs()
+        (kind, spec), = clause.items()
+        handler = getattr(self, f"_q_{kind}", None)
+        if handler is None:
+            raise LocalQueryError(f"Unsupported query type: {kind}")
+        return handler(spec, within)
+
+    def _q_match_all(self, spec, within):
+        return within if within is not None else self.all_docs()
+
+    def _q_bool(self, spec, within):
+        docs = within
+        for key in ("filter", "must"):
+            clauses = spec.get(key, [])
+            for clause in clauses if isinstance(clauses, list) else [clauses]:
+                docs = self.evaluate(clause, docs)
+        should = spec.get("should", [])
+        should = should if isinstance(should, list) else [should]
+        # As in Elasticsearch, `should` is only required without must/filter clauses.
+        required = spec.get("minimum_should_match") or not (spec.get("must") or spec.get("filter"))
+        if should and required:
+            base = docs if docs is not None else self.all_docs()
+            matched = set()
+            for clause in should:
+                matched |= self.evaluate(clause, base)
+            docs = matched
+        must_not = spec.get("must_not", [])
+        for clause in must_not if isinstance(must_not, list) else [must_not]:
+            base = docs if docs is not None else self.all_docs()
+            docs = base - self.evaluate(clause, base)
+        return docs if docs is not None else self.all_docs()
+
+    def _q_term(self, spec, within):
+        (field, value), = spec.items()
+        value = value["value"] if isinstance(value, dict) else value
+        return self._q_terms({field: [value]}, within)
+
+    def _q_terms(self, spec, within):
+        (field, values), = spec.items()
+        field, values = _field(field), set(values)
+        if field in ID_FIELDS:
+            return self._restrict(self._file_docs(lambda info: info[field] in values), within)
+        base = within if within is not None else self.all_docs()
+        return {d for d in base if self.value(field, d) in values}
+
+    def _q_range(self, spec, within):
+        (field, bounds), = spec.items()
+        fmt = bounds.get("format")
+        low = parse_date(bounds["gte"], fmt) if "gte" in bounds else parse_date(bounds["gt"], fmt) + 1 if "gt" in bounds else None
+        high = parse_date(bounds["lte"], fmt) if "lte" in bounds else parse_date(bounds["lt"], fmt) - 1 if "lt" in bounds else None
+        if _field(field) != "@timestamp":
+            raise LocalQueryError(f"Unsupported range field: {field}")
+        low = -2 ** 63 if low is None else low
+        high = 2 ** 63 - 1 if high is None else high
+        if within is not None:
+            ts = self.index.column
+            return {d for d in within if low <= ts("ts", d) <= high}
+
+        # Prune whole files by their timestamp range, then scan the timestamp column of the rest.
+        index, docs = self.index, set()
+        for info in index.files:
+            if info["min_ts"] is None or info["min_ts"] > high or info["max_ts"] < low:
+                continue
+            for first, last in info["docs"]:
+                segment = index._segment_of(first)
+                base, column = segment.base, segment.ts
+                if low <= info["min_ts"] and info["max_ts"] <= high:
+                    docs.update(range(first, min(last, self.limit)))
+                    continue
+                for i in range(first - base, min(last, self.limit) - base):
+                    if low <= column[i] <= high:
+                        docs.add(base + i)
+        return docs - index.deleted
+
+    def _q_match(self, spec, within):
+        (field, query), = spec.items()
+        query = query["query"] if isinstance(query, dict) else query
+        terms = tokenize(str(query).encode())
+        if _field(field) != "message":
+            return self._q_terms({field: [query]}, within)
+        return self._restrict(self._term_docs(terms, "exact"), within)
+
+    def _q_match_phrase(self, spec, within):
+        (field, query), = spec.items()
+        query = query["query"] if isinstance(query, dict) else query
+        if _field(field) != "message":
+            return self._q_terms({field: [query]}, within)
+        return self._q_query_string({"query": '"' + str(query).replace('"', " ") + '"'}, within)
+
+    def _q_wildcard(self, spec, within):
+        (field, pattern), = spec.items()
+        if isinstance(pattern, dict):
+            pattern = pattern.get("value", pattern.get("wildcard"))
+        regex = _glob_regex(pattern)
+        field = _field(field)
+        if field in ID_FIELDS:
+            return self._restrict(self._file_docs(lambda info: bool(regex.fullmatch(info[field] or ""))), within)
+        if field != "message":
+            raise LocalQueryError(f"Unsupported wildcard field: {field}")
+        pieces = tokenize(re.sub(r"[*?]", " ", pattern).encode())
+        candidates = within
+        for piece in pieces:
+            candidates = self._restrict(self._term_docs([piece], "contains"), candidates)
+        if candidates is None:
+            candidates = self.all_docs()
+        if pattern.strip("*") == "":
+            return candidates
+        return {d for d in candidates if regex.fullmatch(self.index.message(d))}
+
+    def _q_query_string(self, spec, within):
+        return _QueryString(self, spec["query"]).evaluate(within)
+
+
+class _QueryString:
+    """
+    Lucene-style query strings: terms, `prefix*`, "phrases", AND / OR / NOT, parentheses.
+    Adjacent terms are OR-ed, as with Elasticsearch's default operator.
+    """
+
+    TOKENS = re.compile(r'\(|\)|"[^"]*"|[^\s()"]+')
+
+    def __init__(self, searcher, query):
+        self.searcher = searcher
+        self.tokens = self.TOKENS.findall(query)
+        self.pos = 0
+
+    def evaluate(self, within):
+        self.within = within if within is not None else self.searcher.all_docs()
+        if not self.tokens:
+            return set()
+        return self._or()
+
+    def _peek(self):
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else None
+
+    def _or(self):
+        docs = self._and()
+        while self._peek() not in (None, ")"):
+            if self._peek() in ("OR", "||"):
+                self.pos += 1
+            docs = docs | self._and()
+        return docs
+
+    def _and(self):
+        docs = self._unary()
+        while self._peek() in ("AND", "&&"):
+            self.pos += 1
+            docs = docs & self._unary()
+        return docs
+
+    def _unary(self):
+        token = self._peek()
+        if token is None:
+            return set()
+        self.pos += 1
+        if token in ("NOT", "!"):
+            return self.within - self._unary()
+        if token == "(":
+            docs = self._or()
+            if self._peek() == ")":
+                self.pos += 1
+            return docs
+        return self._term(token)
+
+    def _term(self, token):
+        searcher = self.searcher
+        if token.startswith('"'):
+            phrase = token.strip('"')
+            docs = self.within
+            for term in tokenize(phrase.encode()):
+                docs = searcher._restrict(searcher._term_docs([term], "exact"), docs)
+            needle = phrase.lower()
+            return {d for d in docs if needle in searcher.index.message(d).lower()}
+        if ":" in token:
+            field, value = token.split(":", 1)
+            return searcher._q_term({field: value.strip('"')}, self.within)
+        if token.endswith("*") and "*" not in token[:-1]:
+            terms = tokenize(token[:-1].encode())
+            return searcher._restrict(searcher._term_docs(terms[-1:], "prefix"), self.within) if terms else self.within
+        terms = tokenize(token.encode())
+        docs = self.within
+        for term in terms:
+            docs = searcher._restrict(searcher._term_docs([term], "exact"), docs)
+        return docs
+
+
+# ------------------------------
+# Aggregations
+# ------------------------------
+def _bucket_start(ms, interval):
+    dt = datetime.fromtimestamp(ms / 1000, timezone.utc)
+    if interval in ("month", "1M"):
+        dt = dt.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    elif interval in ("week", "1w"):
+        dt = (dt - timedelta(days=dt.weekday())).replace(hour=0, minute=0, second=0, microsecond=0)
+    else:
+        step = _interval_ms(interval)
+        return ms - ms % step
+    return int(dt.timestamp() * 1000)
+
+
+def _interval_ms(interval):
+    named = {"minute": "1m", "hour": "1h", "day": "1d"}
+    interval = named.get(interval, interval)
+    match = re.match(r"^(\d+)([smhd])$", interval)
+    if not match:
+        raise LocalQueryError(f"Unsupported interval: {interval}")
+    return int(match.group(1)) * _UNITS[match.group(2)] * 1000
+
+
+def _next_bucket(ms, interval):
+    dt = datetime.fromtimestamp(ms / 1000, timezone.utc)
+    if interval in ("month", "1M"):
+        dt = dt.replace(year=dt.year + dt.month // 12, month=dt.month % 12 + 1)
+        return int(dt.timestamp() * 1000)
+    if interval in ("week", "1w"):
+        return ms + 7 * 86400 * 1000
+    return ms + _interval_ms(interval)
+
+
+def aggregate(searcher, aggs, docs):
+    result = {}
+    for name, spec in aggs.items():
+        sub = spec.get("aggs") or spec.get("aggregations") or {}
+        if "terms" in spec:
+            result[name] = _agg_terms(searcher, spec["terms"], sub, docs)
+        elif "composite" in spec:
+            result[name] = _agg_composite(searcher, spec["composite"], sub, docs)
+        elif "date_histogram" in spec:
+            result[name] = _agg_histogram(searcher, spec["date_histogram"], sub, docs)
+        elif "sum" in spec:
+            result[name] = {"value": float(sum(searcher.value(spec["sum"]["field"], d) or 0 for d in docs))}
+        elif "value_count" in spec:
+            field = spec["value_count"]["field"]
+            result[name] = {"value": sum(1 for d in docs if searcher.value(field, d) is not None)}
+        elif "min" in spec or "max" in spec:
+            kind = "min" if "min" in spec else "max"
+            values = [searcher.value(spec[kind]["field"], d) for d in docs]
+            values = [v for v in values if v is not None]
+            value = (min if kind == "min" else max)(values) if values else None
+            result[name] = {"value": value}
+            if value is not None and _field(spec[kind]["field"]) == "@timestamp":
+                result[name]["value_as_string"] = iso(value)
+        else:
+            raise LocalQueryError(f"Unsupported aggregation: {list(spec)}")
+    return result
+
+
+def _agg_terms(searcher, spec, sub, docs):
+    groups = defaultdict(set)
+    for d in docs:
+        value = searcher.value(spec["field"], d)
+        if value is not None:
+            groups[value].add(d)
+    buckets = []
+    for key, members in groups.items():
+        bucket = {"key": key, "doc_count": len(members)}
+        bucket.update(aggregate(searcher, sub, members))
+        buckets.append(bucket)
+    order = spec.get("order", {"_count": "desc"})
+    (order_key, direction), = (order if isinstance(order, dict) else order[0]).items()
+    if order_key == "_count":
+        sort_key = lambda b: b["doc_count"]
+    elif order_key == "_key":
+        sort_key = lambda b: b["key"]
+    else:
+        sort_key = lambda b: b[order_key]["value"] or 0
+    buckets.sort(key=sort_key, reverse=direction == "desc")
+    size = spec.get("size", 10)
+    return {"doc_count_error_upper_bound": 0,
+            "sum_other_doc_count": sum(b["doc_count"] for b in buckets[size:]),
+            "buckets": buckets[:size]}
+
+
+def _agg_composite(searcher, spec, sub, docs):
+    # Only `terms` sources, ascending; missing values sort first, like Elasticsearch.
+    sources = []
+    for source in spec["sources"]:
+        (name, kinds), = source.items()
+        if set(kinds) != {"terms"}:
+            raise LocalQueryError(f"Unsupported composite source: {list(kinds)}")
+        sources.append((name, kinds["terms"]["field"], kinds["terms"].get("missing_bucket", False)))
+    groups = defaultdict(set)
+    for d in docs:
+        key = tuple(searcher.value(field, d) for _, field, _ in sources)
+        if all(v is not None or missing for v, (_, _, missing) in zip(key, sources)):
+            groups[key].add(d)
+    order = lambda key: tuple((v is not None, v if v is not None else "") for v in key)
+    keys = sorted(groups, key=order)
+    after = spec.get("after")
+    if after:
+        marker = order(tuple(after.get(name) for name, _, _ in sources))
+        keys = [k for k in keys if order(k) > marker]
+    buckets = []
+    for key in keys[:spec.get("size", 10)]:
+        bucket = {"key": {name: v for (name, _, _), v in zip(sources, key)}, "doc_count": len(groups[key])}
+        bucket.update(aggregate(searcher, sub, groups[key]))
+        buckets.append(bucket)
+    result = {"buckets": buckets}
+    if buckets:
+        result["after_key"] = buckets[-1]["key"]
+    return result
+
+
+def _agg_histogram(searcher, spec, sub, docs):
+    interval = spec.get("calendar_interval") or spec.get("fixed_interval") or spec.get("interval")
+    groups = defaultdict(set)
+    for d in docs:
+        groups[_bucket_start(searcher.index.column("ts", d), interval)].add(d)
+    buckets = []
+    if groups:
+        key, last = min(groups), max(groups)
+        while key <= last:
+            members = groups.get(key, set())
+            bucket = {"key_as_string": iso(key), "key": key, "doc_count": len(members)}
+            bucket.update(aggregate(searcher, sub, members))
+            buckets.append(bucket)
+            key = _next_bucket(key, interval)
+    return {"buckets": buckets}
+
+
+# ------------------------------
+# Elasticsearch-compatible facade
+# ------------------------------
+def _sort_spec(body):
+    order = "asc"
+    for entry in body.get("sort", []):
+        (field, spec), = entry.items() if isinstance(entry, dict) else ((entry, "asc"),)
+        if field == "_shard_doc":
+            continue
+        if _field(field) != "@timestamp":
+            raise LocalQueryError(f"Unsupported sort field: {field}")
+        order = spec.get("order", "asc") if isinstance(spec, dict) else spec
+    return order
+
+
+def _source_filter(source, spec):
+    if spec is None or spec is True:
+        return source
+    if spec is False:
+        return {}
+    includes = spec if isinstance(spec, list) else spec.get("includes", []) if isinstance(spec, dict) else [spec]
+    if not includes:
+        return source
+    # A dotted include (`log.file.path`) keeps the whole object it points into.
+    return {k: v for k, v in source.items()
+            if any(fnmatch.fnmatch(k, pattern) or pattern.startswith(k + ".") for pattern in includes)}
+
+
+def run_search(index, body, size=10, limit=None):
+    """
+    Executes one search body and returns an Elasticsearch-shaped response.
+    """
+    started = time.perf_counter()
+    body = body or {}
+    searcher = _Searcher(index, limit)
+    docs = searcher.evaluate(body.get("query"), None)
+    if body.get("slice"):
+        # Sliced scrolls: documents are partitioned by id, like Elasticsearch does by _id hash.
+        part, parts = body["slice"]["id"], body["slice"]["max"]
+        docs = {d for d in docs if d % parts == part}
+    size = body.get("size", size)
+
+    hits = []
+    if size:
+        descending = _sort_spec(body) == "desc"
+        ts = index.column
+        ordered = sorted(docs, key=lambda d: (ts("ts", d), d), reverse=descending)
+        after = body.get("search_after")
+        if after:
+            marker = (int(after[0]), int(after[-1]) if len(after) > 1 else -1)
+            ordered = [d for d in ordered if ((ts("ts", d), d) < marker if descending else (ts("ts", d), d) > marker)]
+        for d in ordered[:size]:
+            hits.append({"_index": LOCAL_INDEX_NAME, "_id": str(d), "_score": None,
+                         "_source": _source_filter(index.source(d), body.get("_source")),
+                         "sort": [ts("ts", d), d]})
+
+    response = {
+        "took": int((time.perf_counter() - started) * 1000),
+        "timed_out": False,
+        "_shards": {"total": 1, "successful": 1, "skipped": 0, "failed": 0},
+        "hits": {"total": {"value": len(docs), "relation": "eq"}, "max_score": None, "hits": hits},
+    }
+    if body.get("aggs") or body.get("aggregations"):
+        response["aggregations"] = aggregate(searcher, body.get("aggs") or body.get("aggregations"), docs)
+    return response
+
+
+class LocalSearchClient:
+    """
+    Stand-in for AsyncElasticsearch backed by a LocalIndex.
+
+    Implements the client calls used by app.services.elastic. Queries run in a worker thread so
+    they do not block the event loop; point-in-time ids pin the document count at open time.
+    """
+
+    def __init__(self, directory, log_root=None, log_glob=None):
+        self.index = LocalIndex(directory)
+        self.log_root, self.log_glob = log_root, log_glob
+
+    def options(self, **kwargs):
+        return self
+
+    async def refresh(self):
+        """
+        Indexes newly appended data (if a log root is configured) and picks up updates
+        published by other processes.
+        """
+        if self.log_root:
+            stats = await asyncio.to_thread(self.index.update, self.log_root, self.log_glob)
+            if stats["docs_added"]:
+                logger.info(f"Local index updated: {stats}")
+        else:
+            await asyncio.to_thread(self.index.reload)
+
+    async def refresh_forever(self, interval):
+        """
+        Background task: refresh the index every `interval` seconds.
+        """
+        while True:
+            try:
+                await self.refresh()
+            except Exception as e:
+                logger.error(f"Local index refresh failed: {e}", exc_info=True)
+            await asyncio.sleep(interval)
+
+    async def search(self, index=None, body=None, size=10, **kwargs):
+        body = dict(body or {})
+        for key in ("query", "sort", "aggs", "search_after", "_source"):
+            if key in kwargs:
+                body[key] = kwargs[key]
+        limit = None
+        if "pit" in body:
+            limit = int(body["pit"]["id"].rsplit("-", 1)[1])
+        response = await asyncio.to_thread(run_search, self.index, body, size, limit)
+        if "pit" in body:
+            response["pit_id"] = body["pit"]["id"]
+        return response
+
+    async def msearch(self, searches=None, body=None, **kwargs):
+        lines = searches or body
+        responses = []
+        for body in lines[1::2]:
+            try:
+                responses.append(await self.search(body=body))
+            except LocalQueryError as e:
+                responses.append({"error": {"type": "local_query_error", "reason": str(e)}, "status": 400})
+        return {"took": 0, "responses": responses}
+
+    async def open_point_in_time(self, index=None, keep_alive=None, **kwargs):
+        return {"id": f"{LOCAL_INDEX_NAME}-{self.index.doc_count}"}
+
+    async def close_point_in_time(self, id=None, body=None, **kwargs):
+        return {"succeeded": True, "num_freed": 1}
+
+    async def field_caps(self, index=None, fields=None, **kwargs):
+        # Substring queries are answered from the token index whatever the field name.
+        return {"indices": [LOCAL_INDEX_NAME], "fields": {}}
+
+    async def ping(self, **kwargs):
+        return True
+
+    async def info(self, **kwargs):
+        return {"name": "local", "version": {"number": "local"}, "tagline": "local index"}
+
+    async def close(self):
+        self.index.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m app.services.local_index", description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=["build", "update", "info"])
+    parser.add_argument("root", nargs="?", help="Log directory to index")
+    parser.add_argument("--index-dir", required=True)
+    parser.add_argument("--glob", default="trainid_*/tests/ws/inference/workdir-inference-*/logmessages.txt")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+
+    index = LocalIndex(args.index_dir)
+    if args.command in ("build", "update"):
+        if not args.root:
+            parser.error("root is required for build/update")
+        started = time.perf_counter()
+        stats = index.update(args.root, args.glob)
+        logger.info(f"{args.command}: {stats} in {time.perf_counter() - started:.1f}s")
+    else:
+        print(json.dumps({"files": len(index.files), "docs": index.doc_count, "deleted": len(index.deleted),
+                          "segments": len(index.segments), "levels": index.levels}, indent=2))
+    index.close()
+
+
+if __name__ == "__main__":
+    main()
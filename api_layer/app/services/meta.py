@@ -0,0 +1,473 @@
+"""
+Per-train and per-test metadata, kept up to date in the background.
+
+Questions like "which tests belong to train X, over what time range, how many ERROR lines"
+would otherwise mean several aggregations over the raw logs. Instead, a background job keeps
+one record per `train_id` and one per `test_id` in SQLite (tests and files, line count,
+`log_level` counts, first/last `@timestamp`), and /meta/* answers with a single key lookup,
+cached in process.
+
+The job does not go by `@timestamp`, because backfills index old lines long after they were
+written. Each run reads the document count of every index. For each index whose count changed,
+it lists the (train_id, test_id) pairs with their counts (a paged `composite` aggregation) and
+compares them with the census stored for that index. The pairs whose count moved are counted
+again over all indices, and the records of their trains and tests are rebuilt from the stored
+pairs. An index removed by retention takes its pairs' counts with it the same way.
+
+Only one process runs the job: every API worker tries to take a lease row in the store, and
+the holder renews it as it makes progress. The other workers only read.
+"""
+from datetime import datetime, timezone
+from app.services.cache import MemoryBackend
+from app.services.elastic import agg_search
+from app.config import settings
+import asyncio
+import json
+import logging
+import os
+import socket
+import sqlite3
+import time
+
+# ------------------------------
+# Logging setup
+# ------------------------------
+logger = logging.getLogger("api_layer")
+
+# Buckets per page of a composite aggregation.
+COMPOSITE_PAGE = 1000
+# Tests counted per query when pairs are recomputed.
+TESTS_PER_QUERY = 200
+# Indices matched by settings.index_pattern; more is an error rather than a partial census.
+MAX_INDICES = 10000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta_ids (
+    kind TEXT NOT NULL,
+    id TEXT NOT NULL,
+    doc TEXT NOT NULL,
+    PRIMARY KEY (kind, id)
+);
+CREATE TABLE IF NOT EXISTS meta_pairs (
+    train_id TEXT NOT NULL,
+    test_id TEXT NOT NULL,
+    doc TEXT NOT NULL,
+    PRIMARY KEY (train_id, test_id)
+);
+CREATE INDEX IF NOT EXISTS meta_pairs_test ON meta_pairs (test_id);
+CREATE TABLE IF NOT EXISTS meta_census (
+    idx TEXT NOT NULL,
+    train_id TEXT NOT NULL,
+    test_id TEXT NOT NULL,
+    docs INTEGER NOT NULL,
+    PRIMARY KEY (idx, train_id, test_id)
+);
+CREATE TABLE IF NOT EXISTS meta_indices (
+    idx TEXT PRIMARY KEY,
+    docs INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS meta_lease (
+    name TEXT PRIMARY KEY,
+    owner TEXT NOT NULL,
+    expires_at REAL NOT NULL,
+    updated_at REAL
+);
+"""
+
+
+def empty_record():
+    return {"first": None, "last": None, "lines": 0, "levels": {}, "files": {}}
+
+
+def merge(record, delta):
+    """
+    Adds the counts of `delta` (same shape as empty_record(), plus optional `tests` or
+    `train_ids` lists) to `record`, in place.
+    """
+    if delta["first"] is not None and (record["first"] is None or delta["first"] < record["first"]):
+        record["first"] = delta["first"]
+    if delta["last"] is not None and (record["last"] is None or delta["last"] > record["last"]):
+        record["last"] = delta["last"]
+    record["lines"] += delta["lines"]
+    for level, count in delta["levels"].items():
+        record["levels"][level] = record["levels"].get(level, 0) + count
+    for name, file in delta["files"].items():
+        merge(record["files"].setdefault(name, empty_record()), file)
+    for key in ("tests", "train_ids"):
+        if key in delta:
+            record[key] = sorted(set(record.get(key, [])) | set(delta[key]))
+    return record
+
+
+class MetaStore:
+    """
+    Metadata records per (kind, id), the per-pair counts they are built from, the per-index
+    census and the job lease (SQLite, WAL mode so every API worker can share the file).
+    """
+
+    def __init__(self, path):
+        self.path = path
+        # Autocommit mode: writes open their own BEGIN IMMEDIATE transaction.
+        self._db = sqlite3.connect(path, check_same_thread=False, timeout=30, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        with self._db:
+            self._db.execute("BEGIN IMMEDIATE")
+            if self._db.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'meta_state'").fetchone():
+                # Records of the former @timestamp-watermark job; rebuilt from the census.
+                self._db.execute("DROP TABLE meta_state")
+                self._db.execute("DROP TABLE IF EXISTS meta_ids")
+        self._db.executescript(SCHEMA)
+
+    def get(self, kind, id_value):
+        row = self._db.execute("SELECT doc FROM meta_ids WHERE kind = ? AND id = ?", (kind, id_value)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def count(self, kind):
+        return self._db.execute("SELECT COUNT(*) FROM meta_ids WHERE kind = ?", (kind,)).fetchone()[0]
+
+    def lease(self):
+        """
+        Returns:
+            tuple: (owner, expires_at, updated_at) or None if the job never ran.
+        """
+        return self._db.execute("SELECT owner, expires_at, updated_at FROM meta_lease WHERE name = 'job'").fetchone()
+
+    def _holds(self, owner):
+        row = self.lease()
+        return row is not None and row[0] == owner and row[1] > time.time()
+
+    def acquire(self, owner, ttl):
+        """
+        Takes or renews the job lease for `ttl` seconds.
+
+        Returns:
+            bool: False if another process holds an unexpired lease.
+        """
+        with self._db:
+            self._db.execute("BEGIN IMMEDIATE")
+            row = self.lease()
+            if row is not None and row[0] != owner and row[1] > time.time():
+                return False
+            self._db.execute(
+                "INSERT INTO meta_lease (name, owner, expires_at, updated_at) VALUES ('job', ?, ?, NULL) "
+                "ON CONFLICT (name) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at",
+                (owner, time.time() + ttl))
+        return True
+
+    def finished(self, owner):
+        with self._db:
+            self._db.execute("UPDATE meta_lease SET updated_at = ? WHERE name = 'job' AND owner = ?", (time.time(), owner))
+
+    def release(self, owner):
+        with self._db:
+            self._db.execute("UPDATE meta_lease SET expires_at = 0 WHERE name = 'job' AND owner = ?", (owner,))
+
+    def indices(self):
+        return dict(self._db.execute("SELECT idx, docs FROM meta_indices"))
+
+    def census(self, index):
+        rows = self._db.execute("SELECT train_id, test_id, docs FROM meta_census WHERE idx = ?", (index,))
+        return {(train_id, test_id): docs for train_id, test_id, docs in rows}
+
+    def apply(self, owner, index, docs, census, pairs):
+        """
+        Stores the census of one index and the recomputed pairs, and rebuilds the records of
+        every train and test they touch.
+
+        Args:
+            owner (str): Lease holder; nothing is written if the lease was lost.
+            index (str): The index the census belongs to.
+            docs (int): Document count of the index, or None if it no longer exists.
+            census (dict): {(train_id, test_id): docs} in `index`.
+            pairs (dict): {(train_id, test_id): record}, None for pairs without documents left.
+
+        Returns:
+            bool: False if `owner` no longer holds the lease.
+        """
+        with self._db:
+            self._db.execute("BEGIN IMMEDIATE")
+            if not self._holds(owner):
+                return False
+            self._db.execute("DELETE FROM meta_census WHERE idx = ?", (index,))
+            self._db.executemany("INSERT INTO meta_census (idx, train_id, test_id, docs) VALUES (?, ?, ?, ?)",
+                                 [(index, train_id, test_id, n) for (train_id, test_id), n in census.items()])
+            if docs is None:
+                self._db.execute("DELETE FROM meta_indices WHERE idx = ?", (index,))
+            else:
+                self._db.execute("INSERT OR REPLACE INTO meta_indices (idx, docs) VALUES (?, ?)", (index, docs))
+            for (train_id, test_id), record in pairs.items():
+                if record is None:
+                    self._db.execute("DELETE FROM meta_pairs WHERE train_id = ? AND test_id = ?", (train_id, test_id))
+                else:
+                    self._db.execute("INSERT OR REPLACE INTO meta_pairs (train_id, test_id, doc) VALUES (?, ?, ?)",
+                                     (train_id, test_id, json.dumps(record)))
+            for train_id in {train_id for train_id, _ in pairs}:
+                self._rebuild("train", train_id)
+            for test_id in {test_id for _, test_id in pairs}:
+                self._rebuild("test", test_id)
+        return True
+
+    def _rebuild(self, kind, id_value):
+        rows = self._db.execute(f"SELECT train_id, test_id, doc FROM meta_pairs WHERE {kind}_id = ?", (id_value,)).fetchall()
+        if not rows:
+            self._db.execute("DELETE FROM meta_ids WHERE kind = ? AND id = ?", (kind, id_value))
+            return
+        record = empty_record()
+        for train_id, test_id, doc in rows:
+            pair = json.loads(doc)
+            if kind == "train":
+                merge(record, dict(pair, tests=[test_id], files={f"{test_id}/{name}": f for name, f in pair["files"].items()}))
+            else:
+                merge(record, dict(pair, train_ids=[train_id]))
+        self._db.execute("INSERT OR REPLACE INTO meta_ids (kind, id, doc) VALUES (?, ?, ?)",
+                         (kind, id_value, json.dumps(record)))
+
+    def clear(self):
+        with self._db:
+            for table in ("meta_ids", "meta_pairs", "meta_census", "meta_indices", "meta_lease"):
+                self._db.execute(f"DELETE FROM {table}")
+
+    def close(self):
+        self._db.close()
+
+
+_store = None
+_cache = None
+_task = None
+# Lease owner of this process.
+_owner = f"{socket.gethostname()}:{os.getpid()}"
+
+
+def get_store():
+    global _store
+    if _store is None:
+        _store = MetaStore(settings.meta_db)
+    return _store
+
+
+async def _composite(index, body):
+    """
+    Yields every bucket of the `pairs` composite aggregation in `body`, page by page.
+    """
+    composite = body["aggs"]["pairs"]["composite"]
+    while True:
+        res = await agg_search(index, body)
+        agg = res.get("aggregations", {}).get("pairs", {})
+        buckets = agg.get("buckets", [])
+        for bucket in buckets:
+            yield bucket
+        if not buckets or "after_key" not in agg:
+            return
+        composite["after"] = agg["after_key"]
+
+
+async def _index_counts():
+    """
+    Returns:
+        dict: {index: docs} for every index matching settings.index_pattern.
+    """
+    body = {"size": 0, "aggs": {"indices": {"terms": {"field": "_index", "size": MAX_INDICES}}}}
+    res = await agg_search(settings.index_pattern, body)
+    indices = res.get("aggregations", {}).get("indices", {"buckets": [], "sum_other_doc_count": 0})
+    if indices["sum_other_doc_count"]:
+        raise RuntimeError(f"{settings.index_pattern} matches more than {MAX_INDICES} indices")
+    return {b["key"]: b["doc_count"] for b in indices["buckets"]}
+
+
+async def _census(index):
+    """
+    Returns:
+        dict: {(train_id, test_id): docs} of one index.
+    """
+    body = {"size": 0, "aggs": {"pairs": {"composite": {"size": COMPOSITE_PAGE, "sources": [
+        {"train_id": {"terms": {"field": "train_id.keyword"}}},
+        {"test_id": {"terms": {"field": "test_id.keyword"}}},
+    ]}}}}
+    return {(b["key"]["train_id"], b["key"]["test_id"]): b["doc_count"] async for b in _composite(index, body)}
+
+
+async def _pairs(test_ids):
+    """
+    Counts the documents of `test_ids` over all indices, per file and log level.
+
+    Returns:
+        dict: {(train_id, test_id): record} for every pair that has documents.
+    """
+    body = {
+        "size": 0,
+        "query": {"bool": {"filter": [{"terms": {"test_id.keyword": test_ids}}]}},
+        "aggs": {"pairs": {
+            "composite": {"size": COMPOSITE_PAGE, "sources": [
+                {"train_id": {"terms": {"field": "train_id.keyword"}}},
+                {"test_id": {"terms": {"field": "test_id.keyword"}}},
+                {"file": {"terms": {"field": "file_name.keyword", "missing_bucket": True}}},
+                {"level": {"terms": {"field": "log_level.keyword", "missing_bucket": True}}},
+            ]},
+            "aggs": {
+                "first": {"min": {"field": "@timestamp"}},
+                "last": {"max": {"field": "@timestamp"}},
+            },
+        }},
+    }
+    pairs = {}
+    async for bucket in _composite(settings.index_pattern, body):
+        key = bucket["key"]
+        delta = {
+            "first": bucket["first"]["value"],
+            "last": bucket["last"]["value"],
+            "lines": bucket["doc_count"],
+            "levels": {key["level"]: bucket["doc_count"]} if key["level"] is not None else {},
+            "files": {},
+        }
+        record = pairs.setdefault((key["train_id"], key["test_id"]), empty_record())
+        merge(record, dict(delta, files={key["file"]: delta}) if key["file"] is not None else delta)
+    return pairs
+
+
+async def update(owner=_owner):
+    """
+    Brings the stored records in line with the indices, if this process holds the job lease.
+
+    Indices are handled one at a time and each is saved on its own, so progress survives
+    restarts; the first run counts every pair of every index.
+
+    Returns:
+        int: Pairs recomputed by this call, or None if another process runs the job.
+    """
+    store = get_store()
+    ttl = settings.meta_lease_seconds
+    if not await asyncio.to_thread(store.acquire, owner, ttl):
+        return None
+    counts = await _index_counts()
+    stored = await asyncio.to_thread(store.indices)
+    recomputed = 0
+    for index in sorted(set(counts) | set(stored)):
+        if counts.get(index) == stored.get(index):
+            continue
+        census = await _census(index) if index in counts else {}
+        previous = await asyncio.to_thread(store.census, index)
+        moved = {pair for pair in set(census) | set(previous) if census.get(pair) != previous.get(pair)}
+        test_ids = sorted({test_id for _, test_id in moved})
+        pairs = {}
+        for start in range(0, len(test_ids), TESTS_PER_QUERY):
+            if not await asyncio.to_thread(store.acquire, owner, ttl):
+                return None
+            pairs.update(await _pairs(test_ids[start:start + TESTS_PER_QUERY]))
+        for pair in moved:
+            pairs.setdefault(pair, None)
+        if not await asyncio.to_thread(store.apply, owner, index, counts.get(index), census, pairs):
+            logger.warning("Metadata job lease was lost during an update; another worker took over")
+            return None
+        recomputed += len(pairs)
+    await asyncio.to_thread(store.finished, owner)
+    return recomputed
+
+
+async def _run():
+    while True:
+        started = time.perf_counter()
+        try:
+            recomputed = await update()
+            if recomputed:
+                logger.info(f"Metadata updated for {recomputed} train/test pairs in {time.perf_counter() - started:.2f}s")
+        except Exception as e:
+            logger.error(f"Metadata update failed: {e}")
+        await asyncio.sleep(settings.meta_refresh_seconds)
+
+
+def start():
+    """
+    Starts the background update job; called on startup. Every worker starts it, and only
+    the one holding the lease does any work.
+    """
+    global _task, _cache
+    _cache = MemoryBackend(settings.cache_max_entries)
+    if settings.meta_enabled and _task is None:
+        _task = asyncio.create_task(_run())
+
+
+async def stop():
+    global _task
+    if _task is not None:
+        _task.cancel()
+        await asyncio.gather(_task, return_exceptions=True)
+        _task = None
+        # Let another worker take over without waiting for the lease to expire.
+        await asyncio.to_thread(get_store().release, _owner)
+    if _store is not None:
+        _store.close()
+
+
+def _iso(millis):
+    if millis is None:
+        return None
+    return datetime.fromtimestamp(millis / 1000, tz=timezone.utc).isoformat(timespec="milliseconds").replace("+00:00", "Z")
+
+
+def render(kind, id_value, record, updated_at):
+    """
+    API shape of a stored record: timestamps as ISO strings, files as a list.
+    """
+    out = {f"{kind}_id": id_value}
+    if kind == "train":
+        out["tests"] = record.get("tests", [])
+    else:
+        out["train_ids"] = record.get("train_ids", [])
+    out.update({
+        "first_timestamp": _iso(record["first"]),
+        "last_timestamp": _iso(record["last"]),
+        "lines": record["lines"],
+        "levels": record["levels"],
+        "files": [
+            {"file": name, "lines": f["lines"], "levels": f["levels"],
+             "first_timestamp": _iso(f["first"]), "last_timestamp": _iso(f["last"])}
+            for name, f in sorted(record["files"].items())
+        ],
+        "updated_at": _iso(updated_at * 1000) if updated_at else None,
+    })
+    return out
+
+
+async def lookup(kind, id_value):
+    """
+    Metadata of one train or test.
+
+    Args:
+        kind (str): "train" or "test".
+        id_value (str): The train or test ID.
+
+    Returns:
+        dict: The record as returned by render(), or None if the ID has no documents yet.
+    """
+    key = f"{kind}:{id_value}"
+    if _cache is not None:
+        cached = await _cache.get(key)
+        if cached is not None:
+            return cached
+    store = get_store()
+    record = await asyncio.to_thread(store.get, kind, id_value)
+    if record is None:
+        return None
+    row = await asyncio.to_thread(store.lease)
+    result = render(kind, id_value, record, row[2] if row else None)
+    if _cache is not None:
+        await _cache.set(key, result, settings.meta_cache_seconds)
+    return result
+
+
+async def describe():
+    """
+    Job state, for diagnostics.
+    """
+    store = get_store()
+    row = await asyncio.to_thread(store.lease)
+    updated_at = row[2] if row else None
+    return {
+        "enabled": settings.meta_enabled,
+        "owner": row[0] if row and row[1] > time.time() else None,
+        "updated_at": _iso(updated_at * 1000) if updated_at else None,
+        "updated_seconds_ago": round(time.time() - updated_at, 1) if updated_at else None,
+        "indices": len(await asyncio.to_thread(store.indices)),
+        "trains": await asyncio.to_thread(store.count, "train"),
+        "tests": await asyncio.to_thread(store.count, "test"),
+    }
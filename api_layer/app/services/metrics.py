@@ -0,0 +1,156 @@
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram, generate_latest
+from prometheus_client import multiprocess
+from app.config import settings
+import logging
+import os
+import time
+
+# ------------------------------
+# Logging setup
+# ------------------------------
+logger = logging.getLogger("api_layer")
+
+# Buckets span a cached /stats hit (~1ms) up to a cold wildcard scan over months of data.
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+SIZE_BUCKETS = (0, 1, 10, 100, 1_000, 10_000, 100_000, 1_000_000, 10_000_000, 100_000_000)
+
+# ------------------------------
+# HTTP metrics
+# ------------------------------
+HTTP_REQUESTS = Counter(
+    "triage_http_requests_total", "HTTP requests handled", ["method", "route", "status"]
+)
+HTTP_LATENCY = Histogram(
+    "triage_http_request_duration_seconds", "Wall time from request start to last response byte",
+    ["method", "route"], buckets=LATENCY_BUCKETS
+)
+HTTP_RESPONSE_BYTES = Histogram(
+    "triage_http_response_bytes", "Response body size in bytes", ["method", "route"], buckets=SIZE_BUCKETS
+)
+HTTP_IN_FLIGHT = Gauge(
+    "triage_http_requests_in_flight", "HTTP requests currently being handled", multiprocess_mode="livesum"
+)
+
+# ------------------------------
+# Elasticsearch metrics
+# ------------------------------
+ES_LATENCY = Histogram(
+    "triage_es_request_duration_seconds", "Client-side wall time of Elasticsearch calls",
+    ["query_type"], buckets=LATENCY_BUCKETS
+)
+ES_TOOK = Histogram(
+    "triage_es_took_seconds", "Server-side `took` reported by Elasticsearch",
+    ["query_type"], buckets=LATENCY_BUCKETS
+)
+ES_OVERHEAD = Histogram(
+    "triage_es_overhead_seconds", "Wall time minus `took`: network, queueing and (de)serialisation",
+    ["query_type"], buckets=LATENCY_BUCKETS
+)
+ES_HITS = Histogram(
+    "triage_es_hits", "Total hits reported per Elasticsearch call", ["query_type"], buckets=SIZE_BUCKETS
+)
+ES_ERRORS = Counter("triage_es_errors_total", "Failed Elasticsearch calls", ["query_type"])
+
+# ------------------------------
+# Query governor metrics
+# ------------------------------
+QUERY_PARTIAL = Counter(
+    "triage_query_partial_total", "Searches that returned partial results (timeout, terminate_after, shard failures)",
+    ["kind"]
+)
+QUERY_REJECTED = Counter(
+    "triage_query_rejected_total", "Searches refused by the query governor", ["kind", "reason"]
+)
+
+
+def observe_es(query_type, started, response=None):
+    """
+    Records one Elasticsearch call.
+
+    Args:
+        query_type (str): Label for the call site (e.g. "search", "agg", "pit", "msearch").
+        started (float): time.perf_counter() taken before the call.
+        response (dict): The raw response, or None if the call raised.
+    """
+    if not settings.metrics_enabled:
+        return
+    wall = time.perf_counter() - started
+    ES_LATENCY.labels(query_type).observe(wall)
+    if response is None:
+        ES_ERRORS.labels(query_type).inc()
+        return
+    took = response.get("took")
+    if took is not None:
+        took = took / 1000.0
+        ES_TOOK.labels(query_type).observe(took)
+        ES_OVERHEAD.labels(query_type).observe(max(wall - took, 0.0))
+    total = response.get("hits", {}).get("total")
+    if total is not None:
+        ES_HITS.labels(query_type).observe(total["value"] if isinstance(total, dict) else total)
+
+
+def render():
+    """
+    Returns the current metrics in Prometheus text format, with their content type.
+
+    Under gunicorn (see gunicorn.conf.py) every worker writes its samples to
+    PROMETHEUS_MULTIPROC_DIR, and any worker serving /metrics aggregates all of them.
+    """
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(), CONTENT_TYPE_LATEST
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware recording per-route latency, status, response size and in-flight requests.
+
+    Implemented at the ASGI level rather than with BaseHTTPMiddleware so streaming
+    responses (exports) are not buffered and the per-request cost stays at a few
+    microseconds. Routes are labelled by their path template (`/logs/train/{train_id}`),
+    never by the raw path, to keep label cardinality bounded.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._routes = None
+
+    def _route_label(self, scope):
+        endpoint = scope.get("endpoint")
+        if endpoint is None:
+            return "unmatched"
+        if self._routes is None:
+            self._routes = {
+                getattr(r, "endpoint", None): r.path for r in scope["app"].routes if hasattr(r, "path")
+            }
+        return self._routes.get(endpoint, "unmatched")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not settings.metrics_enabled:
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        status = 500
+        size = 0
+
+        async def send_wrapper(message):
+            nonlocal status, size
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif message["type"] == "http.response.body":
+                size += len(message.get("body", b""))
+            await send(message)
+
+        HTTP_IN_FLIGHT.inc()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            HTTP_IN_FLIGHT.dec()
+            route = self._route_label(scope)
+            method = scope["method"]
+            HTTP_REQUESTS.labels(method, route, str(status)).inc()
+            HTTP_LATENCY.labels(method, route).observe(time.perf_counter() - started)
+            HTTP_RESPONSE_BYTES.labels(method, route).observe(size)
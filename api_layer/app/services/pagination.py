@@ -0,0 +1,99 @@
+from elasticsearch import NotFoundError
+from app.services.elastic import open_pit, close_pit, pit_search
+import base64
+import hashlib
+import json
+import logging
+
+# ------------------------------
+# Logging setup
+# ------------------------------
+logger = logging.getLogger("api_layer")
+
+
+class InvalidCursor(ValueError):
+    """
+    Raised when a pagination cursor is malformed, belongs to a different query,
+    or refers to a point-in-time context that has expired.
+    """
+
+
+def _fingerprint(body):
+    """
+    Short stable hash of a query body, used to bind a cursor to the query that issued it.
+    """
+    canonical = json.dumps(body, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha1(canonical.encode()).hexdigest()[:16]
+
+
+def encode_cursor(pit_id, search_after, body):
+    """
+    Packs a PIT id and the sort values of the last hit into an opaque, URL-safe token.
+    """
+    state = {"pit": pit_id, "after": search_after, "q": _fingerprint(body)}
+    raw = json.dumps(state, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor, body):
+    """
+    Unpacks a token produced by encode_cursor().
+
+    Returns:
+        tuple: (pit_id, search_after)
+
+    Raises:
+        InvalidCursor: If the token is malformed or was issued for a different query.
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        state = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        pit_id, search_after, fingerprint = state["pit"], state["after"], state["q"]
+    except Exception:
+        raise InvalidCursor("Malformed cursor")
+    if fingerprint != _fingerprint(body):
+        raise InvalidCursor("Cursor does not match this query")
+    return pit_id, search_after
+
+
+async def search_page(index_pattern, body, size, cursor=None, kind=None):
+    """
+    Fetches one page of results, resuming from `cursor` if given.
+
+    The first page opens a point-in-time context; each later page costs the same as
+    the first because it resumes with search_after instead of re-sorting from the top.
+    The PIT is released as soon as a short (final) page is returned.
+
+    Args:
+        index_pattern (str): The index or pattern to search (first page only).
+        body (dict): Query DSL body with `query` and `sort`.
+        size (int): Page size.
+        cursor (str): Token returned as `next_cursor` by the previous page.
+        kind (str): Query governor kind for the page search (see app.services.governor).
+
+    Returns:
+        tuple: (raw Elasticsearch response, next_cursor or None)
+
+    Raises:
+        InvalidCursor: If the cursor is malformed, mismatched or expired.
+    """
+    if cursor:
+        pit_id, search_after = decode_cursor(cursor, body)
+    else:
+        pit_id, search_after = await open_pit(index_pattern), None
+
+    try:
+        res = await pit_search(pit_id, body, size, search_after=search_after, kind=kind)
+    except NotFoundError:
+        raise InvalidCursor("Cursor has expired")
+    except Exception:
+        if not cursor:
+            await close_pit(pit_id)
+        raise
+
+    pit_id = res.get("pit_id", pit_id)
+    hits = res.get("hits", {}).get("hits", [])
+    if not hits or len(hits) < size:
+        await close_pit(pit_id)
+        return res, None
+    return res, encode_cursor(pit_id, hits[-1]["sort"], body)
@@ -0,0 +1,71 @@
+from app.services.elastic import get_client
+from app.config import settings
+import logging
+import time
+
+# ------------------------------
+# Logging setup
+# ------------------------------
+logger = logging.getLogger("api_layer")
+
+# Fallback used until every backing index maps the dedicated substring field.
+KEYWORD_FIELD = "message.keyword"
+WILDCARD_FIELD = "message.wildcard"
+
+_substring_field = None
+_resolved_at = 0.0
+
+
+async def resolve_substring_field():
+    """
+    Chooses the field used for `*pattern*` substring queries.
+
+    `message.wildcard` (a `wildcard`-typed subfield, see ilm/api_index_template.txt) is used
+    once every index matched by settings.index_pattern maps it; until then queries fall back to
+    `message.keyword`, which is slower and skips messages longer than its `ignore_above`.
+    The choice is cached for settings.substring_field_refresh seconds, and can be pinned with
+    settings.substring_field.
+    """
+    global _substring_field, _resolved_at
+    if settings.substring_field:
+        return settings.substring_field
+    if _substring_field and time.monotonic() - _resolved_at < settings.substring_field_refresh:
+        return _substring_field
+
+    field = KEYWORD_FIELD
+    try:
+        caps = await get_client().field_caps(index=settings.index_pattern, fields=WILDCARD_FIELD)
+        types = caps.get("fields", {}).get(WILDCARD_FIELD, {})
+        # `indices` is only listed when the field is missing from, or typed differently in, some indices.
+        if set(types) == {"wildcard"} and "indices" not in types["wildcard"]:
+            field = WILDCARD_FIELD
+    except Exception as e:
+        logger.warning(f"Could not resolve substring field, using {field}: {e}")
+
+    if field != _substring_field:
+        logger.info(f"Substring queries will use '{field}'")
+    _substring_field, _resolved_at = field, time.monotonic()
+    return field
+
+
+async def substring_clause(pattern):
+    """
+    Builds the `*pattern*` substring clause against the best available message field.
+    """
+    field = await resolve_substring_field()
+    return {"wildcard": {field: f"*{pattern}*"}}
+
+
+def time_range_filter(days, align_seconds=None):
+    """
+    Builds the `@timestamp >= now - days` filter.
+
+    With align_seconds, the lower bound is rounded down to a multiple of that many
+    seconds and sent as an absolute epoch_millis value. Requests issued within the same
+    bucket then produce identical bodies, which is what the result cache keys on.
+    """
+    if not align_seconds:
+        return {"range": {"@timestamp": {"gte": f"now-{days}d"}}}
+    start = int(time.time()) - days * 86400
+    start -= start % align_seconds
+    return {"range": {"@timestamp": {"gte": start * 1000, "format": "epoch_millis"}}}
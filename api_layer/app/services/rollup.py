@@ -0,0 +1,77 @@
+from app.services.cache import cached_agg_search, cache_ttl
+from app.services.governor import is_partial
+from app.services.queries import time_range_filter
+from app.config import settings
+import logging
+
+# ------------------------------
+# Logging setup
+# ------------------------------
+logger = logging.getLogger("api_layer")
+
+# Fields the rollup transform groups by (see ilm/api_rollup_transform.txt).
+ROLLUP_FIELDS = ("log_level", "train_id", "test_id", "file_name")
+
+
+def rollup_filters(days, log_level=None, train_id=None, test_id=None, file_name=None, align_seconds=None):
+    """
+    Builds the filter clauses for a rollup query. Rollup fields are plain keywords.
+    """
+    filters = [time_range_filter(days, align_seconds)]
+    for field, value in (("log_level", log_level), ("train_id", train_id),
+                         ("test_id", test_id), ("file_name", file_name)):
+        if value:
+            filters.append({"term": {field: value}})
+    return filters
+
+
+async def rollup_timeline(days, interval="day", log_level=None, train_id=None, test_id=None, file_name=None):
+    """
+    Line counts over time from the hourly rollup index.
+
+    Returns:
+        dict: `{"errors_over_time": {"buckets": [...]}, "partial": bool}`, shaped like the raw
+        date_histogram response, with `doc_count` holding the number of log lines in each bucket.
+    """
+    body = {
+        "size": 0,
+        "query": {"bool": {"filter": rollup_filters(days, log_level, train_id, test_id, file_name,
+                                                    cache_ttl("rollup"))}},
+        "aggs": {
+            "errors_over_time": {
+                "date_histogram": {"field": "@timestamp", "calendar_interval": interval},
+                "aggs": {"lines": {"sum": {"field": "count"}}}
+            }
+        }
+    }
+    res = await cached_agg_search("rollup", settings.rollup_index, body)
+    buckets = res.get('aggregations', {}).get('errors_over_time', {}).get('buckets', [])
+    return {"errors_over_time": {"buckets": [
+        {"key_as_string": b.get("key_as_string"), "key": b["key"], "doc_count": int(b["lines"]["value"])}
+        for b in buckets
+    ]}, "partial": is_partial(res)}
+
+
+async def rollup_counts(group_by, days, size=100, log_level=None, train_id=None, test_id=None, file_name=None):
+    """
+    Total line counts per `group_by` value from the hourly rollup index, largest first.
+
+    Returns:
+        tuple: (buckets, partial), buckets being `{"key": ..., "doc_count": lines}`.
+    """
+    if group_by not in ROLLUP_FIELDS:
+        raise ValueError(f"Cannot group rollup by '{group_by}'")
+    body = {
+        "size": 0,
+        "query": {"bool": {"filter": rollup_filters(days, log_level, train_id, test_id, file_name,
+                                                    cache_ttl("rollup"))}},
+        "aggs": {
+            "groups": {
+                "terms": {"field": group_by, "size": size, "order": {"lines": "desc"}},
+                "aggs": {"lines": {"sum": {"field": "count"}}}
+            }
+        }
+    }
+    res = await cached_agg_search("rollup", settings.rollup_index, body)
+    buckets = res.get('aggregations', {}).get('groups', {}).get('buckets', [])
+    return [{"key": b["key"], "doc_count": int(b["lines"]["value"])} for b in buckets], is_partial(res)
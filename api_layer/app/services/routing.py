@@ -0,0 +1,220 @@
+"""
+Time- and ID-bounded index routing.
+
+Rollover (see ilm/api_cs1_policy.txt) splits the logs into many backing indices, and a
+query against settings.index_pattern fans out to the shards of every one of them. This
+module keeps a map from each backing index to its `@timestamp` range and the
+`train_id` / `test_id` values it holds. Queries are then sent only to the indices that can
+match.
+
+Only indices that are no longer written to are ever skipped. The write alias and its
+current index are always searched, and an index rolled over since the last refresh is
+still in the map under its own name, so newly indexed documents cannot be missed. Routing
+falls back to the full pattern whenever the map is unavailable.
+"""
+from app.services.elastic import get_client
+from app.config import settings
+import asyncio
+import logging
+import time
+
+# ------------------------------
+# Logging setup
+# ------------------------------
+logger = logging.getLogger("api_layer")
+
+# ID fields whose values are tracked per index; other filters route by time only.
+ROUTED_FIELDS = ("train_id", "test_id")
+# Indices per ID aggregation request, to bound the size of each response.
+ID_CHUNK = 20
+
+
+class IndexMap:
+    """
+    Snapshot of the backing indices behind settings.index_pattern.
+
+    Attributes:
+        write_index (str): Concrete index behind the write alias when the map was built.
+        indices (dict): index -> {"docs", "min", "max"} (epoch millis) plus, for indices no
+            longer written to, a set of values per ROUTED_FIELDS entry (None if too many).
+    """
+
+    def __init__(self, write_index, indices):
+        self.write_index = write_index
+        self.indices = indices
+
+    def select(self, since=None, ids=None):
+        """
+        Returns the indices that can hold documents newer than `since` (epoch millis) with
+        all the given ID values.
+        """
+        selected = []
+        for name, entry in self.indices.items():
+            if name == self.write_index:
+                continue
+            if since is not None and entry["max"] is not None and entry["max"] < since:
+                continue
+            if ids and any(entry.get(field) is not None and value not in entry[field]
+                           for field, value in ids.items()):
+                continue
+            selected.append(name)
+        return selected
+
+
+_map = None
+_refreshed_at = 0.0
+_refresh_task = None
+
+
+def _enabled():
+    return settings.routing_enabled and settings.search_backend != "local"
+
+
+async def _write_index(client):
+    aliases = await client.indices.get_alias(name=settings.write_alias)
+    names = list(aliases)
+    for name, spec in aliases.items():
+        if spec.get("aliases", {}).get(settings.write_alias, {}).get("is_write_index"):
+            return name
+    return names[0] if len(names) == 1 else None
+
+
+async def _index_ranges(client):
+    body = {
+        "size": 0,
+        "aggs": {"indices": {
+            "terms": {"field": "_index", "size": settings.routing_max_indices},
+            "aggs": {"min": {"min": {"field": "@timestamp"}}, "max": {"max": {"field": "@timestamp"}}},
+        }},
+    }
+    res = await client.search(index=settings.index_pattern, body=body)
+    return {
+        b["key"]: {"docs": b["doc_count"], "min": b["min"]["value"], "max": b["max"]["value"]}
+        for b in res["aggregations"]["indices"]["buckets"]
+    }
+
+
+async def _index_ids(client, names):
+    """
+    Collects the ID values of each index in `names`. A field with more than
+    settings.routing_max_ids values in an index is recorded as None (not routable).
+    """
+    aggs = {
+        field: {"terms": {"field": f"{field}.keyword", "size": settings.routing_max_ids}}
+        for field in ROUTED_FIELDS
+    }
+    body = {"size": 0, "aggs": {"indices": {"terms": {"field": "_index", "size": len(names)}, "aggs": aggs}}}
+    res = await client.search(index=",".join(names), body=body)
+    ids = {}
+    for bucket in res["aggregations"]["indices"]["buckets"]:
+        ids[bucket["key"]] = {
+            field: None if bucket[field]["sum_other_doc_count"] else {b["key"] for b in bucket[field]["buckets"]}
+            for field in ROUTED_FIELDS
+        }
+    return ids
+
+
+async def refresh():
+    """
+    Rebuilds the index map.
+
+    Time ranges are re-read for every index in one aggregation (cheap: min/max come from the
+    points index). ID sets are only collected when an index stops being written to, or its
+    document count changes, so a refresh costs one small request in the steady state.
+
+    Returns:
+        bool: True if the map was rebuilt. False, without touching the cluster, when routing
+        is disabled or the backend is local.
+    """
+    global _map, _refreshed_at
+    if not _enabled():
+        return False
+    started = time.perf_counter()
+    _refreshed_at = time.monotonic()
+    try:
+        client = get_client()
+        write_index = await _write_index(client)
+        indices = await _index_ranges(client)
+        previous = _map.indices if _map else {}
+        stale = []
+        for name, entry in indices.items():
+            if name == write_index:
+                continue
+            known = previous.get(name)
+            if known and known["docs"] == entry["docs"] and all(f in known for f in ROUTED_FIELDS):
+                entry.update({f: known[f] for f in ROUTED_FIELDS})
+            else:
+                stale.append(name)
+        for i in range(0, len(stale), ID_CHUNK):
+            for name, ids in (await _index_ids(client, stale[i:i + ID_CHUNK])).items():
+                indices[name].update(ids)
+    except Exception as e:
+        logger.warning(f"Index routing map refresh failed, keeping the previous one: {e}")
+        return False
+
+    if write_index is None:
+        logger.warning(f"No write index behind alias '{settings.write_alias}'; routing disabled")
+        _map = None
+        return False
+    _map = IndexMap(write_index, indices)
+    logger.info(f"Index routing map refreshed: {len(indices)} indices, write index '{write_index}', "
+                f"{len(stale)} re-scanned for IDs in {time.perf_counter() - started:.2f}s")
+    return True
+
+
+async def route(days=None, since=None, **ids):
+    """
+    Chooses the indices a query needs to search.
+
+    Args:
+        days (int): Look-back window of the query, in days.
+        since (int): Lower `@timestamp` bound in epoch millis; overrides `days`.
+        **ids: Exact ID filters of the query, e.g. `train_id="..."`. Fields other than
+            ROUTED_FIELDS are ignored.
+
+    Returns:
+        str: A comma-separated index list for the `index` parameter, or
+        settings.index_pattern when routing is disabled or would not narrow the search.
+    """
+    global _refresh_task
+    if not _enabled():
+        return settings.index_pattern
+    if time.monotonic() - _refreshed_at >= settings.routing_refresh_seconds:
+        # Requests keep using the current map while a refresh runs in the background.
+        if _refresh_task is None or _refresh_task.done():
+            _refresh_task = asyncio.create_task(refresh())
+        if _map is None:
+            await asyncio.shield(_refresh_task)
+    if _map is None:
+        return settings.index_pattern
+
+    if since is None and days:
+        since = int((time.time() - days * 86400) * 1000)
+    if since is not None:
+        # Allow for clock skew between this host and the cluster.
+        since -= settings.routing_refresh_seconds * 1000
+    ids = {field: value for field, value in ids.items() if field in ROUTED_FIELDS and value}
+    selected = _map.select(since, ids)
+    if len(selected) == len(_map.indices) - (_map.write_index in _map.indices):
+        return settings.index_pattern
+    indices = [settings.write_alias, _map.write_index] + selected
+    logger.debug(f"Routed query (since={since}, ids={ids}) to {len(indices) - 1} of {len(_map.indices)} indices")
+    return ",".join(indices)
+
+
+def describe():
+    """
+    Summary of the current map, for diagnostics.
+    """
+    if _map is None:
+        return {"enabled": _enabled(), "indices": None}
+    return {
+        "enabled": _enabled(),
+        "write_index": _map.write_index,
+        "refreshed_seconds_ago": round(time.monotonic() - _refreshed_at, 1),
+        "indices": {
+            name: {"docs": e["docs"], "min": e["min"], "max": e["max"],
+                   **{f: (len(e[f]) if e.get(f) is not None else None) for f in ROUTED_FIELDS if f in e}}
+            for name, e in sorted(_map.indices.items())
+        },
+    }
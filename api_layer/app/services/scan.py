@@ -0,0 +1,332 @@
+"""
+Parallel sliced scans for whole-corpus jobs.
+
+scan_sorted() (app.services.elastic) reads one `search_after` stream, which Elasticsearch
+serves from one search thread at a time. For jobs that must read every retained document
+(recounting a new failure signature, backfilling a derived index), this module opens one
+point in time and splits it with `slice`. Each slice is paged with `search_after` on
+`_shard_doc` by a separate worker process with its own client, so throughput scales with
+the number of shards and local cores.
+
+A job is a pair of callbacks:
+
+- `map(hits) -> partial`: called in a worker for each page of raw hits;
+- `reduce(a, b) -> partial`: combines two partials. It is applied within each slice
+  and then across slices in the parent, so it must be associative.
+
+Both must be picklable (module-level functions, or functools.partial of them).
+
+Usage (from api_layer/):
+    python -m app.services.scan levels --es-url http://localhost:9200
+    python -m app.services.scan signature "CUDA out of memory" --processes 8
+    python -m app.services.scan custom --map mypkg.jobs:map_page --reduce mypkg.jobs:merge --source message
+"""
+from collections import Counter, namedtuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from elasticsearch import Elasticsearch
+import argparse
+import contextlib
+import functools
+import importlib
+import json
+import logging
+import multiprocessing
+import os
+import queue
+import threading
+import time
+
+try:
+    from elastic_transport import OrjsonSerializer
+except ImportError:  # elastic-transport < 8.4 only ships the stdlib json serializer
+    OrjsonSerializer = None
+
+# ------------------------------
+# Logging setup
+# ------------------------------
+logger = logging.getLogger("api_layer")
+
+DEFAULT_PAGE_SIZE = 5000
+DEFAULT_KEEP_ALIVE = "5m"
+# Seconds between progress reports.
+PROGRESS_INTERVAL = 5.0
+
+# What to read (`query`, `_source` fields) and how to fold it (`map`, `reduce`).
+ScanJob = namedtuple("ScanJob", "map reduce query source", defaults=(None, None))
+
+
+# ------------------------------
+# Worker processes
+# ------------------------------
+_client = None
+_progress = None
+
+
+def _make_client(es_url, request_timeout):
+    return Elasticsearch(
+        es_url, request_timeout=request_timeout, max_retries=3, retry_on_timeout=True,
+        serializer=OrjsonSerializer() if OrjsonSerializer else None,
+    )
+
+
+def _init_worker(es_url, request_timeout, progress):
+    global _client, _progress
+    _client = _make_client(es_url, request_timeout)
+    _progress = progress
+
+
+def _scan_slice(job, pit_id, slice_id, slices, page_size, keep_alive):
+    """
+    Reads one slice of the point in time and folds it with the job's callbacks.
+
+    Returns:
+        tuple: (slice id, documents read, partial result or None if the slice was empty)
+    """
+    params = {"query": job.query or {"match_all": {}}, "sort": [{"_shard_doc": "asc"}], "track_total_hits": False}
+    if job.source is not None:
+        params["source"] = job.source
+    if slices > 1:
+        params["slice"] = {"id": slice_id, "max": slices}
+    result, docs = None, 0
+    while True:
+        res = _client.search(pit={"id": pit_id, "keep_alive": keep_alive}, size=page_size, **params)
+        pit_id = res.get("pit_id", pit_id)
+        hits = res["hits"]["hits"]
+        if not hits:
+            break
+        partial = job.map(hits)
+        result = partial if result is None else job.reduce(result, partial)
+        docs += len(hits)
+        if _progress is not None:
+            _progress.put((slice_id, len(hits)))
+        if len(hits) < page_size:
+            break
+        params["search_after"] = hits[-1]["sort"]
+    return slice_id, docs, result
+
+
+# ------------------------------
+# Python API
+# ------------------------------
+def log_progress(docs, total, slices_done, slices, elapsed):
+    """
+    Default progress callback: logs documents read, rate and slices finished.
+    """
+    rate = docs / elapsed if elapsed else 0
+    share = f" of {total:,} ({docs / total:.0%})" if total else ""
+    logger.info(f"Scanned {docs:,}{share} documents at {rate:,.0f} docs/s; {slices_done}/{slices} slices done")
+
+
+def _report(progress_queue, state, callback, stop):
+    """
+    Progress thread: tallies the pages reported by workers and calls `callback` periodically.
+    """
+    docs = 0
+    deadline = time.monotonic() + PROGRESS_INTERVAL
+    while not stop.is_set():
+        try:
+            _, page = progress_queue.get(timeout=min(0.5, max(0.0, deadline - time.monotonic())))
+            docs += page
+        except queue.Empty:
+            pass
+        if time.monotonic() >= deadline:
+            callback(docs, state["total"], state["slices_done"], state["slices"], time.perf_counter() - state["started"])
+            deadline = time.monotonic() + PROGRESS_INTERVAL
+
+
+def _run_slices(job, pit_id, slices, processes, page_size, keep_alive, es_url, request_timeout, progress_queue, state):
+    """
+    Scans every slice in a process pool and reduces the partial results as slices finish.
+
+    Returns:
+        tuple: (result, documents read)
+    """
+    result, total = None, 0
+    with ProcessPoolExecutor(processes, initializer=_init_worker,
+                             initargs=(es_url, request_timeout, progress_queue)) as pool:
+        futures = [pool.submit(_scan_slice, job, pit_id, i, slices, page_size, keep_alive) for i in range(slices)]
+        try:
+            for future in as_completed(futures):
+                slice_id, docs, partial = future.result()
+                state["slices_done"] += 1
+                total += docs
+                logger.debug(f"Slice {slice_id}/{slices} done: {docs} documents")
+                if partial is not None:
+                    result = partial if result is None else job.reduce(result, partial)
+        except BaseException:
+            for future in futures:
+                future.cancel()
+            raise
+    return result, total
+
+
+def run_scan(job, index_pattern=None, es_url=None, slices=None, processes=None, page_size=DEFAULT_PAGE_SIZE,
+             keep_alive=DEFAULT_KEEP_ALIVE, request_timeout=120.0, progress=log_progress):
+    """
+    Runs a job over every document matching `job.query`, in parallel slices.
+
+    Args:
+        job (ScanJob): Callbacks and what to read.
+        index_pattern (str): Indices to scan. Defaults to settings.index_pattern.
+        es_url (str): Cluster URL. Defaults to settings.elasticsearch_url.
+        slices (int): Slices of the point in time. Defaults to its shard count, which
+            Elasticsearch slices most efficiently.
+        processes (int): Worker processes. Defaults to min(slices, CPU count).
+        page_size (int): Hits per page and per map() call.
+        keep_alive (str): Point-in-time keep-alive between pages.
+        request_timeout (float): Client timeout per page, in seconds.
+        progress (callable): Called every few seconds with (docs, total, slices_done, slices,
+            elapsed seconds); None disables progress reporting.
+
+    Returns:
+        dict: {"result", "docs", "slices", "seconds"}; `result` is None if nothing matched.
+    """
+    if index_pattern is None or es_url is None:
+        from app.config import settings
+        index_pattern = index_pattern or settings.index_pattern
+        es_url = es_url or settings.elasticsearch_url
+
+    client = _make_client(es_url, request_timeout)
+    opened = client.open_point_in_time(index=index_pattern, keep_alive=keep_alive)
+    pit_id = opened["id"]
+    state = {"total": None, "slices_done": 0, "started": time.perf_counter()}
+    try:
+        slices = slices or opened.get("_shards", {}).get("total") or os.cpu_count() or 1
+        processes = processes or min(slices, os.cpu_count() or 1)
+        state["slices"] = slices
+        if progress is not None:
+            res = client.search(query=job.query or {"match_all": {}}, pit={"id": pit_id, "keep_alive": keep_alive},
+                                track_total_hits=True, size=0)
+            state["total"] = res["hits"]["total"]["value"]
+        logger.info(f"Scanning '{index_pattern}' in {slices} slices with {processes} processes"
+                    + (f" ({state['total']:,} documents)" if state["total"] is not None else ""))
+
+        # Workers report pages through a manager queue, which can be passed to the pool initializer.
+        with multiprocessing.Manager() if progress is not None else contextlib.nullcontext() as manager:
+            progress_queue = manager.Queue() if manager is not None else None
+            stop = threading.Event()
+            reporter = None
+            if progress is not None:
+                reporter = threading.Thread(target=_report, args=(progress_queue, state, progress, stop), daemon=True)
+                reporter.start()
+            try:
+                result, docs = _run_slices(job, pit_id, slices, processes, page_size, keep_alive,
+                                           es_url, request_timeout, progress_queue, state)
+            finally:
+                stop.set()
+                if reporter is not None:
+                    reporter.join()
+    finally:
+        try:
+            client.close_point_in_time(id=pit_id)
+        except Exception as e:
+            logger.warning(f"Failed to close PIT: {e}")
+        client.close()
+
+    elapsed = time.perf_counter() - state["started"]
+    if progress is not None:
+        progress(docs, state["total"], state["slices_done"], slices, elapsed)
+    return {"result": result, "docs": docs, "slices": slices, "seconds": round(elapsed, 2)}
+
+
+# ------------------------------
+# Built-in jobs
+# ------------------------------
+def merge_counts(a, b):
+    a.update(b)
+    return a
+
+
+def _count_levels(hits):
+    return Counter(hit["_source"].get("log_level") or "NONE" for hit in hits)
+
+
+def _count_by_run(hits):
+    return Counter(f"{hit['_source'].get('train_id')}/{hit['_source'].get('test_id')}" for hit in hits)
+
+
+def levels_job():
+    """
+    Lines per `log_level` over the whole corpus.
+    """
+    return ScanJob(_count_levels, merge_counts, source=["log_level"])
+
+
+def signature_job(pattern):
+    """
+    Lines containing the phrase `pattern`, per `train_id/test_id`.
+    """
+    return ScanJob(_count_by_run, merge_counts, query={"match_phrase": {"message": pattern}},
+                   source=["train_id", "test_id"])
+
+
+def load_callable(spec):
+    """
+    `package.module:function` -> the function.
+    """
+    module, _, name = spec.partition(":")
+    if not name:
+        raise ValueError(f"Expected module:function, got '{spec}'")
+    return functools.reduce(getattr, name.split("."), importlib.import_module(module))
+
+
+# ------------------------------
+# CLI
+# ------------------------------
+def _add_common(parser, defaults=True):
+    def default(value):
+        return value if defaults else argparse.SUPPRESS
+    parser.add_argument("--es-url", default=default(os.environ.get("ELASTICSEARCH_URL", "http://localhost:9200")))
+    parser.add_argument("--index", default=default(os.environ.get("INDEX_PATTERN", "cs1_logs-*")), help="Indices to scan")
+    parser.add_argument("--slices", type=int, default=default(None), help="Slices (default: shard count)")
+    parser.add_argument("--processes", type=int, default=default(None), help="Worker processes (default: min(slices, cores))")
+    parser.add_argument("--page-size", type=int, default=default(DEFAULT_PAGE_SIZE), help="Hits per page")
+    parser.add_argument("--keep-alive", default=default(DEFAULT_KEEP_ALIVE), help="Point-in-time keep-alive")
+    parser.add_argument("--request-timeout", type=float, default=default(120.0))
+    parser.add_argument("--output", default=default("-"), help="File the JSON result is written to (default: stdout)")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="python -m app.services.scan", description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    _add_common(parser)
+    # The same options are accepted after the job name. Their defaults are suppressed there,
+    # so they do not override values given before it.
+    common = argparse.ArgumentParser(add_help=False)
+    _add_common(common, defaults=False)
+    jobs = parser.add_subparsers(dest="job", required=True)
+    jobs.add_parser("levels", parents=[common], help="Count lines per log_level")
+    signature = jobs.add_parser("signature", parents=[common], help="Count lines containing a phrase, per train/test")
+    signature.add_argument("pattern")
+    custom = jobs.add_parser("custom", parents=[common], help="Run your own map/reduce callbacks")
+    custom.add_argument("--map", required=True, help="module:function called with each page of hits")
+    custom.add_argument("--reduce", required=True, help="module:function combining two partial results")
+    custom.add_argument("--query", type=json.loads, default=None, help="Query DSL (JSON) selecting the documents")
+    custom.add_argument("--source", nargs="*", default=None, help="`_source` fields to fetch (default: all)")
+    return parser
+
+
+def job_from_args(args):
+    if args.job == "levels":
+        return levels_job()
+    if args.job == "signature":
+        return signature_job(args.pattern)
+    return ScanJob(load_callable(args.map), load_callable(args.reduce), args.query, args.source)
+
+
+def main(argv=None):
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    logging.getLogger("elastic_transport").setLevel(logging.WARNING)
+    args = build_parser().parse_args(argv)
+    outcome = run_scan(job_from_args(args), args.index, args.es_url, args.slices, args.processes,
+                       args.page_size, args.keep_alive, args.request_timeout)
+    text = json.dumps(outcome, indent=2, default=str)
+    if args.output == "-":
+        print(text)
+    else:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+
+
+if __name__ == "__main__":
+    main()
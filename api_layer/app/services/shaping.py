@@ -0,0 +1,86 @@
+from enum import Enum
+from fastapi import HTTPException
+import logging
+
+# ------------------------------
+# Logging setup
+# ------------------------------
+logger = logging.getLogger("api_layer")
+
+# Fields returned by `format=columns` when no `fields=` are given: what a log table renders.
+DEFAULT_COLUMNS = ["@timestamp", "log_level", "message"]
+
+
+class OutputFormat(str, Enum):
+    rows = "rows"
+    columns = "columns"
+
+
+def parse_fields(fields):
+    """
+    Parses a comma-separated `fields=` parameter into a list of `_source` includes.
+
+    Returns:
+        list: Field names (wildcards allowed, e.g. `log.*`), or None for the full `_source`.
+
+    Raises:
+        HTTPException(400): If the parameter names no fields.
+    """
+    if fields is None:
+        return None
+    names = list(dict.fromkeys(f.strip() for f in fields.split(",") if f.strip()))
+    if not names:
+        raise HTTPException(status_code=400, detail="fields must name at least one field")
+    return names
+
+
+def project(body, fields, fmt=OutputFormat.rows):
+    """
+    Restricts the `_source` Elasticsearch returns for the query in `body` (in place).
+
+    Columnar output without explicit fields only needs DEFAULT_COLUMNS, so those are
+    requested rather than the whole document.
+
+    Returns:
+        list: The fields requested, or None if the full `_source` is returned.
+
+    Raises:
+        HTTPException(400): If columnar output is asked for with wildcard fields.
+    """
+    if fmt == OutputFormat.columns:
+        if fields is None:
+            fields = DEFAULT_COLUMNS
+        elif any("*" in name for name in fields):
+            raise HTTPException(status_code=400, detail="format=columns needs explicit field names, not wildcards")
+    if fields is not None:
+        body["_source"] = {"includes": fields}
+    return fields
+
+
+def field_value(src, name):
+    """
+    Value of a possibly dotted field in `_source`: Elasticsearch keeps `log.file.path` nested
+    as `{"log": {"file": {"path": ...}}}`, but a document may also carry the literal dotted key.
+    """
+    if name in src:
+        return src[name]
+    value = src
+    for part in name.split("."):
+        if not isinstance(value, dict) or part not in value:
+            return None
+        value = value[part]
+    return value
+
+
+def shape_hits(hits, fmt=OutputFormat.rows, fields=None):
+    """
+    Turns raw hits into the response payload.
+
+    Returns:
+        list | dict: The `_source` of each hit for `rows`; for `columns`, one array per
+        field, index-aligned across fields (missing values are null).
+    """
+    if fmt == OutputFormat.columns:
+        sources = [hit["_source"] for hit in hits]
+        return {name: [field_value(src, name) for src in sources] for name in fields or DEFAULT_COLUMNS}
+    return [hit["_source"] for hit in hits]
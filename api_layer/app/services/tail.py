@@ -0,0 +1,275 @@
+"""
+Live tail of running jobs.
+
+One Tailer per (id field, id, pattern) polls Elasticsearch and fans new documents out to
+every subscriber. Tailers live in the worker process that serves the request, so the
+cluster sees at most one search per poll interval per worker watching a job: under
+gunicorn, up to WEB_CONCURRENCY pollers for a job however many people watch it.
+
+Each poll resumes from a `search_after` high-water mark on `@timestamp`. It re-reads a short
+overlap window to catch late-indexed documents and drops the `_id`s it has already delivered.
+
+Subscribers get their own bounded queue. A subscriber that falls more than
+settings.tail_queue_size batches behind is disconnected rather than slowing the poller or
+growing memory. It can reconnect with `Last-Event-ID` and resume from the replay buffer.
+"""
+from collections import deque
+from app.services.elastic import search
+from app.services.routing import route
+from app.config import settings
+import asyncio
+import logging
+import time
+
+# ------------------------------
+# Logging setup
+# ------------------------------
+logger = logging.getLogger("api_layer")
+
+
+class Overflow(Exception):
+    """
+    Raised to a subscriber whose queue filled up because it read slower than logs arrived.
+    """
+
+
+class Subscription:
+    """
+    One subscriber's view of a Tailer: a bounded queue of hit batches.
+    """
+
+    def __init__(self, tailer, maxsize):
+        self.tailer = tailer
+        self.queue = asyncio.Queue(maxsize=maxsize)
+        self.overflowed = False
+
+    def offer(self, hits):
+        """
+        Queues a batch without blocking the poller. Returns False once the subscriber has fallen behind.
+        """
+        if self.overflowed:
+            return False
+        try:
+            self.queue.put_nowait(hits)
+            return True
+        except asyncio.QueueFull:
+            self.overflowed = True
+            # Wake the reader so it notices at once instead of draining a stale backlog first.
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(None)
+            return False
+
+    async def get(self, timeout):
+        """
+        Waits up to `timeout` seconds for the next batch.
+
+        Returns:
+            list: New hits, or an empty list on timeout (time for a heartbeat).
+
+        Raises:
+            Overflow: If the subscriber fell too far behind.
+        """
+        try:
+            hits = await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return []
+        if hits is None:
+            raise Overflow()
+        return hits
+
+    def close(self):
+        self.tailer.unsubscribe(self)
+
+
+class Tailer:
+    """
+    Shared poller for one job's log.
+    """
+
+    def __init__(self, key, id_field, id_value, pattern=None, days=None):
+        self.key = key
+        self.id_field = id_field
+        self.id_value = id_value
+        self.pattern = pattern
+        self.days = days or settings.default_days
+        self.subscribers = set()
+        # Recently delivered hits, replayed to new subscribers and to reconnects (Last-Event-ID).
+        self.recent = deque(maxlen=settings.tail_backlog)
+        self.high_water = None
+        self._seen = {}
+        self._task = None
+        self._ready = asyncio.Event()
+
+    def _query(self):
+        must = [{"term": {f"{self.id_field}.keyword": self.id_value}}]
+        if self.pattern:
+            must.append({"match": {"message": self.pattern}})
+        return {"bool": {"must": must, "filter": [{"range": {"@timestamp": {"gte": f"now-{self.days}d"}}}]}}
+
+    async def _index(self, since=None):
+        # Once past the backlog, polls only need the indices written to since the high-water mark.
+        return await route(self.days, since, **{self.id_field: self.id_value})
+
+    def _remember(self, hits):
+        """
+        Advances the high-water mark and returns the hits not delivered before.
+        """
+        fresh = []
+        for hit in hits:
+            if hit["_id"] in self._seen:
+                continue
+            ts = hit["sort"][0]
+            self._seen[hit["_id"]] = ts
+            fresh.append(hit)
+            if self.high_water is None or ts > self.high_water:
+                self.high_water = ts
+        if fresh:
+            # Ids older than the overlap window can no longer be returned, so stop tracking them.
+            floor = self.high_water - settings.tail_overlap_seconds * 1000
+            self._seen = {i: ts for i, ts in self._seen.items() if ts >= floor}
+        return fresh
+
+    async def _seed(self):
+        """
+        Loads the newest settings.tail_backlog lines, so subscribers start with context.
+        """
+        body = {"query": self._query(), "sort": [{"@timestamp": {"order": "desc"}}]}
+        res = await search(await self._index(), body, size=settings.tail_backlog, kind="tail")
+        hits = list(reversed(res.get("hits", {}).get("hits", [])))
+        self.recent.extend(self._remember(hits))
+        if self.high_water is None:
+            return
+        # Older lines in the overlap window predate the backlog; mark them seen so the first
+        # poll does not deliver them as new. Lines past the backlog are left for that poll.
+        seeded = self.high_water
+        floor = seeded - settings.tail_overlap_seconds * 1000
+        body = {"query": self._query(), "sort": [{"@timestamp": {"order": "asc"}}],
+                "search_after": [floor], "_source": False}
+        res = await search(await self._index(floor), body, size=settings.tail_batch_size, kind="tail")
+        for hit in res.get("hits", {}).get("hits", []):
+            if hit["sort"][0] <= seeded:
+                self._seen.setdefault(hit["_id"], hit["sort"][0])
+
+    async def _poll(self):
+        """
+        Fetches documents after the high-water mark, minus the overlap window.
+
+        Returns:
+            tuple: (new hits, True if the page was full and more are waiting)
+        """
+        body = {"query": self._query(), "sort": [{"@timestamp": {"order": "asc"}}]}
+        floor = None
+        if self.high_water is not None:
+            floor = self.high_water - settings.tail_overlap_seconds * 1000
+            body["search_after"] = [floor]
+        res = await search(await self._index(floor), body, size=settings.tail_batch_size, kind="tail")
+        hits = res.get("hits", {}).get("hits", [])
+        fresh = self._remember(hits)
+        full = len(hits) == settings.tail_batch_size
+        if full and not fresh:
+            # A whole page of already-delivered lines (e.g. a burst within one overlap window):
+            # skip past it rather than re-reading it forever.
+            self.high_water = hits[-1]["sort"][0] + settings.tail_overlap_seconds * 1000
+            logger.warning(f"Live tail of {self.id_field}={self.id_value} skipped a page of duplicates")
+        return fresh, full
+
+    def _publish(self, hits):
+        self.recent.extend(hits)
+        for sub in list(self.subscribers):
+            if not sub.offer(hits):
+                logger.warning(f"Live tail subscriber for {self.id_field}={self.id_value} fell behind; disconnecting")
+                self.subscribers.discard(sub)
+
+    async def _run(self):
+        errors = 0
+        try:
+            await self._seed()
+        except Exception as e:
+            logger.error(f"Live tail of {self.id_field}={self.id_value} could not load recent lines: {e}")
+        finally:
+            self._ready.set()
+        while self.subscribers:
+            started = time.monotonic()
+            more = False
+            try:
+                hits, more = await self._poll()
+                errors = 0
+                if hits:
+                    self._publish(hits)
+            except Exception as e:
+                errors += 1
+                logger.error(f"Live tail poll for {self.id_field}={self.id_value} failed ({errors} in a row): {e}")
+            if more:
+                continue
+            # Back off on repeated failures so an outage is not met with a poll storm.
+            delay = settings.tail_poll_interval * min(2 ** errors, 8)
+            await asyncio.sleep(max(0.0, delay - (time.monotonic() - started)))
+        logger.info(f"Live tail of {self.id_field}={self.id_value} stopped: no subscribers left")
+
+    async def subscribe(self, last_event_id=None):
+        """
+        Adds a subscriber, starting the poller if this is the first one.
+
+        Returns:
+            tuple: (Subscription, hits to replay first). With last_event_id, only hits after
+            that id are replayed if it is still in the buffer; otherwise the whole buffer is.
+        """
+        sub = Subscription(self, settings.tail_queue_size)
+        self.subscribers.add(sub)
+        if self._task is None or self._task.done():
+            self._ready.clear()
+            self._task = asyncio.create_task(self._run())
+        try:
+            await self._ready.wait()
+        except BaseException:
+            # Cancelled (client gone) before the backlog loaded: don't leave a dead subscriber.
+            self.unsubscribe(sub)
+            raise
+        replay = list(self.recent)
+        if last_event_id:
+            ids = [hit["_id"] for hit in replay]
+            if last_event_id in ids:
+                replay = replay[ids.index(last_event_id) + 1:]
+        return sub, replay
+
+    def unsubscribe(self, sub):
+        self.subscribers.discard(sub)
+        if not self.subscribers and _tailers.get(self.key) is self:
+            del _tailers[self.key]
+            # The poller exits on its own once idle; cancelling also ends a long sleep now.
+            if self._task is not None:
+                self._task.cancel()
+
+    async def close(self):
+        self.subscribers.clear()
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+
+
+_tailers = {}
+
+
+async def subscribe(id_field, id_value, pattern=None, days=None, last_event_id=None):
+    """
+    Subscribes to new log lines of a job, sharing the poller with other subscribers of the same job.
+
+    Returns:
+        tuple: (Subscription, hits to replay before live ones)
+    """
+    key = (id_field, id_value, pattern or None, days or settings.default_days)
+    tailer = _tailers.get(key)
+    if tailer is None:
+        tailer = _tailers[key] = Tailer(key, id_field, id_value, pattern, days)
+        logger.info(f"Live tail of {id_field}={id_value} started")
+    return await tailer.subscribe(last_event_id)
+
+
+async def close_all():
+    """
+    Stops every poller; called on shutdown.
+    """
+    tailers = list(_tailers.values())
+    _tailers.clear()
+    await asyncio.gather(*(t.close() for t in tailers))
@@ -0,0 +1,438 @@
+"""
+Log template mining (Drain-style signature extraction).
+
+Messages are normalised by masking volatile tokens (timestamps, UUIDs, hex ids, addresses,
+paths, numbers), then grouped by a fixed-depth prefix tree: lines with the same token count
+and leading tokens are compared with the templates in their leaf, and either join the most
+similar one (differing positions become `<*>`) or start a new template.
+
+Work is batched per page of hits: identical raw messages are counted once, masked once, and
+each distinct masked line visits the tree once with its multiplicity. Log volume is dominated
+by repeats, so millions of lines reduce to a few thousand tree operations.
+
+Mined templates are persisted per scope (a train, a test, or the whole index) in SQLite
+together with a time watermark, so the next run only reads newer documents. `@timestamp` is
+the log line's own time, and backfills index lines long after it, so each run first recounts
+the documents below the watermark: if the count changed, the scope is mined again from scratch.
+"""
+from app.services.elastic import scan_sorted, search
+from app.services.routing import route
+from app.config import settings
+import asyncio
+import json
+import logging
+import re
+import sqlite3
+import time
+
+# ------------------------------
+# Logging setup
+# ------------------------------
+logger = logging.getLogger("api_layer")
+
+WILDCARD = "<*>"
+# Upper bound on remembered raw -> masked and masked -> template lookups per miner.
+MEMO_ENTRIES = 200_000
+
+# Order matters: longer, more specific shapes are masked before the numbers inside them.
+MASKS = [
+    ("TS", r"\d{4}-\d{2}-\d{2}[T ]\d{2}:\d{2}:\d{2}(?:[.,]\d+)?(?:Z|[+-]\d{2}:?\d{2})?"),
+    ("UUID", r"\b[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}\b"),
+    ("IP", r"\b\d{1,3}(?:\.\d{1,3}){3}(?::\d+)?\b"),
+    ("PATH", r"(?<![\w.])(?:/[\w.\-+@]+){2,}/?"),
+    ("HEX", r"\b0x[0-9a-fA-F]+\b|\b(?=[0-9a-fA-F]*\d)(?=[0-9a-fA-F]*[a-fA-F])[0-9a-fA-F]{8,}\b"),
+    ("NUM", r"(?<![A-Za-z_])[-+]?\d+(?:\.\d+)?(?:e[-+]?\d+)?"),
+]
+_MASK_RE = re.compile("|".join(f"(?P<{name}>{regex})" for name, regex in MASKS))
+_PLACEHOLDER_RE = re.compile(r"<\*>|<[A-Z]+>")
+
+
+def mask(message):
+    """
+    Replaces volatile tokens with placeholders, e.g. `retry 3 of /cb/a/b` -> `retry <NUM> of <PATH>`.
+    """
+    return _MASK_RE.sub(lambda m: f"<{m.lastgroup}>", message)
+
+
+def literal_pattern(template):
+    """
+    The longest constant substring of a template: a `pattern=` usable with /stats/* and /search/errors.
+    """
+    pieces = [p.strip() for p in _PLACEHOLDER_RE.split(template)]
+    return max(pieces, key=len) if pieces else ""
+
+
+class Cluster:
+    __slots__ = ("id", "tokens", "count", "first_seen", "last_seen", "sample")
+
+    def __init__(self, id, tokens, count=0, first_seen=None, last_seen=None, sample=None):
+        self.id = id
+        self.tokens = tokens
+        self.count = count
+        self.first_seen = first_seen
+        self.last_seen = last_seen
+        self.sample = sample
+
+    @property
+    def template(self):
+        return " ".join(self.tokens)
+
+    def to_dict(self):
+        return {"id": self.id, "template": self.template, "count": self.count, "first_seen": self.first_seen,
+                "last_seen": self.last_seen, "pattern": literal_pattern(self.template), "sample": self.sample}
+
+    @classmethod
+    def from_dict(cls, d):
+        return cls(d["id"], d["template"].split(" "), d["count"], d["first_seen"], d["last_seen"], d["sample"])
+
+
+class TemplateMiner:
+    """
+    Drain prefix tree: token count -> first `depth` tokens -> candidate clusters.
+
+    Args:
+        similarity (float): Minimum share of equal tokens for a line to join a template.
+        depth (int): Number of leading tokens used to route a line.
+        max_children (int): Branching limit per tree node; overflow routes to `<*>`.
+    """
+
+    def __init__(self, similarity=0.5, depth=2, max_children=100, clusters=None):
+        self.similarity = similarity
+        self.depth = depth
+        self.max_children = max_children
+        self.clusters = {}
+        self._tree = {}
+        self._masked = {}
+        self._assigned = {}
+        for cluster in clusters or []:
+            self.clusters[cluster.id] = cluster
+            self._leaf(cluster.tokens).append(cluster)
+
+    def _leaf(self, tokens):
+        node = self._tree.setdefault(len(tokens), {})
+        for token in tokens[:self.depth]:
+            if token not in node:
+                if "<" in token or any(c.isdigit() for c in token):
+                    token = WILDCARD
+                elif len(node) >= self.max_children:
+                    token = WILDCARD
+            node = node.setdefault(token, {})
+        return node.setdefault(None, [])
+
+    def _match(self, leaf, tokens):
+        best, best_score = None, -1.0
+        for cluster in leaf:
+            same = sum(1 for a, b in zip(cluster.tokens, tokens) if a == b or a == WILDCARD)
+            score = same / len(tokens)
+            if score > best_score:
+                best, best_score = cluster, score
+        return best if best_score >= self.similarity else None
+
+    def add(self, masked, count, first_seen, last_seen, sample):
+        """
+        Adds `count` occurrences of one masked line.
+
+        A masked line seen before skips the tree: templates only ever generalise, so the
+        template it joined still covers it.
+
+        Returns:
+            Cluster: The template the line was assigned to.
+        """
+        cluster = self._assigned.get(masked)
+        if cluster is None:
+            tokens = masked.split() or [""]
+            leaf = self._leaf(tokens)
+            cluster = self._match(leaf, tokens)
+            if cluster is None:
+                cluster = Cluster(len(self.clusters) + 1, tokens, sample=sample)
+                self.clusters[cluster.id] = cluster
+                leaf.append(cluster)
+            else:
+                cluster.tokens = [a if a == b else WILDCARD for a, b in zip(cluster.tokens, tokens)]
+            if len(self._assigned) >= MEMO_ENTRIES:
+                self._assigned.clear()
+            self._assigned[masked] = cluster
+        cluster.count += count
+        if first_seen is not None and (cluster.first_seen is None or first_seen < cluster.first_seen):
+            cluster.first_seen = first_seen
+        if last_seen is not None and (cluster.last_seen is None or last_seen > cluster.last_seen):
+            cluster.last_seen = last_seen
+        return cluster
+
+    def add_batch(self, messages):
+        """
+        Adds one batch of (message, timestamp) pairs.
+
+        Returns:
+            dict: Cluster id -> number of lines of the batch assigned to it.
+        """
+        raw = {}
+        for message, ts in messages:
+            entry = raw.get(message)
+            if entry is None:
+                raw[message] = [1, ts, ts]
+            else:
+                entry[0] += 1
+                if ts < entry[1]:
+                    entry[1] = ts
+                if ts > entry[2]:
+                    entry[2] = ts
+        grouped = {}
+        memo = self._masked
+        if len(memo) >= MEMO_ENTRIES:
+            memo.clear()
+        for message, (count, first, last) in raw.items():
+            masked = memo.get(message)
+            if masked is None:
+                masked = memo[message] = mask(message)
+            entry = grouped.get(masked)
+            if entry is None:
+                grouped[masked] = [count, first, last, message]
+            else:
+                entry[0] += count
+                entry[1] = min(entry[1], first)
+                entry[2] = max(entry[2], last)
+        assigned = {}
+        for masked, entry in grouped.items():
+            cluster_id = self.add(masked, *entry).id
+            assigned[cluster_id] = assigned.get(cluster_id, 0) + entry[0]
+        return assigned
+
+    def templates(self, size=None):
+        ranked = sorted(self.clusters.values(), key=lambda c: c.count, reverse=True)
+        return ranked[:size] if size else ranked
+
+
+def hit_messages(hits):
+    """
+    (message, @timestamp) pairs of raw hits; hits without a message are skipped.
+
+    Only the first line of a multi-line event is kept: it carries the signature, while the
+    stack frames that follow vary in depth and would split one error into many templates.
+    """
+    out = []
+    for hit in hits:
+        src = hit["_source"]
+        message = src.get("message")
+        if message is None:
+            continue
+        if not isinstance(message, str):
+            message = " ".join(message)
+        out.append((message.split("\n", 1)[0], src.get("@timestamp") or ""))
+    return out
+
+
+async def batched_hits(index_pattern, body, batch_size):
+    """
+    Groups the hits streamed by scan_sorted() into lists of up to `batch_size`.
+    """
+    batch = []
+    async for hit in scan_sorted(index_pattern, body, page_size=batch_size):
+        batch.append(hit)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+# ------------------------------
+# Persistence
+# ------------------------------
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS template_scopes (
+    scope TEXT PRIMARY KEY,
+    watermark INTEGER NOT NULL,
+    lines INTEGER NOT NULL,
+    clusters TEXT NOT NULL,
+    updated_at REAL NOT NULL,
+    since INTEGER,
+    docs INTEGER
+)
+"""
+# Columns added after the first release of the table, with their types.
+MIGRATIONS = {"since": "INTEGER", "docs": "INTEGER"}
+
+
+class TemplateStore:
+    """
+    Mined templates per scope (SQLite, WAL mode so every API worker can share the file).
+
+    `watermark` is the epoch-millis upper bound of the documents already mined, `since` the
+    lower bound of the first run and `docs` the number of documents read in between. Saves are
+    conditional on the watermark they started from, so two workers mining the same scope
+    concurrently cannot both count the same documents.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._db = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(SCHEMA)
+        columns = {row[1] for row in self._db.execute("PRAGMA table_info(template_scopes)")}
+        for column, kind in MIGRATIONS.items():
+            if column not in columns:
+                self._db.execute(f"ALTER TABLE template_scopes ADD COLUMN {column} {kind}")
+        self._db.commit()
+
+    def load(self, scope):
+        """
+        Returns:
+            tuple: (watermark, lines, clusters, since, docs) or None if the scope was never
+            mined. `since` and `docs` are None for scopes saved before they were tracked.
+        """
+        row = self._db.execute(
+            "SELECT watermark, lines, clusters, since, docs FROM template_scopes WHERE scope = ?", (scope,)
+        ).fetchone()
+        if row is None:
+            return None
+        return row[0], row[1], [Cluster.from_dict(d) for d in json.loads(row[2])], row[3], row[4]
+
+    def save(self, scope, previous_watermark, watermark, lines, clusters, since, docs):
+        """
+        Returns:
+            bool: False if another run advanced the scope first (nothing is written).
+        """
+        payload = json.dumps([c.to_dict() for c in clusters])
+        with self._db:
+            if previous_watermark is None:
+                cur = self._db.execute(
+                    "INSERT OR IGNORE INTO template_scopes (scope, watermark, lines, clusters, updated_at, since, docs) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)", (scope, watermark, lines, payload, time.time(), since, docs))
+            else:
+                cur = self._db.execute(
+                    "UPDATE template_scopes SET watermark = ?, lines = ?, clusters = ?, updated_at = ?, since = ?, docs = ? "
+                    "WHERE scope = ? AND watermark = ?",
+                    (watermark, lines, payload, time.time(), since, docs, scope, previous_watermark))
+        return cur.rowcount == 1
+
+    def delete(self, scope):
+        with self._db:
+            self._db.execute("DELETE FROM template_scopes WHERE scope = ?", (scope,))
+
+    def close(self):
+        self._db.close()
+
+
+_store = None
+_locks = {}
+
+
+def get_store():
+    global _store
+    if _store is None:
+        _store = TemplateStore(settings.templates_db)
+    return _store
+
+
+def scope_key(train_id=None, test_id=None):
+    parts = [f"train_id={train_id}" if train_id else None, f"test_id={test_id}" if test_id else None]
+    return "&".join(p for p in parts if p) or "all"
+
+
+def scope_filters(train_id=None, test_id=None):
+    filters = []
+    if train_id:
+        filters.append({"term": {"train_id.keyword": train_id}})
+    if test_id:
+        filters.append({"term": {"test_id.keyword": test_id}})
+    return filters
+
+
+async def _count(index, train_id, test_id, lower, upper):
+    """
+    Documents of a scope with `@timestamp` in (lower, upper], whenever they were indexed.
+    """
+    body = {
+        "query": {"bool": {"filter": scope_filters(train_id, test_id) + [
+            {"range": {"@timestamp": {"gt": lower, "lte": upper, "format": "epoch_millis"}}}
+        ]}},
+        "track_total_hits": True,
+    }
+    res = await search(index, body, size=0)
+    return res["hits"]["total"]["value"]
+
+
+async def mine(train_id=None, test_id=None, days=None, refresh=True):
+    """
+    Brings the templates of a scope up to date and returns them.
+
+    The first run reads the last `days` days; later runs read only documents newer than the
+    stored watermark. The upper bound trails now by settings.templates_settle_seconds so
+    documents still being ingested are picked up by a later run instead of being skipped.
+
+    Documents indexed after the watermark passed their `@timestamp` (backfills, late
+    shippers) would never be read that way, so each run first counts the documents between
+    the first run's lower bound and the watermark. When the count differs from the number of
+    documents mined, the scope is mined again from scratch over the same range.
+
+    Returns:
+        dict: {"scope", "lines", "new_lines", "rebuilt", "watermark", "miner"}
+    """
+    scope = scope_key(train_id, test_id)
+    store = get_store()
+    lock = _locks.setdefault(scope, asyncio.Lock())
+    async with lock:
+        state = await asyncio.to_thread(store.load, scope)
+        previous, lines, clusters, since, docs = state if state else (None, 0, [], None, 0)
+        if not refresh:
+            miner = TemplateMiner(settings.templates_similarity, settings.templates_depth, clusters=clusters)
+            return {"scope": scope, "lines": lines, "new_lines": 0, "rebuilt": False, "watermark": previous, "miner": miner}
+
+        rebuilt = False
+        if previous is not None:
+            if since is None:
+                rebuilt = True
+            else:
+                index = await route(since=since, train_id=train_id, test_id=test_id)
+                count = await _count(index, train_id, test_id, since, previous)
+                rebuilt = count != docs
+                if rebuilt:
+                    logger.info(f"Template scope '{scope}' holds {count} documents up to its watermark, "
+                                f"{docs} were mined; mining it again")
+        if rebuilt:
+            lines, clusters, docs = 0, [], 0
+        miner = TemplateMiner(settings.templates_similarity, settings.templates_depth, clusters=clusters)
+
+        upper = int((time.time() - settings.templates_settle_seconds) * 1000)
+        if since is None:
+            since = int((time.time() - (days or settings.default_days) * 86400) * 1000)
+        lower = since if rebuilt or previous is None else previous
+        if upper <= lower:
+            return {"scope": scope, "lines": lines, "new_lines": 0, "rebuilt": False, "watermark": previous, "miner": miner}
+
+        body = {
+            "query": {"bool": {"filter": scope_filters(train_id, test_id) + [
+                {"range": {"@timestamp": {"gt": lower, "lte": upper, "format": "epoch_millis"}}}
+            ]}},
+            "sort": [{"@timestamp": {"order": "asc"}}],
+            "_source": {"includes": ["@timestamp", "message"]},
+        }
+        index = await route(since=lower, train_id=train_id, test_id=test_id)
+        started = time.perf_counter()
+        new_lines = 0
+        async for hits in batched_hits(index, body, settings.templates_batch_size):
+            docs += len(hits)
+            batch = hit_messages(hits)
+            new_lines += len(batch)
+            await asyncio.to_thread(miner.add_batch, batch)
+
+        saved = await asyncio.to_thread(store.save, scope, previous, upper, lines + new_lines,
+                                        miner.templates(), since, docs)
+        if not saved:
+            # Another worker mined this scope meanwhile; its result covers ours.
+            logger.info(f"Template scope '{scope}' was updated concurrently; using the stored result")
+            watermark, lines, clusters, _, _ = await asyncio.to_thread(store.load, scope)
+            miner = TemplateMiner(settings.templates_similarity, settings.templates_depth, clusters=clusters)
+            return {"scope": scope, "lines": lines, "new_lines": 0, "rebuilt": False, "watermark": watermark, "miner": miner}
+        logger.info(f"Mined {new_lines} lines into {len(miner.clusters)} templates for '{scope}' "
+                    f"in {time.perf_counter() - started:.2f}s")
+        return {"scope": scope, "lines": lines + new_lines, "new_lines": new_lines, "rebuilt": rebuilt,
+                "watermark": upper, "miner": miner}
+
+
+async def reset(train_id=None, test_id=None):
+    """
+    Forgets the templates of a scope; the next run mines it from scratch.
+    """
+    await asyncio.to_thread(get_store().delete, scope_key(train_id, test_id))
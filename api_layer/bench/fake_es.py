@@ -0,0 +1,189 @@
+"""
+Elasticsearch stand-in for API benchmarks without a cluster.
+
+Speaks the subset of the REST API the service uses (`_search`, `_msearch`, `_pit`,
+`_field_caps`, `/`) over real HTTP, so the API's client, connection pool and JSON handling
+are exercised exactly as in production. Responses come from one of two sources:
+
+- `--root`: queries are evaluated by the offline local index (app.services.local_index)
+  over a log tree, e.g. one written by bench.synthetic. Responses are memoised per request,
+  so after warm-up the stand-in answers in microseconds and the benchmark measures the API.
+- `--replay`: responses recorded by an earlier run (`--record`) are served as-is; no index
+  or log tree is needed. Unrecorded requests get an empty result.
+
+`--delay-ms` adds a fixed server-side latency (also reported as `took`) to model a cluster.
+
+Usage (from api_layer/):
+    python -m bench.fake_es --root /tmp/cs1-logs --index-dir /tmp/cs1-index --port 9299 --record rec.jsonl
+    python -m bench.fake_es --replay rec.jsonl --port 9299 --delay-ms 5
+"""
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+import argparse
+import json
+import signal
+import threading
+import time
+
+PRODUCT_HEADERS = {"X-Elastic-Product": "Elasticsearch", "Content-Type": "application/json"}
+EMPTY_SEARCH = {"took": 0, "timed_out": False, "_shards": {"total": 1, "successful": 1, "skipped": 0, "failed": 0},
+                "hits": {"total": {"value": 0, "relation": "eq"}, "max_score": None, "hits": []}}
+# Reported by field_caps so the API takes its production `message.wildcard` query path.
+FIELD_CAPS = {"indices": ["cs1_logs-bench"], "fields": {"message.wildcard": {"wildcard": {
+    "type": "wildcard", "metadata_field": False, "searchable": True, "aggregatable": True}}}}
+INFO = {"name": "fake-es", "cluster_name": "bench", "version": {"number": "8.9.0", "lucene_version": "9.7.0"},
+        "tagline": "You Know, for Search"}
+
+
+class Backend:
+    """
+    Computes (or replays) responses and keeps the request -> response recording.
+    """
+
+    def __init__(self, index=None, recording=None, memoise=True, delay_ms=0.0):
+        self.index = index
+        self.memoise = memoise
+        self.delay = delay_ms / 1000.0
+        self.responses = dict(recording or {})
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(method, path, body):
+        return f"{method} {path} {json.dumps(body, sort_keys=True, separators=(',', ':'))}"
+
+    def handle(self, method, path, query, body):
+        key = self.key(method, path, body)
+        response = self.responses.get(key)
+        if response is None:
+            response = self._compute(method, path, query, body)
+            if self.memoise:
+                with self._lock:
+                    self.responses[key] = response
+        if self.delay:
+            time.sleep(self.delay)
+            if "took" in response:
+                response = dict(response, took=response["took"] + int(self.delay * 1000))
+        return response
+
+    def _compute(self, method, path, query, body):
+        parts = [p for p in path.split("/") if p]
+        endpoint = parts[-1] if parts else ""
+        if endpoint == "_pit":
+            if method == "DELETE":
+                return {"succeeded": True, "num_freed": 1}
+            count = self.index.doc_count if self.index else 0
+            return {"id": f"local-{count}"}
+        if endpoint == "_field_caps":
+            return FIELD_CAPS
+        if endpoint == "_msearch":
+            return {"took": 0, "responses": [self._search(b, None) for b in body[1::2]]}
+        if endpoint == "_search":
+            return self._search(body or {}, query.get("size"))
+        return INFO
+
+    def _search(self, body, size):
+        if self.index is None:
+            self.misses += 1
+            return EMPTY_SEARCH
+        from app.services.local_index import run_search
+        size = int(size) if size is not None else body.get("size", 10)
+        limit = int(body["pit"]["id"].rsplit("-", 1)[1]) if "pit" in body else None
+        started = time.perf_counter()
+        response = run_search(self.index, body, size, limit)
+        response["took"] = int((time.perf_counter() - started) * 1000)
+        if "pit" in body:
+            response["pit_id"] = body["pit"]["id"]
+        return response
+
+    def save(self, path):
+        with open(path, "w") as f:
+            for key, response in self.responses.items():
+                f.write(json.dumps({"key": key, "response": response}) + "\n")
+
+
+def load_recording(path):
+    with open(path) as f:
+        return {row["key"]: row["response"] for row in map(json.loads, f)}
+
+
+def make_handler(backend):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def _body(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            if not length:
+                return None
+            raw = self.rfile.read(length)
+            if "ndjson" in (self.headers.get("Content-Type") or ""):
+                return [json.loads(line) for line in raw.splitlines() if line.strip()]
+            return json.loads(raw)
+
+        def _dispatch(self):
+            url = urlsplit(self.path)
+            query = {k: v[-1] for k, v in parse_qs(url.query).items()}
+            try:
+                payload, status = backend.handle(self.command, url.path, query, self._body()), 200
+            except Exception as e:
+                payload, status = {"error": {"type": "fake_es_exception", "reason": str(e)}, "status": 400}, 400
+            data = b"" if self.command == "HEAD" else json.dumps(payload).encode()
+            self.send_response(status)
+            for name, value in PRODUCT_HEADERS.items():
+                self.send_header(name, value)
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        do_GET = do_POST = do_DELETE = do_HEAD = do_PUT = _dispatch
+
+    return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--root", help="Log tree to serve through the local index")
+    parser.add_argument("--index-dir", help="Local index directory (built/updated from --root on startup)")
+    parser.add_argument("--replay", help="Serve responses recorded with --record")
+    parser.add_argument("--record", help="Write the request -> response recording here on shutdown")
+    parser.add_argument("--no-memo", action="store_true", help="Evaluate every request, even repeated ones")
+    parser.add_argument("--delay-ms", type=float, default=0.0, help="Added server-side latency per request")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9299)
+    args = parser.parse_args()
+    if not args.root and not args.replay:
+        parser.error("one of --root or --replay is required")
+
+    index = None
+    if args.root:
+        from app.services.local_index import LocalIndex
+        if not args.index_dir:
+            parser.error("--index-dir is required with --root")
+        index = LocalIndex(args.index_dir)
+        index.update(args.root, "trainid_*/tests/ws/inference/workdir-inference-*/logmessages.txt")
+    backend = Backend(index, load_recording(args.replay) if args.replay else None,
+                      memoise=not args.no_memo, delay_ms=args.delay_ms)
+
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(backend))
+    server.daemon_threads = True
+    signal.signal(signal.SIGTERM, lambda *_: threading.Thread(target=server.shutdown).start())
+    print(f"fake Elasticsearch listening on http://{args.host}:{args.port}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if args.record:
+            backend.save(args.record)
+        if backend.misses:
+            print(f"{backend.misses} searches had no recorded response")
+        if index is not None:
+            index.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""
+Ingest throughput benchmark: `python -m ingest` vs the Logstash pipeline (logstash.conf).
+
+The Python ingester is run as a subprocess over the tree; docs/s and the peak resident memory
+of its whole process tree (parser pool included) are sampled from /proc. For Logstash, point a
+running instance at the same tree (e.g. with docker-compose and a fresh sincedb) and pass
+--logstash-url: the benchmark polls its monitoring API until the expected number of events has
+been emitted, and reports docs/s and peak JVM heap.
+
+Usage (from api_layer/):
+    python -m bench.synthetic /tmp/cs1-logs --trains 20 --tests 10 --lines 50000
+    python -m bench.ingest_bench /tmp/cs1-logs --es-url http://localhost:9200
+    python -m bench.ingest_bench /tmp/cs1-logs --skip-python --logstash-url http://localhost:9600
+"""
+from ingest.__main__ import find_files, DEFAULT_GLOB
+from ingest.parser import parse_range
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+import urllib.request
+
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+def tree_rss(pid):
+    """
+    Resident memory in bytes of `pid` and all its descendants (Linux /proc).
+    """
+    children = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                fields = f.read().rsplit(")", 1)[1].split()
+            children.setdefault(int(fields[1]), []).append((int(entry), int(fields[21])))
+        except (OSError, IndexError, ValueError):
+            continue
+    total, stack = 0, [pid]
+    try:
+        with open(f"/proc/{pid}/statm") as f:
+            total = int(f.read().split()[1]) * PAGE_SIZE
+    except OSError:
+        return 0
+    while stack:
+        for child, rss_pages in children.get(stack.pop(), []):
+            total += rss_pages * PAGE_SIZE
+            stack.append(child)
+    return total
+
+
+def count_events(root, pattern):
+    files = find_files(root, pattern, [], 0)
+    return sum(len(parse_range(path)) for path, _ in files)
+
+
+def bench_python(args, expected):
+    cmd = [sys.executable, "-m", "ingest", args.root, "--glob", args.glob, "--ignore-older", "0",
+           "--es-url", args.es_url, "--index", args.index, "--workers", str(args.workers),
+           "--batch-size", str(args.batch_size), "--bulk-threads", str(args.bulk_threads)]
+    if args.dry_run:
+        cmd.append("--dry-run")
+    started = time.perf_counter()
+    proc = subprocess.Popen(cmd, cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    peak = 0
+    while proc.poll() is None:
+        peak = max(peak, tree_rss(proc.pid))
+        time.sleep(0.2)
+    elapsed = time.perf_counter() - started
+    return {"engine": "python", "exit_code": proc.returncode, "events": expected, "seconds": round(elapsed, 2),
+            "docs_per_sec": round(expected / elapsed), "peak_rss_mb": round(peak / 1e6, 1)}
+
+
+def logstash_stats(url):
+    with urllib.request.urlopen(f"{url}/_node/stats/events,jvm") as res:
+        return json.load(res)
+
+
+def bench_logstash(args, expected):
+    baseline = logstash_stats(args.logstash_url)["events"]["out"]
+    started, last_change, last_out, peak_heap = time.perf_counter(), time.perf_counter(), baseline, 0
+    while True:
+        stats = logstash_stats(args.logstash_url)
+        out = stats["events"]["out"] - baseline
+        peak_heap = max(peak_heap, stats["jvm"]["mem"]["heap_used_in_bytes"])
+        if out != last_out:
+            last_out, last_change = out, time.perf_counter()
+        if out >= expected or time.perf_counter() - last_change > args.idle_timeout:
+            break
+        time.sleep(0.5)
+    elapsed = last_change - started
+    return {"engine": "logstash", "events": out, "seconds": round(elapsed, 2),
+            "docs_per_sec": round(out / elapsed) if elapsed else 0, "peak_heap_mb": round(peak_heap / 1e6, 1)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("root")
+    parser.add_argument("--glob", default=DEFAULT_GLOB)
+    parser.add_argument("--es-url", default="http://localhost:9200")
+    parser.add_argument("--index", default="cs1_logs-write")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--batch-size", type=int, default=2000)
+    parser.add_argument("--bulk-threads", type=int, default=4)
+    parser.add_argument("--dry-run", action="store_true", help="measure parsing only")
+    parser.add_argument("--skip-python", action="store_true")
+    parser.add_argument("--logstash-url", help="Logstash monitoring API, e.g. http://localhost:9600")
+    parser.add_argument("--idle-timeout", type=float, default=60, help="stop waiting for Logstash after this idle time")
+    parser.add_argument("--output", help="write results as JSON to this path")
+    args = parser.parse_args()
+
+    expected = count_events(args.root, args.glob)
+    print(f"{expected} events under {args.root}")
+    results = []
+    if not args.skip_python:
+        results.append(bench_python(args, expected))
+    if args.logstash_url:
+        results.append(bench_logstash(args, expected))
+    for row in results:
+        print(json.dumps(row))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,341 @@
+"""
+API load test: drives every router endpoint under concurrent load and reports latency
+percentiles, throughput and API-process memory, optionally against a saved baseline.
+
+Steps:
+1. Writes a synthetic cs1 log tree (bench.synthetic) of trains x tests x lines, unless
+   --root already holds one.
+2. Starts a search backend:
+   - `fake` (default): bench.fake_es over that tree (or a --replay recording), so the numbers
+     reflect the API's own overhead with no cluster;
+   - `local`: the API's offline backend (SEARCH_BACKEND=local);
+   - `es`: a real cluster at --es-url, loaded through the repo's index template
+     (ilm/api_index_template.txt) and the Python ingester unless --skip-load.
+3. Starts the API with uvicorn and, per scenario, runs --concurrency clients for --duration
+   seconds after a short warm-up, sampling the resident memory of the API process tree.
+
+Usage (from api_layer/):
+    python -m bench.load_bench --trains 10 --tests 5 --lines 5000 --concurrency 32 --output run.json
+    python -m bench.load_bench --baseline bench/baselines/fake_small.json --fail-on-regression
+    python -m bench.load_bench --backend es --es-url http://localhost:9200 --only logs_train stats_trains
+"""
+from bench.ingest_bench import tree_rss
+from bench.synthetic import generate_tree
+import aiohttp
+import argparse
+import asyncio
+import glob
+import json
+import os
+import platform
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+API_KEY = "bench"
+BENCH_INDEX = "bench_cs1_logs-000001"
+BENCH_PATTERN = "bench_cs1_logs-*"
+LOG_GLOB = "trainid_*/tests/ws/inference/workdir-inference-*/logmessages.txt"
+TEMPLATE_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))),
+                             "ilm", "api_index_template.txt")
+API_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Patterns taken from bench.synthetic.MESSAGES: frequent, rare and absent.
+PATTERNS = ["timeout", "CUDA_ERROR", "NoSuchSignature"]
+
+
+def scenarios(train_id, test_id):
+    """
+    One request shape per endpoint: (name, method, path, json_body).
+    """
+    p = PATTERNS
+    return [
+        ("health", "GET", "/health", None),
+        ("logs_train", "GET", f"/logs/train/{train_id}?size=100", None),
+        ("logs_train_pattern", "GET", f"/logs/train/{train_id}?pattern={p[0]}&size=100", None),
+        ("logs_test", "GET", f"/logs/test/{test_id}?size=1000", None),
+        ("logs_file", "GET", "/logs/file/logmessages.txt?size=100", None),
+        ("logs_test_export", "GET", f"/logs/test/{test_id}/export", None),
+        ("search_errors", "GET", f"/search/errors?pattern={p[1]}&size=100", None),
+        ("search_pattern", "GET", f"/search/pattern?pattern={p[0]}%20AND%20worker&size=100", None),
+        ("stats_files", "GET", f"/stats/files?pattern={p[1]}", None),
+        ("stats_trains", "GET", f"/stats/trains?pattern={p[1]}", None),
+        ("stats_tests", "GET", f"/stats/tests?pattern={p[1]}", None),
+        ("stats_timeline_pattern", "GET", f"/stats/errors/timeline?pattern={p[1]}&days=7&interval=hour", None),
+        ("stats_timeline_rollup", "GET", "/stats/errors/timeline?days=7&interval=hour", None),
+        ("stats_counts", "GET", "/stats/counts?group_by=test_id&days=7", None),
+        ("stats_summary", "GET", f"/stats/summary?pattern={p[0]}", None),
+        ("stats_batch", "POST", "/stats/batch", {"patterns": p * 10, "group_by": "train_id"}),
+        ("metrics", "GET", "/metrics", None),
+    ]
+
+
+def free_port():
+    import socket
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_http(url, proc, timeout=300):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if proc is not None and proc.poll() is not None:
+            raise RuntimeError(f"{url}: process exited with {proc.returncode}")
+        try:
+            urllib.request.urlopen(url, timeout=2)
+            return
+        except Exception:
+            time.sleep(0.2)
+    raise RuntimeError(f"{url} did not come up within {timeout}s")
+
+
+def ensure_tree(args):
+    if glob.glob(os.path.join(args.root, LOG_GLOB)):
+        print(f"reusing log tree under {args.root}")
+    else:
+        generate_tree(args.root, args.trains, args.tests, args.lines, args.seed)
+        print(f"wrote {args.trains * args.tests} files x {args.lines} events under {args.root}")
+    paths = sorted(glob.glob(os.path.join(args.root, LOG_GLOB)))
+    match = re.search(r"trainid_([^/]+)/.*workdir-inference-([^/]+)/", paths[0])
+    return match.group(1), match.group(2)
+
+
+def load_template():
+    """
+    The JSON payload of ilm/api_index_template.txt, retargeted at the benchmark index.
+    """
+    with open(TEMPLATE_PATH) as f:
+        text = f.read()
+    template = json.loads(text[text.index("'", text.index("-d")) + 1:text.rindex("'")])
+    template["index_patterns"] = [BENCH_PATTERN]
+    settings = template["template"]["settings"]
+    for key in [k for k in settings if k.startswith("index.lifecycle")]:
+        del settings[key]
+    settings["index.number_of_replicas"] = 0
+    return template
+
+
+def load_es(args):
+    from elasticsearch import Elasticsearch
+    es = Elasticsearch(args.es_url, request_timeout=600)
+    es.indices.put_index_template(name="bench_cs1_logs_template", **load_template())
+    es.indices.delete(index=BENCH_INDEX, ignore_unavailable=True)
+    es.indices.create(index=BENCH_INDEX)
+    with tempfile.TemporaryDirectory() as tmp:
+        subprocess.run([sys.executable, "-m", "ingest", args.root, "--es-url", args.es_url, "--index", BENCH_INDEX,
+                        "--ignore-older", "0", "--full", "--checkpoint-db", os.path.join(tmp, "ckpt.db")],
+                       cwd=API_DIR, check=True)
+    es.indices.refresh(index=BENCH_INDEX)
+    print(f"loaded {es.count(index=BENCH_INDEX)['count']} documents into {BENCH_INDEX}")
+
+
+def start_backend(args, env):
+    """
+    Starts (or prepares) the search backend and fills in the API's environment for it.
+
+    Returns:
+        subprocess.Popen: The fake ES process, or None.
+    """
+    index_dir = os.path.join(args.root, ".bench-index")
+    if args.backend == "local":
+        subprocess.run([sys.executable, "-m", "app.services.local_index", "build", args.root,
+                        "--index-dir", index_dir], cwd=API_DIR, check=True)
+        env.update(SEARCH_BACKEND="local", LOCAL_INDEX_DIR=index_dir, LOCAL_REFRESH_SECONDS="0")
+        return None
+    if args.backend == "es":
+        if not args.skip_load:
+            load_es(args)
+        env.update(ELASTICSEARCH_URL=args.es_url, INDEX_PATTERN=BENCH_PATTERN, ROLLUP_INDEX=BENCH_PATTERN)
+        return None
+
+    port = free_port()
+    cmd = [sys.executable, "-m", "bench.fake_es", "--port", str(port), "--delay-ms", str(args.es_delay_ms)]
+    cmd += ["--replay", args.replay] if args.replay else ["--root", args.root, "--index-dir", index_dir]
+    if args.record:
+        cmd += ["--record", args.record]
+    proc = subprocess.Popen(cmd, cwd=API_DIR, stdout=subprocess.DEVNULL)
+    wait_http(f"http://127.0.0.1:{port}/", proc)
+    env.update(ELASTICSEARCH_URL=f"http://127.0.0.1:{port}")
+    return proc
+
+
+def start_api(args, env, port):
+    cmd = [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1", "--port", str(port),
+           "--workers", str(args.workers), "--log-level", "warning", "--no-access-log"]
+    log_path = os.path.join(args.root, "api.log")
+    with open(log_path, "w") as log:
+        proc = subprocess.Popen(cmd, cwd=API_DIR, env=env, stdout=log, stderr=subprocess.STDOUT)
+    wait_http(f"http://127.0.0.1:{port}/health", proc)
+    print(f"API started with {args.workers} worker(s), logging to {log_path}")
+    return proc
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))]
+
+
+async def run_scenario(session, base_url, scenario, args, api_pid):
+    name, method, path, body = scenario
+    url = base_url + path
+    latencies, errors, nbytes, peak_rss = [], 0, 0, 0
+
+    async def one():
+        nonlocal errors
+        started = time.perf_counter()
+        async with session.request(method, url, json=body, headers={"x-api-key": API_KEY}) as res:
+            data = await res.read()
+        elapsed = time.perf_counter() - started
+        if res.status >= 400:
+            errors += 1
+        return elapsed, len(data)
+
+    async def client(deadline, record):
+        nonlocal nbytes
+        while time.perf_counter() < deadline:
+            elapsed, size = await one()
+            if record:
+                latencies.append(elapsed)
+                nbytes += size
+
+    async def sample_memory(stop):
+        nonlocal peak_rss
+        while not stop.is_set():
+            peak_rss = max(peak_rss, tree_rss(api_pid))
+            await asyncio.sleep(0.1)
+
+    await asyncio.gather(*(client(time.perf_counter() + args.warmup, False) for _ in range(args.concurrency)))
+    errors = 0
+    stop = asyncio.Event()
+    sampler = asyncio.create_task(sample_memory(stop))
+    started = time.perf_counter()
+    await asyncio.gather(*(client(started + args.duration, True) for _ in range(args.concurrency)))
+    wall = time.perf_counter() - started
+    stop.set()
+    await sampler
+
+    ms = [x * 1000 for x in latencies]
+    return {
+        "scenario": name,
+        "requests": len(ms),
+        "errors": errors,
+        "rps": round(len(ms) / wall, 1),
+        "p50_ms": round(statistics.median(ms), 2) if ms else None,
+        "p90_ms": round(percentile(ms, 90), 2) if ms else None,
+        "p99_ms": round(percentile(ms, 99), 2) if ms else None,
+        "max_ms": round(max(ms), 2) if ms else None,
+        "avg_bytes": round(nbytes / len(ms)) if ms else 0,
+        "peak_rss_mb": round(peak_rss / 1e6, 1),
+    }
+
+
+async def drive(args, base_url, api_pid, train_id, test_id):
+    selected = [s for s in scenarios(train_id, test_id) if not args.only or s[0] in args.only]
+    connector = aiohttp.TCPConnector(limit=args.concurrency)
+    timeout = aiohttp.ClientTimeout(total=args.request_timeout)
+    results = []
+    async with aiohttp.ClientSession(base_url, connector=connector, timeout=timeout) as session:
+        for scenario in selected:
+            row = await run_scenario(session, "", scenario, args, api_pid)
+            results.append(row)
+            print(f"{row['scenario']:24} rps={row['rps']:<9} p50={row['p50_ms']}ms p99={row['p99_ms']}ms "
+                  f"errors={row['errors']:<4} bytes={row['avg_bytes']:<9} rss={row['peak_rss_mb']}MB", flush=True)
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """
+    Prints per-scenario ratios against a baseline run.
+
+    Returns:
+        list: Names of scenarios whose RPS dropped or p99 grew by more than `tolerance`.
+    """
+    base = {row["scenario"]: row for row in baseline["results"]}
+    regressions = []
+    print(f"\n{'scenario':24} {'rps':>16} {'p99 ms':>18}")
+    for row in results:
+        old = base.get(row["scenario"])
+        if not old or not old["rps"] or not old["p99_ms"] or row["p99_ms"] is None:
+            continue
+        rps_ratio, p99_ratio = row["rps"] / old["rps"], row["p99_ms"] / old["p99_ms"]
+        flag = rps_ratio < 1 - tolerance or p99_ratio > 1 + tolerance
+        if flag:
+            regressions.append(row["scenario"])
+        print(f"{row['scenario']:24} {old['rps']:>7}->{row['rps']:<8} {old['p99_ms']:>8}->{row['p99_ms']:<9}"
+              f"{'  REGRESSION' if flag else ''}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--root", default=os.path.join(tempfile.gettempdir(), "cs1-bench-logs"),
+                        help="Log tree to serve; generated if it holds no logmessages.txt files")
+    parser.add_argument("--trains", type=int, default=5)
+    parser.add_argument("--tests", type=int, default=4)
+    parser.add_argument("--lines", type=int, default=5000, help="events per file")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--backend", choices=["fake", "local", "es"], default="fake")
+    parser.add_argument("--es-url", default="http://localhost:9200", help="cluster for --backend es")
+    parser.add_argument("--skip-load", action="store_true", help="reuse the benchmark index (--backend es)")
+    parser.add_argument("--replay", help="fake backend: serve this recording instead of evaluating queries")
+    parser.add_argument("--record", help="fake backend: save the request -> response recording here")
+    parser.add_argument("--es-delay-ms", type=float, default=0.0, help="fake backend: added latency per call")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn worker processes")
+    parser.add_argument("--cache", action="store_true", help="leave the /stats result cache on")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=10.0, help="measured seconds per scenario")
+    parser.add_argument("--warmup", type=float, default=2.0, help="unmeasured seconds per scenario")
+    parser.add_argument("--request-timeout", type=float, default=120.0)
+    parser.add_argument("--only", nargs="+", help="scenario names to run")
+    parser.add_argument("--output", help="write results as JSON to this path (usable as a --baseline)")
+    parser.add_argument("--baseline", help="compare against a previous --output")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative RPS/p99 change")
+    parser.add_argument("--fail-on-regression", action="store_true")
+    args = parser.parse_args()
+
+    train_id, test_id = ensure_tree(args)
+    env = dict(os.environ, API_KEY=API_KEY, CACHE_ENABLED=str(args.cache).lower())
+    backend = start_backend(args, env)
+    api_port = free_port()
+    api = None
+    try:
+        api = start_api(args, env, api_port)
+        idle_rss = tree_rss(api.pid)
+        results = asyncio.run(drive(args, f"http://127.0.0.1:{api_port}", api.pid, train_id, test_id))
+    finally:
+        for proc in (api, backend):
+            if proc is not None:
+                proc.terminate()
+                proc.wait(timeout=30)
+
+    report = {
+        "config": {k: getattr(args, k) for k in ("backend", "trains", "tests", "lines", "workers", "cache",
+                                                 "concurrency", "duration", "es_delay_ms")},
+        "host": {"cpus": os.cpu_count(), "python": platform.python_version(), "machine": platform.machine()},
+        "idle_rss_mb": round(idle_rss / 1e6, 1),
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        for section in ("config", "host"):
+            changed = {k: (v, report[section].get(k)) for k, v in baseline[section].items() if report[section].get(k) != v}
+            if changed:
+                print(f"warning: baseline {section} differs (baseline, current): {changed}")
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"\n{len(regressions)} scenario(s) regressed beyond {args.tolerance:.0%}: {', '.join(regressions)}")
+            if args.fail_on_regression:
+                sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
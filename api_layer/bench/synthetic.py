@@ -0,0 +1,93 @@
+"""
+Synthetic cs1 job-log trees, laid out like /cb/cs1-job-logs/siemens_logs:
+
+    trainid_<id>/tests/ws/inference/workdir-inference-<test>/logmessages.txt
+
+Usage (from api_layer/):
+    python -m bench.synthetic /tmp/cs1-logs --trains 20 --tests 10 --lines 50000
+"""
+from datetime import datetime, timedelta, timezone
+import argparse
+import os
+import random
+
+LEVELS = ["INFO"] * 12 + ["DEBUG"] * 4 + ["WARNING"] * 3 + ["ERROR"]
+SOURCES = ["runtime.executor", "compiler.kernel", "scheduler", "io.checkpoint", "net.worker"]
+MESSAGES = [
+    "Starting step {n} of {m}",
+    "Loaded checkpoint /cb/ckpt/{hex}/model.pt in {n}ms",
+    "Connection timeout after {n}ms to worker-{m}",
+    "CUDA_ERROR_LAUNCH_FAILED on device {m} at 0x{hex}",
+    "Retrying request {hex} ({m}/5)",
+    "Compiled kernel {hex} in {n}ms",
+    "Throughput {n} samples/s on {m} replicas",
+]
+TRACE_RATIO = 0.01
+
+
+def random_hex(rng, length=12):
+    return "".join(rng.choice("0123456789abcdef") for _ in range(length))
+
+
+def train_dir(root, train_id, test_id):
+    return os.path.join(root, f"trainid_{train_id}", "tests", "ws", "inference", f"workdir-inference-{test_id}")
+
+
+def write_log(path, lines, start, rng):
+    """
+    Writes one logmessages.txt with `lines` events, a few of them multi-line stack traces.
+
+    Returns:
+        int: Number of events written.
+    """
+    ts = start
+    with open(path, "w") as f:
+        for _ in range(lines):
+            ts += timedelta(milliseconds=rng.randint(1, 500))
+            stamp = ts.strftime("%Y-%m-%d %H:%M:%S,") + f"{ts.microsecond // 1000:03d}"
+            level = rng.choice(LEVELS)
+            msg = rng.choice(MESSAGES).format(n=rng.randint(1, 100000), m=rng.randint(1, 64), hex=random_hex(rng))
+            f.write(f"{stamp} {level} [{rng.choice(SOURCES)}] {msg}\n")
+            if level == "ERROR" and rng.random() < TRACE_RATIO * 20:
+                for depth in range(rng.randint(3, 30)):
+                    f.write(f"    at cerebras.{random_hex(rng, 6)}.run(frame.py:{depth + 1})\n")
+    return lines
+
+
+def generate_tree(root, trains, tests, lines, seed=42, start=None):
+    """
+    Generates `trains` x `tests` log files of `lines` events each under `root`.
+
+    Returns:
+        list: (train_id, test_id, path) for every file written.
+    """
+    rng = random.Random(seed)
+    start = start or datetime.now(timezone.utc).replace(tzinfo=None) - timedelta(days=3)
+    written = []
+    for _ in range(trains):
+        train_id = random_hex(rng, 24)
+        for t in range(tests):
+            test_id = f"{train_id[:6]}-{t:03d}"
+            directory = train_dir(root, train_id, test_id)
+            os.makedirs(directory, exist_ok=True)
+            path = os.path.join(directory, "logmessages.txt")
+            write_log(path, lines, start + timedelta(minutes=rng.randint(0, 24 * 60)), rng)
+            written.append((train_id, test_id, path))
+    return written
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("root")
+    parser.add_argument("--trains", type=int, default=10)
+    parser.add_argument("--tests", type=int, default=10)
+    parser.add_argument("--lines", type=int, default=10000, help="events per file")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+    written = generate_tree(args.root, args.trains, args.tests, args.lines, args.seed)
+    size = sum(os.path.getsize(p) for _, _, p in written)
+    print(f"wrote {len(written)} files, {len(written) * args.lines} events, {size / 1e6:.1f} MB under {args.root}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+"""
+Substring query benchmark: `message.keyword` vs `message.wildcard`.
+
+Loads the same synthetic cs1 log documents into two indices, one with the old mapping
+(keyword subfield only) and one with the current template (keyword + wildcard subfields),
+then times the `*pattern*` query shape used by /search/errors and /stats/* against each.
+
+Usage (from api_layer/):
+    python -m bench.wildcard_bench --es-url http://localhost:9200 --docs 20000000
+    python -m bench.wildcard_bench --skip-load --runs 50 --output wildcard.json
+
+About 20M documents produce an index of a few GB per mapping.
+"""
+from elasticsearch import Elasticsearch, helpers
+import argparse
+import json
+import random
+import statistics
+import string
+import time
+
+KEYWORD_INDEX = "bench_substring_keyword"
+WILDCARD_INDEX = "bench_substring_wildcard"
+
+BASE_PROPERTIES = {
+    "@timestamp": {"type": "date"},
+    "file_name": {"type": "keyword"},
+    "train_id": {"type": "keyword"},
+    "test_id": {"type": "keyword"},
+    "log_level": {"type": "keyword"},
+    "source": {"type": "keyword"},
+}
+
+MESSAGE_MAPPINGS = {
+    KEYWORD_INDEX: {"type": "text", "fields": {
+        "keyword": {"type": "keyword", "ignore_above": 1024},
+    }},
+    WILDCARD_INDEX: {"type": "text", "fields": {
+        "keyword": {"type": "keyword", "ignore_above": 1024},
+        "wildcard": {"type": "wildcard"},
+    }},
+}
+
+FIELDS = {KEYWORD_INDEX: "message.keyword", WILDCARD_INDEX: "message.wildcard"}
+
+DEFAULT_PATTERNS = ["NullPointer", "CUDA_ERROR", "timeout after", "rror", "0x7f"]
+
+TEMPLATES = [
+    "Starting step {n} of {m}",
+    "Loaded checkpoint from /cb/ckpt/{hex}/model.pt",
+    "Connection timeout after {n}ms to worker-{m}",
+    "CUDA_ERROR_LAUNCH_FAILED on device {m} at 0x{hex}",
+    "Retrying request {hex} ({n}/{m})",
+    "java.lang.NullPointerException in handler {hex}",
+    "Compiled kernel {hex} in {n}ms",
+]
+
+
+def random_hex(rng, length=12):
+    return "".join(rng.choice("0123456789abcdef") for _ in range(length))
+
+
+def make_message(rng, long_ratio):
+    """
+    One synthetic log message; a fraction are multi-line stack traces longer than 1024 chars.
+    """
+    msg = rng.choice(TEMPLATES).format(n=rng.randint(1, 100000), m=rng.randint(1, 64), hex=random_hex(rng))
+    if rng.random() < long_ratio:
+        frames = "\n".join(
+            f"    at com.cerebras.{''.join(rng.choices(string.ascii_lowercase, k=8))}.Run(Run.java:{rng.randint(1, 999)})"
+            for _ in range(rng.randint(20, 60))
+        )
+        msg = f"{msg}\n{frames}"
+    return msg
+
+
+def generate_docs(count, long_ratio, seed):
+    rng = random.Random(seed)
+    start = int(time.time()) - 7 * 86400
+    trains = [random_hex(rng, 26) for _ in range(max(1, count // 200000))]
+    for i in range(count):
+        train = trains[i % len(trains)]
+        yield {
+            "@timestamp": (start + i * 7 * 86400 // max(count, 1)) * 1000,
+            "file_name": "logmessages.txt",
+            "train_id": train,
+            "test_id": f"{train[:8]}-{i % 50}",
+            "log_level": rng.choice(["INFO", "INFO", "INFO", "WARNING", "ERROR"]),
+            "source": rng.choice(["runtime", "compiler", "scheduler"]),
+            "message": make_message(rng, long_ratio),
+        }
+
+
+def load(es, docs, long_ratio, seed, batch_size):
+    for index, message_mapping in MESSAGE_MAPPINGS.items():
+        es.indices.delete(index=index, ignore_unavailable=True)
+        es.indices.create(
+            index=index,
+            settings={"number_of_shards": 1, "number_of_replicas": 0, "refresh_interval": "-1"},
+            mappings={"properties": dict(BASE_PROPERTIES, message=message_mapping)},
+        )
+        started = time.perf_counter()
+        actions = ({"_index": index, "_source": doc} for doc in generate_docs(docs, long_ratio, seed))
+        for ok, item in helpers.streaming_bulk(es, actions, chunk_size=batch_size, raise_on_error=False):
+            if not ok:
+                print(f"bulk error: {item}")
+        es.indices.put_settings(index=index, settings={"refresh_interval": "1s"})
+        es.indices.refresh(index=index)
+        es.indices.forcemerge(index=index, max_num_segments=1)
+        size = es.indices.stats(index=index)["indices"][index]["total"]["store"]["size_in_bytes"]
+        print(f"loaded {docs} docs into {index} in {time.perf_counter() - started:.1f}s ({size / 1e9:.2f} GB)")
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))]
+
+
+def run_queries(es, patterns, runs):
+    results = []
+    for pattern in patterns:
+        for index, field in FIELDS.items():
+            took, wall, hits = [], [], 0
+            for _ in range(runs):
+                started = time.perf_counter()
+                res = es.search(
+                    index=index,
+                    query={"wildcard": {field: f"*{pattern}*"}},
+                    size=0,
+                    track_total_hits=True,
+                    request_cache=False,
+                )
+                wall.append((time.perf_counter() - started) * 1000)
+                took.append(res["took"])
+                hits = res["hits"]["total"]["value"]
+            row = {
+                "pattern": pattern,
+                "field": field,
+                "hits": hits,
+                "took_p50_ms": statistics.median(took),
+                "took_p95_ms": percentile(took, 95),
+                "wall_p50_ms": round(statistics.median(wall), 1),
+                "wall_p95_ms": round(percentile(wall, 95), 1),
+            }
+            results.append(row)
+            print(f"{pattern!r:18} {field:18} hits={hits:<10} took p50={row['took_p50_ms']}ms "
+                  f"p95={row['took_p95_ms']}ms wall p50={row['wall_p50_ms']}ms")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--es-url", default="http://localhost:9200")
+    parser.add_argument("--docs", type=int, default=2_000_000, help="documents per index")
+    parser.add_argument("--long-ratio", type=float, default=0.02, help="fraction of messages over 1024 chars")
+    parser.add_argument("--batch-size", type=int, default=5000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--runs", type=int, default=20, help="timed runs per pattern and field")
+    parser.add_argument("--patterns", nargs="+", default=DEFAULT_PATTERNS)
+    parser.add_argument("--skip-load", action="store_true", help="reuse indices from a previous run")
+    parser.add_argument("--output", help="write results as JSON to this path")
+    args = parser.parse_args()
+
+    es = Elasticsearch(args.es_url, request_timeout=600)
+    if not args.skip_load:
+        load(es, args.docs, args.long_ratio, args.seed, args.batch_size)
+    results = run_queries(es, args.patterns, args.runs)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"docs": args.docs, "long_ratio": args.long_ratio, "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
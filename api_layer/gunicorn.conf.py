@@ -0,0 +1,60 @@
+"""
+Production server profile: gunicorn managing uvicorn workers.
+
+    gunicorn -c gunicorn.conf.py app.main:app      (what start.sh runs by default)
+
+- One worker per available core (CPU affinity and cgroup quota respected);
+  override with WEB_CONCURRENCY.
+- The app is imported once in the master (preload_app), so settings, routers and
+  dependencies are loaded a single time and shared copy-on-write. Each worker still opens
+  its own Elasticsearch pool in the lifespan, bound to its own event loop, and warms it
+  before accepting traffic.
+- On SIGTERM, workers stop accepting connections and finish in-flight requests (long
+  exports included) for up to GRACEFUL_TIMEOUT seconds before being killed.
+- Prometheus metrics are aggregated across workers via PROMETHEUS_MULTIPROC_DIR.
+"""
+import os
+import shutil
+import tempfile
+
+
+def available_cpus():
+    """
+    Cores this process may actually use: CPU affinity, capped by a cgroup v2 CPU quota.
+    """
+    cpus = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count() or 1
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            quota, period = f.read().split()
+        if quota != "max":
+            cpus = min(cpus, max(1, int(int(quota) / int(period))))
+    except (OSError, ValueError):
+        pass
+    return cpus
+
+
+bind = f"{os.environ.get('API_HOST', '0.0.0.0')}:{os.environ.get('API_PORT', '8000')}"
+worker_class = "uvicorn.workers.UvicornWorker"
+workers = int(os.environ.get("WEB_CONCURRENCY") or available_cpus())
+preload_app = True
+
+# Exports can stream for minutes; only a stuck worker (no heartbeat) is killed.
+timeout = int(os.environ.get("WORKER_TIMEOUT", "120"))
+graceful_timeout = int(os.environ.get("GRACEFUL_TIMEOUT", "30"))
+keepalive = int(os.environ.get("KEEPALIVE", "5"))
+backlog = 2048
+
+loglevel = os.environ.get("LOG_LEVEL", "info")
+accesslog = os.environ.get("ACCESS_LOG") or None
+
+# Must be set before prometheus_client is imported by the preloaded app.
+if "PROMETHEUS_MULTIPROC_DIR" not in os.environ:
+    os.environ["PROMETHEUS_MULTIPROC_DIR"] = os.path.join(tempfile.gettempdir(), "triage-api-metrics")
+multiproc_dir = os.environ["PROMETHEUS_MULTIPROC_DIR"]
+shutil.rmtree(multiproc_dir, ignore_errors=True)
+os.makedirs(multiproc_dir, exist_ok=True)
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
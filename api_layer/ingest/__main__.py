@@ -0,0 +1,265 @@
+"""
+Bulk-load cs1 `logmessages.txt` files into Elasticsearch without Logstash.
+
+Files are split into byte ranges that a process pool parses in parallel (multiline joins,
+grok-equivalent field extraction, path-derived IDs; see ingest.parser). The parsed documents
+are streamed to `helpers.parallel_bulk`, so memory is bounded by the number of ranges in flight.
+
+Ingest is incremental: a checkpoint database (ingest.checkpoint) records how far each file has
+been indexed, unchanged files are skipped and grown files are resumed. Document IDs are derived
+from the file path and event offset, so replaying a file overwrites rather than duplicates.
+Note that IDs are only unique per backing index: replays that land after a rollover of the
+write alias can still duplicate events.
+
+Usage (from api_layer/):
+    python -m ingest /cb/cs1-job-logs/siemens_logs --es-url http://localhost:9200
+    python -m ingest ./logs --glob '**/*.log' --dry-run
+    python -m ingest /cb/cs1-job-logs/siemens_logs --full   # ignore checkpoints
+"""
+from elasticsearch import Elasticsearch, helpers
+from multiprocessing import Pool
+from collections import deque, namedtuple
+from ingest.checkpoint import CheckpointStore, resume_offset
+from ingest.parser import parse_range, split_ranges
+import argparse
+import fnmatch
+import glob
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger("api_layer.ingest")
+
+# Same file selection as logstash.conf
+DEFAULT_GLOB = "trainid_*/tests/ws/inference/workdir-inference-*/logmessages.txt"
+DEFAULT_EXCLUDE = ["*.tmp", "*.bak", "*.swp"]
+DEFAULT_IGNORE_OLDER = 1209600
+
+
+def find_files(root, pattern, exclude, ignore_older):
+    """
+    Files under `root` matching `pattern`, skipping excluded names and files not modified
+    within `ignore_older` seconds (0 disables the age check).
+
+    Returns:
+        list: (path, os.stat_result) tuples.
+    """
+    now = time.time()
+    files = []
+    for path in sorted(glob.glob(os.path.join(root, pattern), recursive=True)):
+        name = os.path.basename(path)
+        if any(fnmatch.fnmatch(name, ex) for ex in exclude):
+            continue
+        try:
+            st = os.stat(path)
+        except OSError:
+            continue
+        if ignore_older and now - st.st_mtime > ignore_older:
+            continue
+        files.append((path, st))
+    return files
+
+
+# One file to (re-)read from `start`; `st` is the stat snapshot the checkpoint will record.
+FileWork = namedtuple("FileWork", "path st start")
+
+
+def plan_work(files, store, full=False):
+    """
+    Decides which files need reading and from where, using the checkpoint store.
+
+    Returns:
+        tuple: (list of FileWork, number of unchanged files skipped)
+    """
+    work, skipped = [], 0
+    for path, st in files:
+        start = 0 if full or store is None else resume_offset(store.get(path), st)
+        if start is None:
+            skipped += 1
+            continue
+        work.append(FileWork(path, st, start))
+    return work, skipped
+
+
+class CheckpointTracker:
+    """
+    Advances a file's checkpoint once every bulk item emitted for it has been acknowledged.
+
+    Actions are emitted (from parallel_bulk's feeder thread) in file order and results come
+    back in the same order, so each file maps to a contiguous span of result positions.
+    A file with any failed item keeps its old checkpoint and is retried next run.
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self.emitted = 0
+        self.acked = 0
+        self.committed = 0
+        self._file_start = 0
+        self._failures = deque()
+        self._spans = deque()
+        self._lock = threading.Lock()
+
+    def emit(self):
+        self.emitted += 1
+
+    def file_done(self, work, offset):
+        with self._lock:
+            self._spans.append((self._file_start, self.emitted, work, offset))
+            self._file_start = self.emitted
+        self._commit_ready()
+
+    def result(self, ok):
+        # Under the lock: a span check between the two updates would miss this failure.
+        with self._lock:
+            self.acked += 1
+            if not ok:
+                self._failures.append(self.acked)
+        self._commit_ready()
+
+    def _commit_ready(self):
+        with self._lock:
+            while self._spans and self._spans[0][1] <= self.acked:
+                first, last, work, offset = self._spans.popleft()
+                failed = False
+                while self._failures and self._failures[0] <= last:
+                    failed = self._failures.popleft() > first or failed
+                if failed:
+                    logger.warning(f"Not checkpointing {work.path}: some events failed to index")
+                elif self.store is not None:
+                    self.store.save(work.path, work.st, offset)
+                    self.committed += 1
+
+
+def _parse_task(task):
+    path, start, end = task
+    return parse_range(path, start, end)
+
+
+def bounded_imap(pool, func, tasks, window):
+    """
+    Ordered pool.imap() that keeps at most `window` tasks queued, so results are never
+    produced faster than the consumer (the bulk indexer) takes them.
+    """
+    pending = deque()
+    for task in tasks:
+        pending.append(pool.apply_async(func, (task,)))
+        if len(pending) >= window:
+            yield pending.popleft().get()
+    while pending:
+        yield pending.popleft().get()
+
+
+def iter_actions(work, index, workers, chunk_bytes, stats, tracker):
+    """
+    Parses files in a process pool and yields bulk index actions with deterministic IDs.
+    """
+    tasks = []
+    for item in work:
+        ranges = split_ranges(item.path, item.st.st_size, chunk_bytes, item.start)
+        for i, task in enumerate(ranges):
+            tasks.append((item, i == len(ranges) - 1, task))
+
+    last_offset = {}
+    with Pool(processes=workers) as pool:
+        results = bounded_imap(pool, _parse_task, (task for _, _, task in tasks), window=workers * 2)
+        done = set()
+        for (item, last_range, _), events in zip(tasks, results):
+            for offset, doc_id, doc in events:
+                stats["parsed"] += 1
+                tracker.emit()
+                yield {"_op_type": "index", "_index": index, "_id": doc_id, "_source": doc}
+            if events:
+                # Resume from the last event next time: it may still be growing.
+                last_offset[item.path] = events[-1][0]
+            if last_range:
+                tracker.file_done(item, last_offset.get(item.path, item.start))
+                done.add(item.path)
+
+    # Files with nothing new past their checkpoint still get their stat snapshot refreshed.
+    for item in work:
+        if item.path not in done:
+            tracker.file_done(item, item.start)
+
+
+def run(args):
+    files = find_files(args.root, args.glob, args.exclude, args.ignore_older)
+    store = None if args.dry_run else CheckpointStore(args.checkpoint_db)
+    work, skipped = plan_work(files, store, args.full)
+    total_bytes = sum(item.st.st_size - item.start for item in work)
+    logger.info(f"Found {len(files)} files under {args.root}: {skipped} unchanged, "
+                f"{len(work)} to read ({total_bytes / 1e6:.1f} MB new)")
+
+    stats = {"parsed": 0, "indexed": 0, "failed": 0}
+    tracker = CheckpointTracker(store)
+    started = time.perf_counter()
+    actions = iter_actions(work, args.index, args.workers, args.chunk_bytes, stats, tracker)
+
+    try:
+        if args.dry_run:
+            for _ in actions:
+                pass
+        else:
+            es = Elasticsearch(args.es_url, request_timeout=args.request_timeout)
+            for ok, item in helpers.parallel_bulk(
+                es,
+                actions,
+                thread_count=args.bulk_threads,
+                chunk_size=args.batch_size,
+                max_chunk_bytes=args.max_batch_bytes,
+                queue_size=args.bulk_threads * 2,
+                raise_on_error=False,
+                raise_on_exception=False,
+            ):
+                tracker.result(ok)
+                if ok:
+                    stats["indexed"] += 1
+                else:
+                    stats["failed"] += 1
+                    if stats["failed"] <= 10:
+                        logger.warning(f"Bulk item failed: {item}")
+    finally:
+        if store is not None:
+            store.close()
+
+    elapsed = time.perf_counter() - started
+    rate = stats["parsed"] / elapsed if elapsed else 0
+    logger.info(f"Parsed {stats['parsed']} events, indexed {stats['indexed']}, failed {stats['failed']} "
+                f"in {elapsed:.1f}s ({rate:,.0f} docs/s, {total_bytes / 1e6 / elapsed if elapsed else 0:.1f} MB/s); "
+                f"checkpointed {tracker.committed} files")
+    return stats
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="python -m ingest", description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("root", help="Root directory (e.g. /cb/cs1-job-logs/siemens_logs)")
+    parser.add_argument("--glob", default=DEFAULT_GLOB, help="File pattern relative to root")
+    parser.add_argument("--exclude", nargs="*", default=DEFAULT_EXCLUDE, help="File name patterns to skip")
+    parser.add_argument("--ignore-older", type=int, default=DEFAULT_IGNORE_OLDER,
+                        help="Skip files not modified for this many seconds (0 = no limit)")
+    parser.add_argument("--es-url", default=os.environ.get("ELASTICSEARCH_URL", "http://localhost:9200"))
+    parser.add_argument("--index", default="cs1_logs-write", help="Target index or write alias")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Parser processes")
+    parser.add_argument("--chunk-bytes", type=int, default=8 * 1024 * 1024,
+                        help="Bytes of a file parsed per task")
+    parser.add_argument("--batch-size", type=int, default=2000, help="Documents per bulk request")
+    parser.add_argument("--max-batch-bytes", type=int, default=20 * 1024 * 1024, help="Bytes per bulk request")
+    parser.add_argument("--bulk-threads", type=int, default=4, help="Concurrent bulk requests")
+    parser.add_argument("--request-timeout", type=float, default=120.0)
+    parser.add_argument("--checkpoint-db", default=os.environ.get("INGEST_CHECKPOINT_DB", "ingest_checkpoints.db"),
+                        help="SQLite file holding per-file ingest checkpoints")
+    parser.add_argument("--full", action="store_true", help="Ignore checkpoints and re-read every file")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="Parse only; do not send to Elasticsearch or touch checkpoints")
+    return parser
+
+
+def main(argv=None):
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    run(build_parser().parse_args(argv))
+
+
+if __name__ == "__main__":
+    main()
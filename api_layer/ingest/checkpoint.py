@@ -0,0 +1,74 @@
+"""
+Persistent per-file ingest checkpoints (SQLite).
+
+Each file is identified by (device, inode) and remembers the size and mtime it had when it
+was last ingested, plus the byte offset to resume from. The offset is the start of the last
+event read, so an event that was still being written is re-read (and, thanks to deterministic
+document IDs, overwritten) on the next run.
+"""
+from collections import namedtuple
+import sqlite3
+import time
+
+Checkpoint = namedtuple("Checkpoint", "path dev inode size mtime offset")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS checkpoints (
+    path TEXT PRIMARY KEY,
+    dev INTEGER NOT NULL,
+    inode INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    mtime REAL NOT NULL,
+    offset INTEGER NOT NULL,
+    updated_at REAL NOT NULL
+)
+"""
+
+
+class CheckpointStore:
+    """
+    SQLite-backed checkpoint table. Writes are committed immediately, so a crash loses at
+    most the files whose bulk requests had not been acknowledged yet.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(SCHEMA)
+        self._db.commit()
+
+    def get(self, path):
+        row = self._db.execute(
+            "SELECT path, dev, inode, size, mtime, offset FROM checkpoints WHERE path = ?", (path,)
+        ).fetchone()
+        return Checkpoint(*row) if row else None
+
+    def save(self, path, st, offset):
+        self._db.execute(
+            "INSERT OR REPLACE INTO checkpoints (path, dev, inode, size, mtime, offset, updated_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (path, st.st_dev, st.st_ino, st.st_size, st.st_mtime, offset, time.time()),
+        )
+        self._db.commit()
+
+    def close(self):
+        self._db.close()
+
+
+def resume_offset(checkpoint, st):
+    """
+    Decides where to resume reading a file.
+
+    Returns:
+        int or None: The byte offset to start from, or None if the file is unchanged
+        since its checkpoint and can be skipped.
+    """
+    if checkpoint is None:
+        return 0
+    if (checkpoint.dev, checkpoint.inode) != (st.st_dev, st.st_ino) or st.st_size < checkpoint.offset:
+        # Replaced or truncated: start over.
+        return 0
+    if st.st_size == checkpoint.size and st.st_mtime == checkpoint.mtime:
+        return None
+    return checkpoint.offset
@@ -0,0 +1,158 @@
+"""
+Parsing of cs1 `logmessages.txt` files, equivalent to the Logstash pipeline in logstash.conf:
+
+- multiline codec: a line that does not start with a timestamp is appended to the previous event;
+- grok: `<timestamp> <LEVEL> [<source>] <message>`;
+- date filter: the timestamp becomes `@timestamp` (UTC);
+- ruby filter: `train_id`, `test_id` and `file_name` are derived from the file path.
+"""
+from datetime import datetime, timezone
+import hashlib
+import os
+import re
+
+# multiline codec pattern
+EVENT_START = re.compile(rb"^\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2},\d{3}")
+
+# grok pattern (message may span lines)
+EVENT_RE = re.compile(
+    r"^(?P<log_timestamp>\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2},\d{3})\s+(?P<log_level>[A-Z]+)\s+"
+    r"\[(?P<source>[^\]]+)\]\s+(?P<message>.*)",
+    re.DOTALL,
+)
+
+TRAIN_ID_RE = re.compile(r"trainid_([A-Za-z0-9]+)")
+TEST_ID_RE = re.compile(r"workdir-inference-([^/]+)/")
+
+# Logstash multiline `max_lines`
+MAX_LINES = 5000
+
+
+def path_fields(path):
+    """
+    Fields derived from the file path, as in the Logstash ruby filter.
+    """
+    fields = {"file_name": os.path.basename(path), "log": {"file": {"path": path}}}
+    match = TRAIN_ID_RE.search(path)
+    if match:
+        fields["train_id"] = match.group(1)
+    match = TEST_ID_RE.search(path)
+    if match:
+        fields["test_id"] = match.group(1)
+    return fields
+
+
+def parse_timestamp(value):
+    """
+    `YYYY-MM-dd HH:mm:ss,SSS` (UTC) to an ISO-8601 `@timestamp`.
+
+    The grok pattern already guarantees the layout, so a string rewrite is enough;
+    strptime would dominate parse time.
+    """
+    if not ("01" <= value[5:7] <= "12" and "01" <= value[8:10] <= "31"):
+        raise ValueError(f"Invalid date: {value}")
+    return f"{value[:10]}T{value[11:19]}.{value[20:23]}Z"
+
+
+def ingest_time():
+    return datetime.now(timezone.utc).isoformat(timespec="milliseconds").replace("+00:00", "Z")
+
+
+def parse_event(raw, fields):
+    """
+    Builds the document for one (possibly multi-line) event.
+
+    Events that do not match the grok pattern keep their raw text as `message`, are
+    stamped with the ingest time and tagged `_grokparsefailure`, like Logstash does.
+    """
+    text = raw.decode("utf-8", errors="replace").rstrip("\r\n")
+    doc = dict(fields)
+    match = EVENT_RE.match(text)
+    if match:
+        doc.update(match.groupdict())
+        try:
+            doc["@timestamp"] = parse_timestamp(doc["log_timestamp"])
+        except ValueError:
+            doc["@timestamp"] = ingest_time()
+            doc["tags"] = ["_dateparsefailure"]
+    else:
+        doc["message"] = text
+        doc["@timestamp"] = ingest_time()
+        doc["tags"] = ["_grokparsefailure"]
+    return doc
+
+
+def iter_events(f, start=0, end=None, max_lines=MAX_LINES):
+    """
+    Streams the raw events of a binary file object whose first line starts at or after `start`
+    and before `end`.
+
+    An event that starts inside the range is read to completion even if it runs past `end`;
+    continuation lines at the top of a range (start > 0) belong to the previous range. Splitting
+    a file into adjacent ranges therefore yields every event exactly once.
+
+    Yields:
+        tuple: (byte offset of the event, raw event bytes)
+    """
+    if start > 0:
+        # Skip the partial line at `start`: the next readline() begins at a line boundary >= start.
+        f.seek(start - 1)
+        f.readline()
+    else:
+        f.seek(0)
+
+    offset = f.tell()
+    lines = []
+    event_offset = None
+    while True:
+        line = f.readline()
+        if not line:
+            break
+        if EVENT_START.match(line):
+            if event_offset is not None:
+                yield event_offset, b"".join(lines)
+            if end is not None and offset >= end:
+                return
+            event_offset, lines = offset, [line]
+        elif event_offset is not None:
+            if len(lines) < max_lines:
+                lines.append(line)
+        elif start == 0:
+            # Leading lines without a timestamp form their own event, as in Logstash.
+            event_offset, lines = offset, [line]
+        offset += len(line)
+    if event_offset is not None:
+        yield event_offset, b"".join(lines)
+
+
+def event_id(path, offset, raw):
+    """
+    Deterministic document ID: file path, byte offset and the event's first line.
+
+    The first line is written in one go, so the ID is stable while continuation lines are
+    still being appended, and re-ingesting a file overwrites instead of duplicating.
+    """
+    first_line = raw.split(b"\n", 1)[0]
+    return hashlib.sha1(path.encode() + b"\0" + str(offset).encode() + b"\0" + first_line).hexdigest()
+
+
+def parse_range(path, start=0, end=None):
+    """
+    Parses the events starting in [start, end) of one file.
+
+    Returns:
+        list: (offset, document id, document) tuples.
+    """
+    fields = path_fields(path)
+    with open(path, "rb") as f:
+        return [(offset, event_id(path, offset, raw), parse_event(raw, fields))
+                for offset, raw in iter_events(f, start, end)]
+
+
+def split_ranges(path, size, chunk_bytes, start=0):
+    """
+    Splits [start, size) of a file into adjacent byte ranges of about chunk_bytes.
+    """
+    if size <= start:
+        return []
+    return [(path, begin, min(begin + chunk_bytes, size)) for begin in range(start, size, chunk_bytes)]
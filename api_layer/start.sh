@@ -6,8 +6,14 @@ if [ -f ".env" ]; then
     export $(cat .env | sed 's/#.*//g' | xargs)
 fi
 
-exec python -m uvicorn app.main:app \
-    --host ${API_HOST:-0.0.0.0} \
-    --port ${API_PORT:-8000} \
-    --workers 1 \
-    --log-level info
+# API_MODE=development: single auto-reloading uvicorn process.
+# Otherwise: gunicorn with one uvicorn worker per core (see gunicorn.conf.py).
+if [ "${API_MODE:-production}" = "development" ]; then
+    exec python -m uvicorn app.main:app \
+        --host ${API_HOST:-0.0.0.0} \
+        --port ${API_PORT:-8000} \
+        --reload \
+        --log-level info
+fi
+
+exec gunicorn -c gunicorn.conf.py app.main:app